@@ -0,0 +1,4 @@
+# Ivonne Mendoza
+# ivonne@imendoza.io
+# Benchmarks del paquete traficFines, se ejecutan desde la raiz del repositorio:
+#   python -m benchmarks.bench_codecs
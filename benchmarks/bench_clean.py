@@ -0,0 +1,78 @@
+# Ivonne Mendoza
+# ivonne@imendoza.io
+# Compara la limpieza anterior (strftime y vuelta a parsear fechas, apply por columna)
+# con la limpieza vectorizada actual de MadridFines (que ademas aplica el esquema de tipos)
+# Uso: python -m benchmarks.bench_clean [filas]
+
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+
+import pandas as pd
+
+# Permite ejecutar el archivo directamente (python benchmarks/...) ademas de con python -m
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.portal import make_csv
+from traficFines.madridFines import MadridFines
+
+
+def legacy_clean(df:pd.DataFrame)->None:
+    """ Limpieza tal como estaba antes de la version vectorizada, se usa como referencia """
+    text_columns = ['CALIFICACION','DESCUENTO', 'HECHO_BOL', 'DENUNCIANTE', 'LUGAR']
+    numeric_s_columns = ['VEL_LIMITE', 'VEL_CIRCULA']
+    numeric_direct = ['COORDENADA_X', 'COORDENADA_Y']
+    df.rename(columns=lambda x: x.strip(), inplace=True)
+    df.columns = df.columns.str.replace('-', '_')
+    df[text_columns] = df[text_columns].apply(lambda x: pd.Series(x.str.strip()))
+    df[numeric_s_columns] = df[numeric_s_columns].apply(lambda x: pd.to_numeric(x.str.strip(), errors='coerce'))
+    df[numeric_direct] = df[numeric_direct].apply(pd.to_numeric, errors='coerce')
+    df['FECHA'] = pd.to_datetime({
+        'year': df['ANIO']
+        , 'month': df['MES']
+        , 'day': 1
+        , 'hour': df['HORA'].astype(int)
+        , 'minute': ((df['HORA'] - df['HORA'].astype(int)) * 100).astype(int)
+    })
+    df['FECHA'] = df['FECHA'].dt.strftime('%d/%m/%Y %H:%M:%S')
+    df.set_index('FECHA', inplace=True)
+    if not isinstance(df.index, pd.DatetimeIndex):
+        df.index = pd.to_datetime(df.index, format='%d/%m/%Y %H:%M:%S')
+
+
+def bench(rows:int, repeat:int=3)->dict:
+    """
+    Mide el mejor tiempo de cada limpieza sobre el mismo csv sintetico
+
+    Args:
+        rows (int): filas del csv sintetico
+        repeat (int): repeticiones, se queda con el mejor tiempo
+    Returns:
+        dict: tiempos en segundos de cada version
+    """
+    raw = pd.read_csv(BytesIO(make_csv(2024, 3, rows)), sep=';', encoding='latin-1', low_memory=False)
+    results = {}
+    outputs = {}
+    for name, clean in [('anterior', legacy_clean), ('vectorizada', MadridFines._MadridFines__clean)]:
+        best = float('inf')
+        for _ in range(repeat):
+            df = raw.copy()
+            start = time.perf_counter()
+            clean(df)
+            best = min(best, time.perf_counter() - start)
+        results[name] = best
+        outputs[name] = df
+    # La limpieza actual aplica ademas el esquema compacto (category, enteros pequenios),
+    # se comparan los valores sin tener en cuenta los tipos
+    pd.testing.assert_frame_equal(outputs['anterior'], outputs['vectorizada'], check_dtype=False,
+                                  check_categorical=False, check_index_type=False)
+    return results
+
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    results = bench(rows)
+    for name, seconds in results.items():
+        print(f'{name:<12} {seconds:>8.3f} s')
+    print(f'speedup      {results["anterior"] / results["vectorizada"]:>8.1f} x')
@@ -0,0 +1,54 @@
+# Ivonne Mendoza
+# ivonne@imendoza.io
+# Compara los codecs de la cache: tamanio en disco y tiempos de escritura y lectura
+# Uso: python -m benchmarks.bench_codecs [filas]
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Permite ejecutar el archivo directamente (python benchmarks/...) ademas de con python -m
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.portal import make_csv
+from traficFines.cache import Cache, CacheError
+
+
+def bench(rows:int)->list:
+    """
+    Escribe y lee un csv sintetico con cada codec
+
+    Args:
+        rows (int): filas del csv sintetico
+    Returns:
+        list: diccionarios con codec, bytes en disco, ratio y tiempos en segundos
+    """
+    data = make_csv(2024, 3, rows)
+    results = []
+    for codec in ['none', 'gzip', 'zstd']:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            try:
+                cache = Cache('bench', obsolescence=7, cache_dir=cache_dir, codec=codec)
+            except CacheError as e:
+                print(f'{codec}: omitido ({e})')
+                continue
+            start = time.perf_counter()
+            cache.set_bytes('month.csv', data)
+            write = time.perf_counter() - start
+
+            start = time.perf_counter()
+            assert cache.load_bytes('month.csv') == data
+            read = time.perf_counter() - start
+
+            disk = (Path(cache_dir) / 'month.csv').stat().st_size
+            results.append({'codec': codec, 'disk_bytes': disk, 'ratio': len(data) / disk,
+                            'write_s': write, 'read_s': read})
+    return results
+
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    print(f'{"codec":<6} {"disco (MB)":>11} {"ratio":>7} {"escritura (s)":>14} {"lectura (s)":>12}')
+    for r in bench(rows):
+        print(f'{r["codec"]:<6} {r["disk_bytes"] / 1e6:>11.2f} {r["ratio"]:>7.1f} {r["write_s"]:>14.3f} {r["read_s"]:>12.3f}')
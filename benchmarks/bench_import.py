@@ -0,0 +1,64 @@
+# Ivonne Mendoza
+# ivonne@imendoza.io
+# Mide el tiempo de importar el paquete en un interprete nuevo y que librerias pesadas se cargan
+# Uso: python -m benchmarks.bench_import [repeticiones]
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+# Sentencias que se miden, cada una en un proceso nuevo
+STATEMENTS = {
+    'import_cache': 'from traficFines import Cache',
+    'import_package': 'import traficFines',
+    'import_madrid_fines': 'from traficFines import MadridFines',
+}
+
+# Librerias que no deben cargarse al importar solo la cache
+HEAVY = ['pandas', 'numpy', 'requests', 'bs4', 'matplotlib']
+
+ROOT = Path(__file__).parent.parent
+
+
+def measure(statement:str, repeat:int=5)->dict:
+    """
+    Importa en un interprete nuevo y mide el tiempo dentro del proceso, sin contar el arranque de python
+
+    Args:
+        statement (str): sentencia de import
+        repeat (int): repeticiones, cada una en un proceso distinto
+    Returns:
+        dict: best y runs en segundos, y heavy con las librerias pesadas que quedaron cargadas
+    """
+    code = ('import json, sys, time\n'
+            'start = time.perf_counter()\n'
+            f'{statement}\n'
+            'seconds = time.perf_counter() - start\n'
+            f'print(json.dumps({{"seconds": seconds, "heavy": [m for m in {HEAVY!r} if m in sys.modules]}}))')
+    runs = []
+    heavy = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True, cwd=ROOT)
+        result = json.loads(output.stdout)
+        runs.append(result['seconds'])
+        heavy = result['heavy']
+    return {'best': min(runs), 'median': sorted(runs)[len(runs) // 2], 'runs': runs, 'heavy': heavy}
+
+
+def bench(repeat:int=5)->dict:
+    """
+    Mide cada sentencia de STATEMENTS
+
+    Args:
+        repeat (int): repeticiones de cada sentencia
+    Returns:
+        dict: nombre -> resultado de measure
+    """
+    return {name: measure(statement, repeat) for name, statement in STATEMENTS.items()}
+
+
+if __name__ == '__main__':
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    for name, result in bench(repeat).items():
+        print(f'{name:<20} {result["best"] * 1000:>8.1f} ms  {", ".join(result["heavy"]) or "-"}')
@@ -0,0 +1,159 @@
+# Ivonne Mendoza
+# ivonne@imendoza.io
+# Genera csv sinteticos con el formato y distribuciones parecidas a los del portal de multas de Madrid
+# Uso: python -m benchmarks.generator <filas> <archivo> [anio] [mes]
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+# Permite ejecutar el archivo directamente (python benchmarks/...) ademas de con python -m
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.portal import HEADER
+
+# Filas que se generan y escriben en cada bloque, limita la memoria con tamanios de 50M filas
+BLOCK_ROWS = 500_000
+
+# Calificacion, probabilidad, importes posibles y puntos
+CALIFICATIONS = [
+    ('LEVE', 0.55, [60.0, 90.0], [0]),
+    ('GRAVE', 0.40, [200.0], [0, 2, 3, 4]),
+    ('MUY GRAVE', 0.05, [500.0, 600.0], [4, 6]),
+]
+
+PLACES = ['CALLE ALCALÁ', 'GRAN VÍA', 'PASEO CASTELLANA', 'CALLE PRINCESA', 'AVDA. ILUSTRACIÓN',
+          'CALLE BRAVO MURILLO', 'PASEO RECOLETOS', 'M-30 CALZADA 1', 'CALLE ATOCHA', 'PLAZA ESPAÑA']
+
+COMPLAINANTS = [('POLICIA MUNICIPAL', 0.45), ('SER', 0.35), ('AGENTES DE MOVILIDAD', 0.15),
+                ('SACE', 0.05)]
+
+FACTS = ['ESTACIONAR EN LUGAR PROHIBIDO', 'REBASAR SEMÁFORO EN FASE ROJA', 'CIRCULAR A VELOCIDAD SUPERIOR',
+         'ESTACIONAR SIN TICKET', 'NO RESPETAR SEÑAL DE STOP', 'CARGA Y DESCARGA FUERA DE HORARIO']
+
+# Probabilidad de que una multa sea de radar (trae VEL_LIMITE y VEL_CIRCULA)
+RADAR_SHARE = 0.2
+
+# Probabilidad de que una multa no tenga coordenadas
+MISSING_COORDINATES = 0.3
+
+# Reparto de las multas por hora del dia, mas multas en horario laboral
+HOUR_WEIGHTS = np.array([1, 1, 1, 1, 1, 2, 4, 7, 9, 10, 10, 10, 10, 9, 8, 8, 8, 8, 8, 7, 5, 3, 2, 1], dtype=float)
+
+
+def pad(values:list, width:int)->np.ndarray:
+    """ Rellena con espacios por la derecha, como hace el portal """
+    return np.array([str(value).ljust(width) for value in values], dtype=object)
+
+
+def generate_block(year:int, month:int, rows:int, rng:np.random.Generator)->dict:
+    """
+    Genera un bloque de filas con las mismas columnas y formato de texto que el csv del portal.
+    Los textos se formatean una vez por valor distinto y cada fila solo elige un indice,
+    formatear fila a fila (o con to_csv) es mas de diez veces mas lento
+
+    Args:
+        year (int): anio de las multas
+        month (int): mes de las multas
+        rows (int): numero de filas
+        rng (np.random.Generator): generador de numeros aleatorios
+    Returns:
+        dict: columna -> array de textos, en el orden de HEADER
+    """
+    names, weights, amounts, points = zip(*CALIFICATIONS)
+    calification = rng.choice(len(names), size=rows, p=weights)
+    amount = np.empty(rows, dtype=object)
+    point = np.empty(rows, dtype=object)
+    amounts = [[f'{value:.1f}' for value in values] for values in amounts]
+    points = [[str(value) for value in values] for values in points]
+    for code in range(len(names)):
+        mask = calification == code
+        amount[mask] = rng.choice(amounts[code], size=mask.sum())
+        point[mask] = rng.choice(points[code], size=mask.sum())
+
+    # Lugar y numero de calle, hora y minuto: combinaciones formateadas de antemano
+    places = pad([f'{place} {number}' for place in PLACES for number in range(1, 200)], 50)
+    clock = np.array([f'{hour}.{minute:02d}' for hour in range(24) for minute in range(60)], dtype=object)
+    hour = rng.choice(24, size=rows, p=HOUR_WEIGHTS / HOUR_WEIGHTS.sum())
+    minute = rng.integers(0, 60, size=rows)
+    complainant = rng.choice(len(COMPLAINANTS), size=rows, p=[weight for _, weight in COMPLAINANTS])
+
+    # Velocidades con 3 caracteres, vacias si la multa no es de radar
+    speeds = np.array([f'{speed:>3}' for speed in range(200)] + ['   '], dtype=object)
+    radar = rng.random(rows) < RADAR_SHARE
+    limit = rng.choice([30, 50, 70, 90], size=rows)
+    speed = limit + rng.integers(5, 60, size=rows)
+    located = rng.random(rows) >= MISSING_COORDINATES
+    cents = np.array([f'.{cent:02d}' for cent in range(100)], dtype=object)
+
+    return {
+        'CALIFICACION': pad(names, 10)[calification],
+        'LUGAR': places[rng.integers(0, len(places), size=rows)],
+        'MES': np.full(rows, str(month), dtype=object),
+        'ANIO': np.full(rows, str(year), dtype=object),
+        'HORA': clock[hour * 60 + minute],
+        'IMP_BOL': amount,
+        'DESCUENTO': np.array(['NO ', 'SI '], dtype=object)[rng.integers(0, 2, size=rows)],
+        'PUNTOS': point,
+        'DENUNCIANTE': pad([name for name, _ in COMPLAINANTS], 50)[complainant],
+        'HECHO_BOL': pad(FACTS, 50)[rng.integers(0, len(FACTS), size=rows)],
+        'VEL_LIMITE': speeds[np.where(radar, limit, 200)],
+        'VEL_CIRCULA': speeds[np.where(radar, speed, 200)],
+        'COORDENADA_X': coordinates(430000, 450000, located, cents, rng),
+        'COORDENADA_Y': coordinates(4465000, 4485000, located, cents, rng),
+    }
+
+
+def coordinates(low:int, high:int, located:np.ndarray, cents:np.ndarray, rng:np.random.Generator)->np.ndarray:
+    """
+    Coordenadas UTM con dos decimales entre low y high, vacias donde located es False
+
+    Args:
+        low (int): valor minimo
+        high (int): valor maximo
+        located (np.ndarray): filas que tienen coordenadas
+        cents (np.ndarray): textos '.00' a '.99'
+        rng (np.random.Generator): generador de numeros aleatorios
+    Returns:
+        np.ndarray: textos de las coordenadas
+    """
+    units = np.array([str(value) for value in range(low, high)], dtype=object)
+    values = units[rng.integers(0, high - low, size=len(located))] + cents[rng.integers(0, 100, size=len(located))]
+    values[~located] = ''
+    return values
+
+
+def generate_csv(path, rows:int, year:int=2024, month:int=1, seed:int=0)->Path:
+    """
+    Escribe en disco un csv sintetico de multas (separador ';', latin-1, textos con espacios de relleno).
+    Se genera por bloques de BLOCK_ROWS filas, por lo que sirve para tamanios de 100k a 50M filas.
+    Con la misma semilla el archivo generado es identico
+
+    Args:
+        path (Path): archivo de salida
+        rows (int): numero de filas
+        year (int): anio de las multas
+        month (int): mes de las multas
+        seed (int): semilla del generador
+    Returns:
+        Path: ruta del archivo escrito
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng([seed, year, month])
+    with open(path, 'w', encoding='latin-1', newline='') as file:
+        file.write(HEADER + '\n')
+        for start in range(0, rows, BLOCK_ROWS):
+            block = generate_block(year, month, min(BLOCK_ROWS, rows - start), rng)
+            file.write('\n'.join(map(';'.join, zip(*block.values()))) + '\n')
+    return path
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print('Uso: python -m benchmarks.generator <filas> <archivo> [anio] [mes]')
+        sys.exit(1)
+    year = int(sys.argv[3]) if len(sys.argv) > 3 else 2024
+    month = int(sys.argv[4]) if len(sys.argv) > 4 else 1
+    print(generate_csv(sys.argv[2], int(sys.argv[1]), year, month))
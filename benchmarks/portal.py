@@ -0,0 +1,206 @@
+# Ivonne Mendoza
+# ivonne@imendoza.io
+# Servidor HTTP local que imita el portal de datos abiertos de Madrid, lo usan los tests y los benchmarks
+
+import hashlib
+import threading
+from email.utils import formatdate
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Mismo formato de fecha que usa la pagina real: "2024 Abril"
+MONTH_NAMES = {1: 'Enero', 2: 'Febrero', 3: 'Marzo', 4: 'Abril', 5: 'Mayo', 6: 'Junio', 7: 'Julio',
+               8: 'Agosto', 9: 'Septiembre', 10: 'Octubre', 11: 'Noviembre', 12: 'Diciembre'}
+
+INDEX_PATH = 'index.jsp'
+
+HEADER = ('CALIFICACION;LUGAR                                             ;MES;ANIO;HORA;IMP_BOL;DESCUENTO;PUNTOS;'
+          'DENUNCIANTE                                       ;HECHO-BOL                                         ;'
+          'VEL_LIMITE;VEL_CIRCULA;COORDENADA-X;COORDENADA-Y')
+
+
+def make_csv(year: int, month: int, rows: int = 50) -> bytes:
+    """
+    Genera un csv pequenio con el mismo formato que los ficheros del portal (separador ';', latin-1,
+    textos con espacios de relleno)
+
+    Args:
+        year (int): anio de las multas
+        month (int): mes de las multas
+        rows (int): numero de filas
+    Returns:
+        bytes: contenido del csv codificado en latin-1
+    """
+    califications = ['LEVE', 'GRAVE', 'MUY GRAVE']
+    places = ['CALLE ALCALÁ 20', 'GRAN VÍA 1', 'PASEO CASTELLANA 100']
+    complainants = ['POLICIA MUNICIPAL', 'SER', 'AGENTES DE MOVILIDAD']
+    lines = [HEADER]
+    for i in range(rows):
+        speed_limit = f'{50:>3}' if i % 4 == 0 else '   '
+        speed = f'{60 + i % 30:>3}' if i % 4 == 0 else '   '
+        lines.append(';'.join([
+            f'{califications[i % 3]:<10}',
+            f'{places[i % 3]:<50}',
+            str(month),
+            str(year),
+            f'{i % 24}.{(i * 7) % 60:02d}',
+            f'{(90, 200, 500)[i % 3]}.0',
+            'SI ' if i % 2 else 'NO ',
+            str(i % 3 * 2),
+            f'{complainants[i % 3]:<50}',
+            f'{"ESTACIONAR EN LUGAR PROHIBIDO":<50}',
+            speed_limit,
+            speed,
+            f'{440000 + i}.5' if i % 5 else '',
+            f'{4470000 + i}.25' if i % 5 else '',
+        ]))
+    return ('\n'.join(lines) + '\n').encode('latin-1')
+
+
+class PortalServer:
+    """
+    Servidor HTTP en un hilo que sirve una pagina indice y ficheros csv registrados en memoria.
+
+    Attributes:
+        files (dict): ruta -> contenido en bytes, o Path de un archivo en disco que se envia por bloques
+        hits (dict): ruta -> numero de peticiones recibidas
+        not_modified (dict): ruta -> numero de respuestas 304 enviadas
+        validators (bool): si es True envia ETag y Last-Modified y responde 304 a peticiones condicionales
+        ranges (bool): si es True responde 206 a las peticiones Range (con If-Range igual al ETag actual)
+        range_requests (dict): ruta -> lista de cabeceras Range recibidas
+        failures (dict): ruta -> lista de fallos para las siguientes peticiones, se consume uno por peticion.
+            Un entero n corta la conexion tras enviar n bytes del cuerpo, una tupla ('status', codigo)
+            responde con ese codigo
+    """
+    def __init__(self):
+        self.files = {}
+        self.hits = {}
+        self.not_modified = {}
+        self.validators = True
+        self.ranges = True
+        self.range_requests = {}
+        self.failures = {}
+        self.__months = {}
+        self.__lock = threading.Lock()
+        portal = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                portal.handle(self)
+
+        self.__server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.__server.daemon_threads = True
+        self.__thread = threading.Thread(target=self.__server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.__server.server_address[:2]
+        return f'http://{host}:{port}/'
+
+    def url(self, path: str) -> str:
+        return f'{self.base_url}{path.lstrip("/")}'
+
+    def start(self) -> 'PortalServer':
+        self.__thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def add_file(self, path: str, content) -> str:
+        """ Registra un fichero (bytes o Path de un archivo en disco) y devuelve su url completa """
+        self.files[path.lstrip('/')] = content
+        return self.url(path)
+
+    def add_month(self, year: int, month: int, rows: int = 50, content=None) -> str:
+        """ Registra un csv para el mes (por defecto uno sintetico de make_csv) y lo publica en el indice """
+        path = f'csv/{year}_{month:02d}_detalle.csv'
+        self.__months[(year, month)] = path
+        return self.add_file(path, make_csv(year, month, rows) if content is None else content)
+
+    def index_html(self) -> str:
+        """ Construye la pagina indice con la misma estructura de etiquetas que el portal real """
+        items = []
+        for (year, month), path in sorted(self.__months.items(), reverse=True):
+            items.append(
+                f'<li><p class="info-title">{year} {MONTH_NAMES[month]}. Multas de circulación</p>'
+                f'<a class="asociada-link" href="{path}">CSV</a></li>')
+        return f'<html><body><ul><li>Otro enlace</li>{"".join(items)}</ul></body></html>'
+
+    def count(self, path: str) -> int:
+        return self.hits.get(path.lstrip('/'), 0)
+
+    def handle(self, request: BaseHTTPRequestHandler) -> None:
+        path = request.path.lstrip('/')
+        with self.__lock:
+            self.hits[path] = self.hits.get(path, 0) + 1
+        if path == INDEX_PATH:
+            body = self.index_html().encode('utf-8')
+            content_type = 'text/html; charset=utf-8'
+        elif path in self.files:
+            body = self.files[path]
+            content_type = 'text/csv'
+        else:
+            request.send_error(404)
+            return
+        if isinstance(body, Path):
+            stat = body.stat()
+            etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+        else:
+            etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        if self.validators and path != INDEX_PATH and request.headers.get('If-None-Match') == etag:
+            with self.__lock:
+                self.not_modified[path] = self.not_modified.get(path, 0) + 1
+            request.send_response(304)
+            request.send_header('ETag', etag)
+            request.end_headers()
+            return
+        with self.__lock:
+            failure = self.failures[path].pop(0) if self.failures.get(path) else None
+        if isinstance(failure, tuple):
+            request.send_error(failure[1])
+            return
+
+        size = stat.st_size if isinstance(body, Path) else len(body)
+        start = 0
+        status = 200
+        requested = request.headers.get('Range')
+        if requested and self.ranges:
+            with self.__lock:
+                self.range_requests.setdefault(path, []).append(requested)
+            if request.headers.get('If-Range') in (None, etag):
+                start = int(requested.split('=')[1].split('-')[0])
+                status = 206
+        request.send_response(status)
+        if self.validators:
+            request.send_header('ETag', etag)
+            request.send_header('Last-Modified', formatdate(0, usegmt=True))
+        request.send_header('Content-Type', content_type)
+        if self.ranges:
+            request.send_header('Accept-Ranges', 'bytes')
+        if status == 206:
+            request.send_header('Content-Range', f'bytes {start}-{size - 1}/{size}')
+        request.send_header('Content-Length', str(size - start))
+        request.end_headers()
+        # Con un fallo de tipo entero solo se envian esos bytes y se cierra la conexion
+        end = size if failure is None else min(size, start + failure)
+        if isinstance(body, Path):
+            with open(body, 'rb') as file:
+                file.seek(start)
+                remaining = end - start
+                while remaining > 0:
+                    block = file.read(min(remaining, 1 << 20))
+                    if not block:
+                        break
+                    request.wfile.write(block)
+                    remaining -= len(block)
+        else:
+            request.wfile.write(body[start:end])
+        if failure is not None:
+            request.close_connection = True
@@ -0,0 +1,323 @@
+# Ivonne Mendoza
+# ivonne@imendoza.io
+# Escenarios de rendimiento de MadridFines y Cache sobre csv sinteticos servidos por un portal local.
+# Los resultados se guardan en json para comparar versiones
+# Uso: python -m benchmarks.suite [--rows 100000] [--months 3] [--repeat 3] [--output archivo.json]
+#                                 [--compare anterior.json] [--data-dir directorio]
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Permite ejecutar el archivo directamente (python benchmarks/...) ademas de con python -m
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks import bench_import
+from benchmarks.generator import generate_csv
+from benchmarks.portal import PortalServer, INDEX_PATH
+from traficFines import madridFines
+from traficFines.cache import Cache
+from traficFines.madridFines import MadridFines
+
+# Directorio donde se guardan los resultados por defecto
+RESULTS_DIR = Path(__file__).parent / 'results'
+
+# Un escenario es una regresion si su mejor tiempo supera al anterior en mas de esta fraccion
+TOLERANCE = 0.2
+
+# Archivos y tamanio de cada uno en los escenarios de Cache
+CACHE_ENTRIES = 200
+CACHE_ENTRY_BYTES = 64 * 1024
+
+YEAR = 2024
+
+
+def measure(run, repeat:int, setup=None)->dict:
+    """
+    Ejecuta un escenario varias veces y mide cada ejecucion. El tiempo de setup no se cuenta
+
+    Args:
+        run (callable): escenario, recibe lo que devuelve setup (o nada si no hay setup)
+        repeat (int): numero de ejecuciones
+        setup (callable): preparacion de cada ejecucion, opcional
+    Returns:
+        dict: best, median y runs en segundos
+    """
+    runs = []
+    for _ in range(repeat):
+        args = (setup(),) if setup is not None else ()
+        start = time.perf_counter()
+        run(*args)
+        runs.append(time.perf_counter() - start)
+    return {'best': min(runs), 'median': statistics.median(runs), 'runs': runs}
+
+
+def prepare_data(data_dir:Path, rows:int, months:int, seed:int=0)->list:
+    """
+    Genera los csv de cada mes, o reutiliza los que ya estan en data_dir con el mismo tamanio y semilla
+
+    Args:
+        data_dir (Path): directorio de los csv
+        rows (int): filas de cada mes
+        months (int): numero de meses, desde enero
+        seed (int): semilla del generador
+    Returns:
+        list: tuplas (mes, ruta del csv)
+    """
+    files = []
+    for month in range(1, months + 1):
+        path = Path(data_dir) / f'fines_{YEAR}_{month:02d}_{rows}_s{seed}.csv'
+        if not path.exists():
+            generate_csv(path, rows, YEAR, month, seed)
+        files.append((month, path))
+    return files
+
+
+def bench_ingest(months:int, repeat:int, work_dir:Path)->dict:
+    """
+    Escenarios de add_range: en frio (descarga y parseo, en hilos y en procesos), en caliente solo con
+    la cache de csv y en caliente con la cache columnar
+
+    Args:
+        months (int): numero de meses, ya publicados en el portal
+        repeat (int): ejecuciones de cada escenario
+        work_dir (Path): directorio para las caches
+    Returns:
+        dict: escenario -> tiempos, con las etapas de la ultima ejecucion en 'stages'
+    """
+    results = {}
+    counter = iter(range(10 ** 6))
+    span = ((YEAR, 1), (YEAR, months))
+
+    def fresh():
+        return MadridFines('bench', obsolescence=7, cache_dir=str(work_dir / f'cold_{next(counter)}'))
+
+    reports = []
+    results['add_cold'] = measure(lambda fines: reports.append(fines.add_range(*span)), repeat, fresh)
+    results['add_cold']['stages'] = reports[-1].totals()
+
+    # Mismo escenario parseando cada mes en un proceso, hasta un proceso por nucleo
+    processes = min(months, os.cpu_count() or 1)
+    reports = []
+    results['add_cold_processes'] = measure(
+        lambda fines: reports.append(fines.add_range(*span, processes=processes)), repeat, fresh)
+    results['add_cold_processes']['stages'] = reports[-1].totals()
+    results['add_cold_processes']['processes'] = processes
+
+    warm_dir = str(work_dir / 'warm')
+    MadridFines('bench', obsolescence=7, cache_dir=warm_dir).add_range(*span)
+    for name, frame_cache in [('add_warm_csv', False), ('add_warm_frames', True)]:
+        reports = []
+        results[name] = measure(
+            lambda fines: reports.append(fines.add_range(*span)), repeat,
+            lambda: MadridFines('bench', obsolescence=7, cache_dir=warm_dir, frame_cache=frame_cache))
+        results[name]['stages'] = reports[-1].totals()
+    return results
+
+
+def bench_analysis(months:int, repeat:int, work_dir:Path, raw_csv:Path)->dict:
+    """
+    Escenarios de limpieza, de cada metodo de agregacion y de query sobre los meses ya cargados
+
+    Args:
+        months (int): numero de meses, ya publicados en el portal
+        repeat (int): ejecuciones de cada escenario
+        work_dir (Path): directorio para la cache
+        raw_csv (Path): csv de un mes para medir la limpieza
+    Returns:
+        dict: escenario -> tiempos
+    """
+    results = {}
+    raw = pd.read_csv(raw_csv, sep=';', encoding='latin-1')
+    results['clean'] = measure(MadridFines._MadridFines__clean, repeat, raw.copy)
+
+    fines = MadridFines('bench', obsolescence=7, cache_dir=str(work_dir / 'warm'))
+    fines.add_range((YEAR, 1), (YEAR, months))
+    results['fines_calification'] = measure(fines.fines_calification, repeat)
+    results['total_payment'] = measure(fines.total_payment, repeat)
+    figure = str(work_dir / 'fines_hour.png')
+    results['fines_hour'] = measure(lambda: fines.fines_hour(figure), repeat)
+
+    def invalidate():
+        # Al quitar y volver a agregar un mes se descarta la union de las particiones
+        fines.remove(YEAR, 1)
+        fines.add(YEAR, 1)
+        return fines
+
+    results['data_concat'] = measure(lambda fines: fines.data, repeat, invalidate)
+    results['query'] = measure(
+        lambda: fines.query(years=YEAR, where=[('CALIFICACION', '==', 'GRAVE')], columns=['IMP_BOL']), repeat)
+    return results
+
+
+def bench_parse(repeat:int, work_dir:Path, raw_csv:Path)->dict:
+    """
+    Escenarios de parseo y limpieza de un mes con cada motor de ENGINES (parse_c, parse_pyarrow)
+
+    Args:
+        repeat (int): ejecuciones de cada escenario
+        work_dir (Path): directorio para la cache
+        raw_csv (Path): csv de un mes
+    Returns:
+        dict: escenario -> tiempos, los motores que no estan instalados no se miden
+    """
+    results = {}
+    for engine in madridFines.ENGINES:
+        if MadridFines('bench', obsolescence=7, cache_dir=str(work_dir / 'parse'), engine=engine,
+                       frame_cache=False).engine != engine:
+            continue
+        results[f'parse_{engine}'] = measure(
+            lambda: MadridFines._MadridFines__read_csv(lambda: open(raw_csv, 'rb'), YEAR, 1, engine=engine), repeat)
+    return results
+
+
+def bench_cache(repeat:int, work_dir:Path)->dict:
+    """
+    Escenarios de las operaciones basicas de Cache con CACHE_ENTRIES archivos de CACHE_ENTRY_BYTES
+
+    Args:
+        repeat (int): ejecuciones de cada escenario
+        work_dir (Path): directorio para la cache
+    Returns:
+        dict: escenario -> tiempos
+    """
+    data = np.random.default_rng(0).bytes(CACHE_ENTRY_BYTES)
+    names = [f'entry_{i}.bin' for i in range(CACHE_ENTRIES)]
+    cache = Cache('bench', obsolescence=7, cache_dir=str(work_dir / 'cache_ops'))
+
+    def set_all():
+        for name in names:
+            cache.set_bytes(name, data)
+
+    results = {'cache_set': measure(set_all, repeat)}
+    results['cache_load'] = measure(lambda: [cache.load_bytes(name) for name in names], repeat)
+    results['cache_exists'] = measure(lambda: [cache.exists(name) for name in names], repeat)
+    results['cache_how_old'] = measure(lambda: [cache.how_old(name) for name in names], repeat)
+    results['cache_stats'] = measure(cache.stats, repeat)
+    results['cache_prune'] = measure(cache.prune, repeat)
+    return results
+
+
+def git_revision()->str:
+    """ Commit actual del repositorio, None si no se puede obtener """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(rows:int=100_000, months:int=3, repeat:int=3, data_dir=None, seed:int=0)->dict:
+    """
+    Ejecuta todos los escenarios contra un portal local
+
+    Args:
+        rows (int): filas de cada mes
+        months (int): numero de meses
+        repeat (int): ejecuciones de cada escenario
+        data_dir (Path): directorio donde se generan (y reutilizan) los csv, por defecto uno temporal
+        seed (int): semilla del generador
+    Returns:
+        dict: 'meta' con la version y el entorno, 'scenarios' con los tiempos de cada escenario
+    """
+    with tempfile.TemporaryDirectory() as temp:
+        work_dir = Path(temp)
+        files = prepare_data(data_dir or work_dir / 'data', rows, months, seed)
+        portal = PortalServer().start()
+        original = madridFines.RAIZ, madridFines.MADRID_FINES_URL
+        madridFines.RAIZ, madridFines.MADRID_FINES_URL = portal.base_url, INDEX_PATH
+        try:
+            for month, path in files:
+                portal.add_month(YEAR, month, content=path)
+            scenarios = bench_ingest(months, repeat, work_dir)
+            scenarios.update(bench_analysis(months, repeat, work_dir, files[0][1]))
+            scenarios.update(bench_parse(repeat, work_dir, files[0][1]))
+            scenarios.update(bench_cache(repeat, work_dir))
+            scenarios.update(bench_import.bench(repeat))
+        finally:
+            madridFines.RAIZ, madridFines.MADRID_FINES_URL = original
+            portal.stop()
+
+    meta = {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'rows': rows,
+        'months': months,
+        'repeat': repeat,
+        'seed': seed,
+    }
+    return {'meta': meta, 'scenarios': scenarios}
+
+
+def compare(current:dict, previous:dict, tolerance:float=TOLERANCE)->list:
+    """
+    Compara el mejor tiempo de cada escenario con una ejecucion anterior
+
+    Args:
+        current (dict): resultados actuales, como los devuelve run
+        previous (dict): resultados anteriores
+        tolerance (float): fraccion de tiempo extra a partir de la que se considera regresion
+    Returns:
+        list: diccionarios con scenario, before, after, ratio y regression
+    """
+    rows = []
+    for name, result in current['scenarios'].items():
+        if name not in previous['scenarios']:
+            continue
+        before = previous['scenarios'][name]['best']
+        after = result['best']
+        ratio = after / before if before else float('inf')
+        rows.append({'scenario': name, 'before': before, 'after': after, 'ratio': ratio,
+                     'regression': ratio > 1 + tolerance})
+    return rows
+
+
+def main(argv=None)->int:
+    parser = argparse.ArgumentParser(description='Benchmarks de traficFines')
+    parser.add_argument('--rows', type=int, default=100_000, help='filas de cada mes')
+    parser.add_argument('--months', type=int, default=3, help='numero de meses')
+    parser.add_argument('--repeat', type=int, default=3, help='ejecuciones de cada escenario')
+    parser.add_argument('--seed', type=int, default=0, help='semilla del generador')
+    parser.add_argument('--data-dir', type=Path, help='directorio donde reutilizar los csv generados')
+    parser.add_argument('--output', type=Path, help='archivo json de resultados')
+    parser.add_argument('--compare', type=Path, help='resultados anteriores para detectar regresiones')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help='margen antes de marcar regresion')
+    args = parser.parse_args(argv)
+
+    results = run(args.rows, args.months, args.repeat, args.data_dir, args.seed)
+    output = args.output or RESULTS_DIR / f'{datetime.datetime.now():%Y%m%d_%H%M%S}_{results["meta"]["revision"]}.json'
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+
+    print(f'{"escenario":<20} {"mejor (s)":>10} {"mediana (s)":>12}')
+    for name, result in results['scenarios'].items():
+        print(f'{name:<20} {result["best"]:>10.4f} {result["median"]:>12.4f}')
+    print(f'Resultados guardados en {output}')
+
+    if args.compare is None:
+        return 0
+    rows = compare(results, json.loads(args.compare.read_text()), args.tolerance)
+    print(f'\n{"escenario":<20} {"antes (s)":>10} {"ahora (s)":>10} {"ratio":>7}')
+    for row in rows:
+        flag = '  REGRESION' if row['regression'] else ''
+        print(f'{row["scenario"]:<20} {row["before"]:>10.4f} {row["after"]:>10.4f} {row["ratio"]:>7.2f}{flag}')
+    return 1 if any(row['regression'] for row in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,6 +2,7 @@
 # ivonne@imendoza.io
 # Fixtures compartidas para test
 
+import multiprocessing
 import pytest
 import tempfile
 import shutil
@@ -12,6 +13,11 @@ from traficFines import CacheURL, MadridFines
 # agrega el directorio padre para traer el paquete
 sys.path.insert(0,str(Path(__file__).parent.parent))
 from traficFines.cache import Cache
+from traficFines import madridFines
+from tests.portal import PortalServer, INDEX_PATH
+
+# Contexto para los tests con varios procesos: fork arranca mucho mas rapido que spawn donde existe
+MP_CONTEXT = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn')
 
 # Nota para los profesores: Esta parte (temp_cache_dir y cache_instance) de la creacion de directorio lo hice con ayuda de cursor.
 @pytest.fixture
@@ -39,9 +45,18 @@ def cacheurl_instance(temp_cache_dir):
 @pytest.fixture
 def madrid_instance(temp_cache_dir):
     """ Crea una instancia de madridFines lista para usar """
-    cache_url = CacheURL("TestMadrid", obsolescence=7,cache_dir = temp_cache_dir)
-    madrid = MadridFines('TestMadrid', obsolescence=7)
-    madrid._MadridFines__cacheurl = cache_url
-    return madrid
+    return MadridFines('TestMadrid', obsolescence=7, cache_dir=temp_cache_dir)
+
+@pytest.fixture
+def portal(monkeypatch):
+    """
+    Levanta un servidor local que imita el portal de datos de Madrid
+    y redirige las constantes RAIZ y MADRID_FINES_URL hacia el
+    """
+    server = PortalServer().start()
+    monkeypatch.setattr(madridFines, 'RAIZ', server.base_url)
+    monkeypatch.setattr(madridFines, 'MADRID_FINES_URL', INDEX_PATH)
+    yield server
+    server.stop()
 
 
@@ -0,0 +1,5 @@
+# Ivonne Mendoza
+# ivonne@imendoza.io
+# El portal local vive en benchmarks/portal.py para que los benchmarks no dependan de tests
+
+from benchmarks.portal import MONTH_NAMES, INDEX_PATH, HEADER, PortalServer, make_csv
@@ -0,0 +1,31 @@
+from tests.conftest import temp_cache_dir
+from benchmarks.generator import generate_csv
+from benchmarks import suite
+from traficFines.madridFines import MadridFines
+from pathlib import Path
+import pandas as pd
+
+def test_generator_is_deterministic_and_parses(temp_cache_dir):
+    """ Test 1: Verifica que el generador escribe un csv con el formato del portal y la misma semilla da el mismo archivo """
+    first = generate_csv(Path(temp_cache_dir) / 'a.csv', 1000, 2024, 3, seed=7)
+    second = generate_csv(Path(temp_cache_dir) / 'b.csv', 1000, 2024, 3, seed=7)
+    assert first.read_bytes() == second.read_bytes()
+
+    df = pd.read_csv(first, sep=';', encoding='latin-1')
+    MadridFines._MadridFines__clean(df)
+    assert len(df) == 1000
+    assert set(df['CALIFICACION'].cat.categories) == {'LEVE', 'GRAVE', 'MUY GRAVE'}
+    assert (df.index.month == 3).all()
+    assert df['VEL_LIMITE'].isna().any() and df['VEL_LIMITE'].notna().any()
+
+def test_suite_runs_and_compares():
+    """ Test 2: Verifica que la suite ejecuta todos los escenarios contra el portal local y detecta regresiones """
+    results = suite.run(rows=500, months=2, repeat=1)
+    assert results['meta']['rows'] == 500
+    assert {'add_cold', 'add_warm_csv', 'clean', 'total_payment', 'cache_set'} <= set(results['scenarios'])
+    assert results['scenarios']['add_cold']['stages']['rows'] == 1000
+
+    slower = {'scenarios': {name: {**result, 'best': result['best'] * 2}
+                            for name, result in results['scenarios'].items()}}
+    assert all(row['regression'] for row in suite.compare(slower, results))
+    assert not any(row['regression'] for row in suite.compare(results, slower))
@@ -1,6 +1,13 @@
-from tests.conftest import temp_cache_dir
+from tests.conftest import temp_cache_dir, MP_CONTEXT
 from traficFines.cache import Cache, CacheError, CACHE_DIR
+from traficFines import cache as cache_module
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+import hashlib
+import os
+import subprocess
+import sys
+import time
 import pytest
 
 # Comando para ejecutar pytest tests/test_cache.py -v
@@ -98,7 +105,268 @@ def test_delete_file(cache_instance):
     cache_instance.delete('test.txt')
     assert not cache_instance.exists('test.txt')
 
+def test_obsolete_file_is_a_miss(cache_instance, temp_cache_dir):
+    """ Test 12: Verifica que un archivo mas antiguo que obsolescence se trata como inexistente """
+    cache_instance.set('old.txt', 'Old content')
+    eight_days_ago = time.time() - 8 * 86400
+    os.utime(Path(temp_cache_dir) / 'old.txt', (eight_days_ago, eight_days_ago))
 
+    assert not cache_instance.exists('old.txt')
+    with pytest.raises(CacheError):
+        cache_instance.load('old.txt')
+
+def test_max_bytes_evicts_least_recently_used(temp_cache_dir):
+    """ Test 13: Verifica que al superar max_bytes se elimina el archivo usado hace mas tiempo """
+    cache = Cache("TestApp", obsolescence=7, cache_dir=temp_cache_dir, max_bytes=25)
+    cache.set('a.txt', 'a' * 10)
+    cache.set('b.txt', 'b' * 10)
+    cache.load('a.txt')
+    cache.set('c.txt', 'c' * 10)
+
+    assert cache.exists('a.txt')
+    assert not cache.exists('b.txt')
+    assert cache.exists('c.txt')
+    assert cache.size() == 20
+
+def test_prune_removes_obsolete_files(cache_instance, temp_cache_dir):
+    """ Test 14: Verifica que prune() elimina los archivos obsoletos, tambien en segundo plano """
+    cache_instance.set('old.txt', 'Old content')
+    cache_instance.set('new.txt', 'New content')
+    eight_days_ago = time.time() - 8 * 86400
+    os.utime(Path(temp_cache_dir) / 'old.txt', (eight_days_ago, eight_days_ago))
+
+    cache_instance.prune(background=True).join()
+
+    assert not (Path(temp_cache_dir) / 'old.txt').exists()
+    assert cache_instance.exists('new.txt')
+    assert cache_instance.prune() == 0
+
+@pytest.mark.parametrize('codec', ['gzip', 'zstd'])
+def test_codec_stores_compressed(temp_cache_dir, codec):
+    """ Test 15: Verifica que con un codec los datos se guardan comprimidos y se recuperan iguales """
+    if codec == 'zstd':
+        pytest.importorskip('zstandard')
+    cache = Cache("TestApp", obsolescence=7, cache_dir=temp_cache_dir, codec=codec)
+    content = 'CALIFICACION;LUGAR\nLEVE;GRAN VIA 1\n' * 1000
+    cache.set('fines.csv', content)
+    cache.set_bytes('raw.bin', content.encode('latin-1'))
+
+    assert (Path(temp_cache_dir) / 'fines.csv').stat().st_size < len(content) / 5
+    assert cache.load('fines.csv') == content
+    assert cache.load_bytes('raw.bin') == content.encode('latin-1')
+
+def test_unknown_codec_raises_error(temp_cache_dir):
+    """ Test 16: Verifica que se lanza una excepcion con un codec desconocido """
+    with pytest.raises(CacheError):
+        Cache("TestApp", obsolescence=7, cache_dir=temp_cache_dir, codec='rar')
+
+@pytest.mark.parametrize('codec', ['none', 'gzip'])
+def test_open_and_view(temp_cache_dir, codec):
+    """ Test 17: Verifica que open() y view() devuelven el contenido en binario sin decodificar """
+    cache = Cache("TestApp", obsolescence=7, cache_dir=temp_cache_dir, codec=codec)
+    content = 'GRAN VÍA;1\n'.encode('latin-1') * 100
+    cache.set_bytes('fines.csv', content)
+
+    with cache.open('fines.csv') as file:
+        assert file.read() == content
+    view = cache.view('fines.csv')
+    assert isinstance(view, memoryview)
+    assert view.tobytes() == content
+    assert bytes(view[:4]) == b'GRAN'
+
+def test_open_non_existing_file(cache_instance):
+    """ Test 18: Verifica que open() y view() lanzan una excepcion si el archivo no existe """
+    with pytest.raises(CacheError):
+        cache_instance.open('inexistent_file.txt')
+    with pytest.raises(CacheError):
+        cache_instance.view('inexistent_file.txt')
+
+def test_memory_cache_hits_without_disk(temp_cache_dir, monkeypatch):
+    """ Test 19: Verifica que las lecturas repetidas se sirven desde memoria sin acceder al disco """
+    cache = Cache("TestApp", obsolescence=7, cache_dir=temp_cache_dir, memory_bytes=1024)
+    cache.set('hot.txt', 'Hot content')
+    assert cache.load('hot.txt') == 'Hot content'
+
+    def fail(*args, **kwargs):
+        raise AssertionError('No se deberia acceder al disco')
+    with monkeypatch.context() as patch:
+        patch.setattr(cache_module, 'open', fail, raising=False)
+        patch.setattr(cache_module.os.path, 'getmtime', fail)
+        patch.setattr(cache_module.Path, 'exists', fail)
+        patch.setattr(cache_module.Path, 'stat', fail)
+        for _ in range(3):
+            assert cache.exists('hot.txt')
+            assert cache.load('hot.txt') == 'Hot content'
+
+    assert cache.memory_stats['hits'] == 3
+    assert cache.memory_stats['misses'] == 1
+
+def test_memory_cache_consistent_on_set_and_delete(temp_cache_dir):
+    """ Test 20: Verifica que set() y delete() actualizan la cache en memoria """
+    cache = Cache("TestApp", obsolescence=7, cache_dir=temp_cache_dir, memory_bytes=1024)
+    cache.set('hot.txt', 'Old content')
+    cache.load('hot.txt')
+    cache.set('hot.txt', 'New content')
+    assert cache.load('hot.txt') == 'New content'
+
+    cache.delete('hot.txt')
+    assert not cache.exists('hot.txt')
+    assert cache.memory_stats['entries'] == 0
+
+def test_memory_cache_ttl_and_budget(temp_cache_dir):
+    """ Test 21: Verifica que la cache en memoria respeta el ttl y el limite de bytes """
+    cache = Cache("TestApp", obsolescence=7, cache_dir=temp_cache_dir, memory_bytes=15, memory_ttl=0)
+    cache.set('a.txt', 'a' * 10)
+    cache.set('b.txt', 'b' * 10)
+    cache.load('a.txt')
+    cache.load('a.txt')
+    assert cache.memory_stats['hits'] == 0
+
+    cache = Cache("TestApp", obsolescence=7, cache_dir=temp_cache_dir, memory_bytes=15)
+    cache.load('a.txt')
+    cache.load('b.txt')
+    assert cache.memory_stats['entries'] == 1
+    assert cache.memory_stats['bytes'] == 10
+
+
+def write_many(cache_dir:str, letter:str, times:int)->None:
+    """ Proceso que reescribe la misma entrada varias veces """
+    cache = Cache("TestApp", obsolescence=7, cache_dir=cache_dir)
+    for _ in range(times):
+        cache.set('shared.txt', letter * 200_000)
+
+def increment_many(cache_dir:str, times:int)->None:
+    """ Proceso que incrementa un contador guardado en cache con el bloqueo de la entrada """
+    cache = Cache("TestApp", obsolescence=7, cache_dir=cache_dir)
+    for _ in range(times):
+        with cache.lock('counter.txt'):
+            value = int(cache.load('counter.txt')) if cache.exists('counter.txt') else 0
+            cache.set('counter.txt', str(value + 1))
+
+def test_concurrent_writers_never_expose_partial_files(temp_cache_dir):
+    """ Test 22: Verifica que con varios procesos escribiendo la misma entrada un lector nunca ve un archivo incompleto """
+    cache = Cache("TestApp", obsolescence=7, cache_dir=temp_cache_dir)
+    cache.set('shared.txt', 'x' * 200_000)
+    with ProcessPoolExecutor(4, mp_context=MP_CONTEXT) as pool:
+        futures = [pool.submit(write_many, temp_cache_dir, letter, 30) for letter in 'abcd']
+        while not all(future.done() for future in futures):
+            content = cache.load('shared.txt')
+            assert len(content) == 200_000 and len(set(content)) == 1
+        for future in futures:
+            future.result()
+
+    assert sorted(path.name for path in Path(temp_cache_dir).iterdir() if not path.name.startswith('.')) == ['shared.txt']
+
+def test_lock_is_shared_between_processes(temp_cache_dir):
+    """ Test 23: Verifica que lock() da acceso exclusivo a una entrada entre procesos """
+    cache = Cache("TestApp", obsolescence=7, cache_dir=temp_cache_dir)
+    with ProcessPoolExecutor(6, mp_context=MP_CONTEXT) as pool:
+        for future in [pool.submit(increment_many, temp_cache_dir, 25) for _ in range(6)]:
+            future.result()
+
+    assert cache.load('counter.txt') == '150'
+    assert not (Path(temp_cache_dir) / '.counter.txt.lock').exists()
+
+def test_stats_and_entries_from_manifest(temp_cache_dir):
+    """ Test 24: Verifica que stats() y entries() se leen del manifest """
+    cache = Cache("TestApp", obsolescence=7, cache_dir=temp_cache_dir)
+    cache.set('a.txt', 'a' * 10)
+    cache.set_bytes('b.txt', b'b' * 20)
+    cache.exists('a.txt')
+    cache.exists('missing.txt')
+
+    stats = cache.stats()
+    assert (stats['entries'], stats['bytes'], stats['hits'], stats['misses']) == (2, 30, 1, 1)
+    assert stats['hit_rate'] == 0.5
+    assert [entry['key'] for entry in cache.entries()] == ['a.txt', 'b.txt']
+    assert cache.entry('b.txt')['checksum'] == hashlib.sha256(b'b' * 20).hexdigest()
+
+    cache.load('a.txt')
+    assert [entry['key'] for entry in cache.entries()] == ['b.txt', 'a.txt']
+    cache.delete('b.txt')
+    assert cache.stats()['entries'] == 1 and cache.size() == 10
+    assert cache.entry('b.txt') is None
+
+def test_manifest_shared_and_rebuilt(temp_cache_dir):
+    """ Test 25: Verifica que el manifest se comparte entre instancias y se reconstruye en un directorio existente """
+    Path(temp_cache_dir).mkdir(parents=True, exist_ok=True)
+    (Path(temp_cache_dir) / 'old.txt').write_text('legacy data')
+
+    cache = Cache("TestApp", obsolescence=7, cache_dir=temp_cache_dir)
+    assert cache.size() == 11
+    Cache("TestApp", obsolescence=7, cache_dir=temp_cache_dir).set('new.txt', 'x' * 5)
+    assert cache.stats()['entries'] == 2
+
+    # Un archivo borrado a mano desaparece del manifest en prune()
+    (Path(temp_cache_dir) / 'old.txt').unlink()
+    cache.prune()
+    assert [entry['key'] for entry in cache.entries()] == ['new.txt']
+    cache.clear()
+    assert cache.stats()['entries'] == 0 and cache.size() == 0
+
+def test_import_cache_is_lightweight():
+    """ Test 26: Verifica que importar Cache no carga pandas, requests, BeautifulSoup ni matplotlib """
+    code = ('import sys\n'
+            'from traficFines import Cache, CacheError\n'
+            'print(",".join(m for m in ("pandas", "requests", "bs4", "matplotlib") if m in sys.modules))')
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            cwd=Path(__file__).parent.parent)
+    assert output.stdout.strip() == ''
+
+@pytest.mark.parametrize('codec', ['none', 'gzip'])
+def test_verify_detects_truncated_and_corrupted_files(temp_cache_dir, codec):
+    """ Test 27: Verifica que verify detecta archivos truncados (por tamanio) y danados (por checksum) """
+    cache = Cache("TestApp", obsolescence=7, cache_dir=temp_cache_dir, codec=codec)
+    cache.set_bytes('data.bin', os.urandom(10_000))
+    assert cache.verify('data.bin') and cache.verify('data.bin', full=True)
+    assert not cache.verify('missing.bin')
+
+    data = cache.path('data.bin').read_bytes()
+    # Mismo tamanio pero un byte cambiado: solo lo detecta la comprobacion completa
+    cache.path('data.bin').write_bytes(data[:-100] + bytes([data[-100] ^ 0xFF]) + data[-99:])
+    assert cache.verify('data.bin')
+    assert not cache.verify('data.bin', full=True)
+
+    cache.path('data.bin').write_bytes(data[:5000])
+    assert not cache.verify('data.bin')
+
+def test_reopen_with_another_codec(temp_cache_dir):
+    """ Test 28: Verifica que cada archivo se lee con el codec con el que se escribio aunque se cambie el de la cache """
+    data = b'multas;' * 2000
+    gzip_cache = Cache("TestApp", obsolescence=7, cache_dir=temp_cache_dir, codec='gzip')
+    gzip_cache.set_bytes('gzip.bin', data)
+
+    plain = Cache("TestApp", obsolescence=7, cache_dir=temp_cache_dir, codec='none')
+    assert plain.load_bytes('gzip.bin') == data
+    with plain.open('gzip.bin') as file:
+        assert file.read() == data
+    assert bytes(plain.view('gzip.bin')) == data
+    assert plain.verify('gzip.bin', full=True)
+    assert plain.entry('gzip.bin')['codec'] == 'gzip'
 
+    # Los archivos nuevos se escriben con el codec de la instancia y la otra los lee igual
+    plain.set_bytes('plain.bin', data)
+    assert plain.path('plain.bin').read_bytes() == data
+    assert gzip_cache.load_bytes('plain.bin') == data
+    assert gzip_cache.verify('plain.bin', full=True)
 
+def test_manifest_migrated_from_previous_version(temp_cache_dir):
+    """ Test 29: Verifica que un manifest sin la columna codec se actualiza al abrirlo conservando las entradas """
+    import sqlite3
+    Path(temp_cache_dir).mkdir(parents=True, exist_ok=True)
+    (Path(temp_cache_dir) / 'old.txt').write_text('legacy data')
+    connection = sqlite3.connect(Path(temp_cache_dir) / '.manifest.sqlite')
+    connection.executescript(
+        'CREATE TABLE entries (key TEXT PRIMARY KEY, url TEXT, size INTEGER NOT NULL, created REAL NOT NULL, '
+        'accessed REAL NOT NULL, checksum TEXT);'
+        "INSERT INTO entries VALUES ('old.txt', NULL, 11, 0, 0, NULL);"
+        'PRAGMA user_version = 2;')
+    connection.close()
 
+    cache = Cache("TestApp", obsolescence=7, cache_dir=temp_cache_dir)
+    # Sin codec guardado se lee con el de la instancia
+    assert cache.entry('old.txt')['codec'] is None
+    assert cache.load('old.txt') == 'legacy data'
+    Cache("TestApp", obsolescence=7, cache_dir=temp_cache_dir, codec='gzip').set_bytes('new.bin', b'x' * 100)
+    assert cache.entry('new.bin')['codec'] == 'gzip'
+    assert cache.load_bytes('new.bin') == b'x' * 100
@@ -1,6 +1,12 @@
-from tests.conftest import temp_cache_dir
+from tests.conftest import temp_cache_dir, MP_CONTEXT
 from traficFines.cache import Cache, CacheError, CACHE_DIR
 from traficFines.cacheURL import CacheURL
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import hashlib
+import os
+import time
+from pathlib import Path
 import pytest
 
 def test_cacheurl_init(temp_cache_dir):
@@ -40,3 +46,259 @@ def test_cacheurl_get_handles_invalid_domain(cacheurl_instance):
         cacheurl_instance.get("https://no-soy-un-sitio.com")
 
 
+
+def test_cacheurl_aget_downloads_once(cacheurl_instance, portal):
+    """ Test 5: Verifica que varias llamadas concurrentes a aget() con la misma url hacen una sola descarga """
+    url = portal.add_file('data.csv', b'a;b\n1;2\n')
+
+    async def run():
+        return await asyncio.gather(*(cacheurl_instance.aget(url) for _ in range(5)))
+
+    contents = asyncio.run(run())
+    assert contents == ['a;b\n1;2\n'] * 5
+    assert portal.count('data.csv') == 1
+    assert cacheurl_instance.exists(url)
+
+def test_cacheurl_get_many(cacheurl_instance, portal):
+    """ Test 6: Verifica que get_many() devuelve el contenido de cada url en orden """
+    urls = [portal.add_file(f'file_{i}.csv', f'file {i}'.encode()) for i in range(6)]
+    contents = asyncio.run(cacheurl_instance.get_many(urls + urls[:2], concurrency=3))
+
+    assert contents == [f'file {i}' for i in range(6)] + ['file 0', 'file 1']
+    assert all(portal.count(f'file_{i}.csv') == 1 for i in range(6))
+
+def test_cacheurl_get_many_raises_error(cacheurl_instance, portal):
+    """ Test 7: Verifica que get_many() lanza una excepcion si falla alguna url """
+    with pytest.raises(CacheError):
+        asyncio.run(cacheurl_instance.get_many([portal.url('missing.csv')]))
+
+def test_cacheurl_with_codec(temp_cache_dir, portal):
+    """ Test 8: Verifica que CacheURL guarda comprimido y devuelve el mismo contenido """
+    cache_url = CacheURL('TestURL', obsolescence=7, cache_dir=temp_cache_dir, codec='gzip')
+    url = portal.add_file('data.csv', b'a;b\n1;2\n' * 100)
+
+    assert cache_url.get(url) == 'a;b\n1;2\n' * 100
+    assert cache_url.load_bytes(url) == b'a;b\n1;2\n' * 100
+    assert cache_url.get(url) == 'a;b\n1;2\n' * 100
+    assert portal.count('data.csv') == 1
+
+def test_cacheurl_failed_download_leaves_no_entry(cacheurl_instance, portal, temp_cache_dir):
+    """ Test 9: Verifica que una descarga fallida no deja entrada ni archivo parcial en cache """
+    url = portal.url('missing.csv')
+    with pytest.raises(CacheError):
+        cacheurl_instance.download(url)
+
+    assert not cacheurl_instance.exists(url)
+    assert list(Path(temp_cache_dir).iterdir()) == []
+
+def test_cacheurl_download_returns_bytes(cacheurl_instance, portal):
+    """ Test 10: Verifica que download() devuelve los bytes descargados y 0 si ya estaba en cache """
+    url = portal.add_file('data.csv', 'GRAN VÍA;1\n'.encode('latin-1') * 1000)
+
+    assert cacheurl_instance.download(url) == 11000
+    assert cacheurl_instance.download(url) == 0
+    assert cacheurl_instance.get(url) == 'GRAN VÍA;1\n' * 1000
+
+def test_cacheurl_open_and_view(cacheurl_instance, portal):
+    """ Test 11: Verifica que open() y view() aceptan la url """
+    url = portal.add_file('data.csv', b'a;b\n1;2\n')
+    cacheurl_instance.download(url)
+
+    with cacheurl_instance.open(url) as file:
+        assert file.read() == b'a;b\n1;2\n'
+    assert cacheurl_instance.view(url).tobytes() == b'a;b\n1;2\n'
+
+def test_cacheurl_revalidates_expired_entry(cacheurl_instance, portal):
+    """ Test 12: Verifica que una entrada caducada se revalida con una peticion condicional (304) sin descargar de nuevo """
+    url = portal.add_file('data.csv', b'a;b\n1;2\n')
+    cacheurl_instance.download(url)
+    assert 'ETag' in cacheurl_instance.metadata(url)
+
+    old = time.time() - 8 * 24 * 60 * 60
+    os.utime(cacheurl_instance.path(url), (old, old))
+    assert not cacheurl_instance.exists(url)
+
+    assert cacheurl_instance.download(url) == 0
+    assert portal.not_modified['data.csv'] == 1
+    assert cacheurl_instance.exists(url)
+    assert cacheurl_instance.how_old(url) < 60 * 1000
+    assert cacheurl_instance.get(url) == 'a;b\n1;2\n'
+
+def test_cacheurl_revalidation_downloads_changed_content(cacheurl_instance, portal):
+    """ Test 13: Verifica que una entrada caducada cuyo contenido ha cambiado se descarga de nuevo """
+    url = portal.add_file('data.csv', b'a;b\n1;2\n')
+    cacheurl_instance.download(url)
+    old = time.time() - 8 * 24 * 60 * 60
+    os.utime(cacheurl_instance.path(url), (old, old))
+
+    portal.add_file('data.csv', b'a;b\n3;4\n')
+    assert cacheurl_instance.get(url) == 'a;b\n3;4\n'
+    assert portal.not_modified.get('data.csv', 0) == 0
+    assert portal.count('data.csv') == 2
+
+    cacheurl_instance.delete(url)
+    assert cacheurl_instance.metadata(url) == {}
+
+def get_in_process(cache_dir: str, url: str) -> str:
+    """ Proceso que pide una url con su propia instancia de CacheURL """
+    return CacheURL('TestURL', obsolescence=7, cache_dir=cache_dir).get(url)
+
+def test_cacheurl_downloads_once_across_processes(temp_cache_dir, portal):
+    """ Test 14: Verifica que varios procesos que arrancan en frio con el mismo directorio descargan la url una sola vez """
+    url = portal.add_file('data.csv', b'a;b\n1;2\n' * 50_000)
+    with ProcessPoolExecutor(8, mp_context=MP_CONTEXT) as pool:
+        contents = list(pool.map(get_in_process, [temp_cache_dir] * 16, [url] * 16))
+
+    assert contents == ['a;b\n1;2\n' * 50_000] * 16
+    assert portal.count('data.csv') == 1
+
+def test_cacheurl_manifest_keeps_url(cacheurl_instance, portal):
+    """ Test 15: Verifica que el manifest guarda la url original, el tamanio y el checksum de cada descarga """
+    url = portal.add_file('data.csv', b'a;b\n1;2\n')
+    cacheurl_instance.download(url)
+
+    entry = cacheurl_instance.entry(url)
+    assert entry['url'] == url
+    assert entry['size'] == 8
+    assert entry['checksum'] == hashlib.sha256(b'a;b\n1;2\n').hexdigest()
+    assert [item['url'] for item in cacheurl_instance.entries()] == [url]
+    assert cacheurl_instance.stats()['entries'] == 1
+
+def test_cacheurl_resumes_dropped_download(temp_cache_dir, portal):
+    """ Test 16: Verifica que una descarga cortada se reintenta y continua desde el ultimo byte con Range """
+    content = os.urandom(200_000)
+    url = portal.add_file('data.bin', content)
+    portal.failures['data.bin'] = [50_000, 70_000]
+    cacheurl = CacheURL('TestURL', obsolescence=7, cache_dir=temp_cache_dir, backoff=0)
+
+    assert cacheurl.download(url) == len(content)
+    assert cacheurl.load_bytes(url) == content
+    assert portal.range_requests['data.bin'] == ['bytes=50000-', 'bytes=120000-']
+    assert cacheurl.entry(url)['checksum'] == hashlib.sha256(content).hexdigest()
+    assert cacheurl.metadata(url)['Content-Length'] == str(len(content))
+    assert [f.name for f in Path(temp_cache_dir).iterdir() if '.part' in f.name] == []
+
+def test_cacheurl_restarts_without_range_support(temp_cache_dir, portal):
+    """ Test 17: Verifica que si el servidor no admite Range la descarga se repite desde el principio """
+    content = os.urandom(100_000)
+    url = portal.add_file('data.bin', content)
+    portal.ranges = False
+    portal.failures['data.bin'] = [30_000]
+    cacheurl = CacheURL('TestURL', obsolescence=7, cache_dir=temp_cache_dir, backoff=0)
+
+    assert cacheurl.download(url) == 30_000 + len(content)
+    assert cacheurl.load_bytes(url) == content
+    assert portal.count('data.bin') == 2
+
+def test_cacheurl_partial_download_kept_between_calls(temp_cache_dir, portal):
+    """ Test 18: Verifica que al agotar los reintentos no hay entrada y la siguiente llamada continua la descarga """
+    content = os.urandom(100_000)
+    url = portal.add_file('data.bin', content)
+    portal.failures['data.bin'] = [40_000]
+    cacheurl = CacheURL('TestURL', obsolescence=7, cache_dir=temp_cache_dir, retries=0)
+
+    with pytest.raises(CacheError):
+        cacheurl.download(url)
+    assert not cacheurl.exists(url)
+
+    assert cacheurl.download(url) == len(content) - 40_000
+    assert cacheurl.load_bytes(url) == content
+    assert portal.range_requests['data.bin'] == ['bytes=40000-']
+
+def test_cacheurl_retries_transient_status(temp_cache_dir, portal):
+    """ Test 19: Verifica que las respuestas 503 se reintentan y las 404 no """
+    url = portal.add_file('data.csv', b'a;b\n1;2\n')
+    portal.failures['data.csv'] = [('status', 503), ('status', 503)]
+    cacheurl = CacheURL('TestURL', obsolescence=7, cache_dir=temp_cache_dir, backoff=0)
+    assert cacheurl.get(url) == 'a;b\n1;2\n'
+    assert portal.count('data.csv') == 3
+
+    with pytest.raises(CacheError, match='404'):
+        cacheurl.download(portal.url('missing.csv'))
+    assert portal.count('missing.csv') == 1
+    with pytest.raises(CacheError):
+        CacheURL('TestURL', obsolescence=7, cache_dir=temp_cache_dir, retries=-1)
+
+def test_cacheurl_same_content_stored_once(cacheurl_instance, portal):
+    """ Test 20: Verifica que dos urls con el mismo contenido comparten el archivo y se pueden borrar por separado """
+    content = b'a;b\n1;2\n' * 1000
+    first = portal.add_file('data.csv', content)
+    mirror = portal.add_file('mirror/data.csv', content)
+    other = portal.add_file('other.csv', b'c;d\n')
+    for url in (first, mirror, other):
+        cacheurl_instance.download(url)
+
+    assert os.path.samefile(cacheurl_instance.path(first), cacheurl_instance.path(mirror))
+    assert not os.path.samefile(cacheurl_instance.path(first), cacheurl_instance.path(other))
+    assert cacheurl_instance.entry(mirror)['checksum'] == hashlib.sha256(content).hexdigest()
+    assert cacheurl_instance.verify(mirror, full=True)
+
+    cacheurl_instance.delete(first)
+    assert cacheurl_instance.load_bytes(mirror) == content
+
+def test_cacheurl_linked_entries_keep_own_dates(cacheurl_instance, portal):
+    """ Test 21: Verifica que las urls enlazadas cuentan una vez en el tamanio y caducan y se renuevan por separado """
+    content = b'a;b\n1;2\n' * 1000
+    first = portal.add_file('data.csv', content)
+    mirror = portal.add_file('mirror/data.csv', content)
+    cacheurl_instance.download(first)
+    old = time.time() - 8 * 24 * 60 * 60
+    os.utime(cacheurl_instance.path(first), (old, old))
+
+    # El enlace no renueva la entrada caducada
+    cacheurl_instance.download(mirror)
+    assert os.path.samefile(cacheurl_instance.path(first), cacheurl_instance.path(mirror))
+    assert cacheurl_instance.exists(mirror) and not cacheurl_instance.exists(first)
+    assert cacheurl_instance.stats()['bytes'] == len(content)
+
+    # Revalidar una url no toca el archivo compartido
+    assert cacheurl_instance.download(first) == 0
+    assert portal.not_modified['data.csv'] == 1
+    assert cacheurl_instance.exists(first)
+    assert os.path.getmtime(cacheurl_instance.path(mirror)) == pytest.approx(old)
+
+    # Al quedarse sola con el archivo, la entrada recupera su fecha en el archivo
+    cacheurl_instance.delete(mirror)
+    assert cacheurl_instance.how_old(first) < 60 * 1000
+    assert time.time() - os.path.getmtime(cacheurl_instance.path(first)) < 60
+
+def test_cacheurl_eviction_counts_linked_entries_once(temp_cache_dir, portal):
+    """ Test 22: Verifica que las urls enlazadas no provocan desalojos y que desalojarlas libera el espacio real """
+    content = b'a;b\n1;2\n' * 1000
+    cacheurl = CacheURL('TestApp', obsolescence=7, cache_dir=temp_cache_dir, max_bytes=len(content) * 3 // 2)
+    first = portal.add_file('data.csv', content)
+    mirror = portal.add_file('mirror/data.csv', content)
+    cacheurl.download(first)
+    cacheurl.download(mirror)
+    assert cacheurl.exists(first) and cacheurl.exists(mirror)
+
+    other = portal.add_file('other.csv', b'x' * len(content))
+    cacheurl.download(other)
+    assert cacheurl.exists(other) and not cacheurl.exists(first) and not cacheurl.exists(mirror)
+    on_disk = sum(f.stat().st_size for f in Path(temp_cache_dir).iterdir() if not f.name.startswith('.'))
+    assert cacheurl.stats()['bytes'] == on_disk == len(content)
+
+def test_cacheurl_get_with_zero_obsolescence(temp_cache_dir, portal):
+    """ Test 23: Verifica que con obsolescence 0 get devuelve la entrada que acaba de descargar o revalidar """
+    url = portal.add_file('data.csv', b'a;b\n1;2\n')
+    cacheurl = CacheURL('TestApp', obsolescence=0, cache_dir=temp_cache_dir)
+    assert cacheurl.get(url) == 'a;b\n1;2\n'
+    assert not cacheurl.exists(url)
+    assert cacheurl.get(url) == 'a;b\n1;2\n'
+    assert portal.not_modified['data.csv'] == 1
+
+def test_cacheurl_eviction_leaves_no_metadata(temp_cache_dir, portal):
+    """ Test 24: Verifica que desalojar o limpiar entradas borra tambien sus cabeceras de validacion """
+    cacheurl = CacheURL('TestApp', obsolescence=7, cache_dir=temp_cache_dir, max_bytes=500)
+    urls = [portal.add_file(f'data{i}.csv', bytes([65 + i]) * 400) for i in range(4)]
+    for url in urls:
+        cacheurl.download(url)
+    assert [url for url in urls if cacheurl.exists(url)] == urls[-1:]
+    assert list(Path(temp_cache_dir).glob('.*.meta')) == []
+    assert cacheurl.metadata(urls[0]) == {}
+    assert cacheurl.metadata(urls[-1])['Content-Length'] == '400'
+
+    # Los archivos de cabeceras de versiones anteriores se borran al limpiar la cache
+    (Path(temp_cache_dir) / '.0123456789abcdef0123456789abcdef.meta').write_text('{"ETag": "x"}')
+    cacheurl.prune()
+    assert list(Path(temp_cache_dir).glob('.*.meta')) == []
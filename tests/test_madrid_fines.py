@@ -1,14 +1,24 @@
 from tests.conftest import temp_cache_dir, madrid_instance
-from traficFines.madridFines import MadridFines, MadridError
+from traficFines import madridFines
+from traficFines.madridFines import MadridFines, MadridError, MadridCatalog, get_url
+from traficFines.frameCache import FrameCache
 import pytest
 from pathlib import Path
 import pandas as pd
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import os
+import sys
+import threading
+import time
+from tests.portal import make_csv
 
 
 def test_init_madridFines(madrid_instance):
     """ Test 1: Verifica que la instancia de madridFines ha sido creada"""
     assert madrid_instance._MadridFines__data.empty
-    assert madrid_instance._MadridFines__loaded == []
+    assert madrid_instance._MadridFines__loaded == set()
 
 def test_add_new_files(madrid_instance, temp_cache_dir):
     """ Test 2: Verifica que el metodo add() crea archivos de madridFines """
@@ -77,3 +87,517 @@ def test_deal_with_multiple_months_data(madrid_instance):
     assert (1,2025) in madrid_instance._MadridFines__loaded
     assert (2,2025) in madrid_instance._MadridFines__loaded
     assert (3,2025) in madrid_instance._MadridFines__loaded
+
+def test_catalog_parses_index_once(madrid_instance, portal):
+    """ Test 9: Verifica que el indice del portal se descarga una sola vez para todo un anio """
+    for month in range(1, 13):
+        portal.add_month(2024, month)
+    madrid_instance.add(year=2024)
+
+    assert portal.count('index.jsp') == 1
+    assert len(madrid_instance._MadridFines__loaded) == 12
+
+def test_catalog_persists_in_cache(temp_cache_dir, portal):
+    """ Test 10: Verifica que una nueva instancia reutiliza el indice guardado en cache """
+    url = portal.add_month(2024, 4)
+    MadridFines('TestMadrid', obsolescence=7, cache_dir=temp_cache_dir).catalog.load()
+    catalog = MadridFines('TestMadrid', obsolescence=7, cache_dir=temp_cache_dir).catalog
+
+    assert catalog.url(2024, 4) == url
+    assert portal.count('index.jsp') == 1
+
+def test_catalog_expired_is_downloaded_again(cache_instance, portal):
+    """ Test 11: Verifica que el indice caducado se vuelve a descargar """
+    portal.add_month(2024, 4)
+    MadridCatalog(cache_instance, ttl=0).load()
+    MadridCatalog(cache_instance, ttl=0).load()
+    assert portal.count('index.jsp') == 2
+
+def test_catalog_missing_month_raises_error(portal):
+    """ Test 12: Verifica que get_url lanza una excepcion si el mes no esta publicado """
+    portal.add_month(2024, 4)
+    with pytest.raises(MadridError):
+        get_url(2024, 5)
+
+def test_add_with_workers(madrid_instance, portal):
+    """ Test 13: Verifica que add() con varios hilos carga el anio completo en orden """
+    for month in range(1, 13):
+        portal.add_month(2024, month, rows=30)
+    madrid_instance.add(year=2024, workers=4)
+
+    data = madrid_instance._MadridFines__data
+    assert len(data) == 12 * 30
+    assert list(data['MES'].unique()) == list(range(1, 13))
+    assert sorted(madrid_instance._MadridFines__loaded) == sorted((m, 2024) for m in range(1, 13))
+
+def test_add_range_collects_errors(madrid_instance, portal):
+    """ Test 14: Verifica que si falla un mes no se agrega ninguno y se informan todos los errores """
+    portal.add_month(2024, 11)
+    portal.add_month(2025, 1)
+    with pytest.raises(MadridError, match='1 de 3'):
+        madrid_instance.add_range((2024, 11), (2025, 1), workers=3)
+
+    assert madrid_instance._MadridFines__data.empty
+    assert madrid_instance._MadridFines__loaded == set()
+
+def test_clean_month_cached_in_columnar_format(temp_cache_dir, portal, monkeypatch):
+    """ Test 15: Verifica que un mes ya limpio se lee de la cache columnar sin parsear el csv """
+    pytest.importorskip('pyarrow')
+    portal.add_month(2024, 4)
+    first = MadridFines('TestMadrid', obsolescence=7, cache_dir=temp_cache_dir)
+    first.add(year=2024, month=4)
+
+    def fail(*args, **kwargs):
+        raise AssertionError('read_csv no deberia ejecutarse')
+    monkeypatch.setattr(madridFines.pd, 'read_csv', fail)
+    second = MadridFines('TestMadrid', obsolescence=7, cache_dir=temp_cache_dir)
+    second.add(year=2024, month=4)
+
+    pd.testing.assert_frame_equal(first._MadridFines__data, second._MadridFines__data)
+
+def test_columnar_cache_invalidated_by_clean_version(temp_cache_dir, portal, monkeypatch):
+    """ Test 16: Verifica que al cambiar la version de limpieza se vuelve a parsear el csv """
+    pytest.importorskip('pyarrow')
+    portal.add_month(2024, 4)
+    MadridFines('TestMadrid', obsolescence=7, cache_dir=temp_cache_dir).add(year=2024, month=4)
+
+    monkeypatch.setattr(madridFines, 'CLEAN_VERSION', madridFines.CLEAN_VERSION + 1)
+    MadridFines('TestMadrid', obsolescence=7, cache_dir=temp_cache_dir).add(year=2024, month=4)
+
+    frames = [f.name for f in (Path(temp_cache_dir) / 'frames').iterdir() if not f.name.startswith('.')]
+    assert len(frames) == 1
+    assert f'_v{madridFines.CLEAN_VERSION}.' in frames[0]
+
+def test_clean_builds_datetime_index():
+    """ Test 17: Verifica que __clean construye el indice de fechas y limpia textos y numeros """
+    df = pd.read_csv(BytesIO(make_csv(2024, 3, rows=30)), sep=';', encoding='latin-1', low_memory=False)
+    MadridFines._MadridFines__clean(df)
+
+    assert isinstance(df.index, pd.DatetimeIndex)
+    assert df.index.name == 'FECHA'
+    assert df.index[1] == pd.Timestamp('2024-03-01 01:07:00')
+    assert df.index[0] == pd.Timestamp('2024-03-01 00:00:00')
+    assert 'HECHO_BOL' in df.columns and 'COORDENADA_X' in df.columns
+    assert df['CALIFICACION'].iloc[2] == 'MUY GRAVE'
+    assert df['LUGAR'].iloc[1] == 'GRAN VÍA 1'
+    assert df['VEL_LIMITE'].iloc[0] == 50 and pd.isna(df['VEL_LIMITE'].iloc[1])
+
+def test_remove_drops_one_partition(madrid_instance, portal):
+    """ Test 18: Verifica que remove() elimina un mes y mantiene el resto """
+    for month in (1, 2, 3):
+        portal.add_month(2024, month, rows=20)
+    madrid_instance.add_range((2024, 1), (2024, 3))
+    assert len(madrid_instance.data) == 60
+
+    madrid_instance.remove(2024, 2)
+
+    assert (2, 2024) not in madrid_instance._MadridFines__loaded
+    assert len(madrid_instance.data) == 40
+    assert sorted(madrid_instance.data['MES'].unique()) == [1, 3]
+    with pytest.raises(MadridError):
+        madrid_instance.remove(2024, 2)
+
+def test_clean_applies_compact_schema():
+    """ Test 19: Verifica que __clean aplica los tipos compactos del esquema """
+    df = pd.read_csv(BytesIO(make_csv(2024, 3, rows=30)), sep=';', encoding='latin-1', low_memory=False)
+    MadridFines._MadridFines__clean(df)
+
+    assert isinstance(df['CALIFICACION'].dtype, pd.CategoricalDtype)
+    assert list(df['CALIFICACION'].cat.categories) == ['GRAVE', 'LEVE', 'MUY GRAVE']
+    assert df['MES'].dtype == 'uint8'
+    assert df['ANIO'].dtype == 'uint16'
+    assert df['VEL_LIMITE'].dtype == 'Int16'
+
+def test_partitions_keep_categories_and_aggregates(madrid_instance, portal):
+    """ Test 20: Verifica que al unir meses se mantienen los category y los resumenes son correctos """
+    portal.add_month(2024, 1, rows=30)
+    portal.add_month(2024, 2, rows=31)
+    madrid_instance.add_range((2024, 1), (2024, 2))
+
+    data = madrid_instance.data
+    assert isinstance(data['LUGAR'].dtype, pd.CategoricalDtype)
+
+    califications = madrid_instance.fines_calification()
+    assert califications.loc[(1, 2024), 'LEVE'] == 10
+    assert califications.loc[(2, 2024), 'LEVE'] == 11
+
+    payments = madrid_instance.total_payment()
+    assert payments['rec_maxima'].tolist() == [7900.0, 7990.0]
+    assert payments['rec_minima'].tolist() == [3950.0, 3995.0]
+
+    report = madrid_instance.memory_report()
+    assert report.loc['TOTAL', 'bytes_after'] < report.loc['TOTAL', 'bytes_before']
+
+def test_load_in_chunks_matches_single_read(temp_cache_dir, portal, monkeypatch):
+    """ Test 21: Verifica que leer el csv por bloques da el mismo resultado que leerlo entero """
+    portal.add_month(2024, 5, rows=100)
+    whole = MadridFines('Whole', obsolescence=7, cache_dir=temp_cache_dir + '/whole', frame_cache=False)
+    whole.add(year=2024, month=5)
+
+    monkeypatch.setattr(madridFines, 'CHUNK_ROWS', 7)
+    chunked = MadridFines('Chunked', obsolescence=7, cache_dir=temp_cache_dir + '/chunked', frame_cache=False)
+    chunked.add(year=2024, month=5)
+
+    pd.testing.assert_frame_equal(whole.data, chunked.data)
+
+def test_sniff_encoding():
+    """ Test 22: Verifica la deteccion de codificacion de los csv en cache """
+    sniff = MadridFines._MadridFines__sniff_encoding
+    assert sniff('GRAN VÍA'.encode('latin-1')) == 'latin-1'
+    assert sniff('GRAN VÍA'.encode('utf-8')) == 'utf-8'
+    assert sniff('GRAN VÍA'.encode('utf-8')[:-2]) == 'utf-8'
+    assert sniff(b'CALLE MAYOR') == 'latin-1'
+
+def test_incremental_aggregates_match_full_scan(madrid_instance, portal):
+    """ Test 23: Verifica que los resumenes incrementales coinciden con recorrer el dataset completo """
+    for month in (1, 2, 3):
+        portal.add_month(2024, month, rows=40 + month)
+    madrid_instance.add_range((2024, 1), (2024, 3))
+    madrid_instance.remove(2024, 2)
+    data = madrid_instance.data
+
+    expected = data.groupby(['MES', 'ANIO', 'CALIFICACION'], observed=True).size().reset_index(name='count')
+    expected = expected.pivot_table(index=['MES', 'ANIO'], columns='CALIFICACION', values='count',
+                                    fill_value=0, observed=True)
+    pd.testing.assert_frame_equal(madrid_instance.fines_calification(), expected)
+
+    payments = data[['MES', 'ANIO']].assign(IMP_BOL=data['IMP_BOL'].astype('float64'))
+    expected = payments.groupby(['MES', 'ANIO']).agg(
+        rec_maxima=('IMP_BOL', 'sum'), rec_minima=('IMP_BOL', lambda x: x.sum() * 0.5)).reset_index()
+    pd.testing.assert_frame_equal(madrid_instance.total_payment(), expected)
+
+def test_fines_raise_error_after_removing_all(madrid_instance, portal):
+    """ Test 24: Verifica que los resumenes lanzan una excepcion si se eliminan todos los meses """
+    portal.add_month(2024, 1)
+    madrid_instance.add(year=2024, month=1)
+    madrid_instance.remove(2024, 1)
+    with pytest.raises(MadridError):
+        madrid_instance.total_payment()
+
+def test_fines_hour_saves_figure(madrid_instance, portal, temp_cache_dir):
+    """ Test 25: Verifica que fines_hour() guarda el grafico con los datos de varios meses """
+    portal.add_month(2024, 1)
+    portal.add_month(2024, 2)
+    madrid_instance.add_range((2024, 1), (2024, 2))
+    fig_name = Path(temp_cache_dir) / 'horas.png'
+    figure = madrid_instance.fines_hour(str(fig_name))
+    assert fig_name.exists()
+    assert len(figure.axes[0].lines) == 2
+
+def test_query_prunes_months_and_filters(madrid_instance, portal):
+    """ Test 26: Verifica que query() solo descarga los meses pedidos y aplica condiciones y columnas """
+    for month in (1, 2, 3):
+        portal.add_month(2024, month, rows=30)
+    result = madrid_instance.query(years=2024, months=[2, 3], where=[('CALIFICACION', '==', 'GRAVE')],
+                                   columns=['CALIFICACION', 'IMP_BOL'])
+
+    assert portal.count('csv/2024_01_detalle.csv') == 0
+    assert list(result.columns) == ['CALIFICACION', 'IMP_BOL']
+    assert len(result) == 20
+    assert (result['CALIFICACION'] == 'GRAVE').all()
+    assert sorted(result.index.month.unique()) == [2, 3]
+    # query no agrega datos al dataset
+    assert madrid_instance._MadridFines__loaded == set()
+
+def test_query_matches_filtering_loaded_data(madrid_instance, portal):
+    """ Test 27: Verifica que query() coincide con filtrar a mano los datos cargados """
+    for month in (1, 2):
+        portal.add_month(2024, month, rows=40)
+    where = [('DENUNCIANTE', 'in', ['SER', 'AGENTES DE MOVILIDAD']), ('FECHA', '>=', '2024-01-01 12:00')]
+    scanned = madrid_instance.query(years=[2024], where=where)
+
+    madrid_instance.add(year=2024, month=1)
+    mixed = madrid_instance.query(years=[2024], where=where)
+    data = madrid_instance.data
+    expected = data[data['DENUNCIANTE'].isin(['SER', 'AGENTES DE MOVILIDAD']) & (data.index >= '2024-01-01 12:00')]
+
+    pd.testing.assert_frame_equal(mixed[mixed.index.month == 1], expected)
+    pd.testing.assert_frame_equal(scanned, mixed)
+    with pytest.raises(MadridError):
+        madrid_instance.query(years=2024, where=[('MES', 'like', 1)])
+
+def test_add_returns_stage_metrics(temp_cache_dir, portal):
+    """ Test 28: Verifica que add() devuelve las metricas de cada etapa y las envia al sink """
+    for month in (1, 2):
+        portal.add_month(2024, month, rows=30)
+    events = []
+    fines = MadridFines('TestMadrid', obsolescence=7, cache_dir=temp_cache_dir, track_memory=True,
+                        metrics=lambda name, value, tags: events.append((name, value, tags)))
+    report = fines.add_range((2024, 1), (2024, 2))
+
+    assert fines.report is report
+    assert [(item.year, item.month) for item in report.months] == [(2024, 1), (2024, 2)]
+    totals = report.totals()
+    assert totals['rows'] == 60
+    assert totals['csv_misses'] == 2 and totals['csv_hits'] == 0
+    assert totals['bytes_downloaded'] == sum(len(portal.files[f'csv/2024_0{m}_detalle.csv']) for m in (1, 2))
+    assert totals['peak_bytes'] > 0
+    assert report.stages['total'] >= report.stages['catalog'] > 0
+    assert all(report.months[0].stages[stage] > 0 for stage in ('download', 'parse', 'clean', 'aggregate'))
+    assert len(report.to_frame()) == 2
+    assert ('rows', 30, {'year': 2024, 'month': 1}) in events
+    assert any(name == 'stage.total.seconds' for name, _, _ in events)
+
+    # Con los csv ya en cache no se descarga nada
+    again = MadridFines('TestMadrid', obsolescence=7, cache_dir=temp_cache_dir).add(year=2024, month=1)
+    assert again.totals()['bytes_downloaded'] == 0
+    assert again.totals()['csv_hits'] + again.totals()['frame_hits'] >= 1
+
+@pytest.mark.parametrize('frame_cache', [True, False])
+def test_add_with_processes_matches_threads(temp_cache_dir, portal, frame_cache):
+    """ Test 29: Verifica que parsear en procesos da el mismo resultado que parsear en los hilos """
+    pytest.importorskip('pyarrow')
+    for month in (1, 2, 3):
+        portal.add_month(2024, month, rows=40)
+    threads = MadridFines('Threads', obsolescence=7, cache_dir=temp_cache_dir + '/threads', frame_cache=frame_cache)
+    threads.add_range((2024, 1), (2024, 3))
+    processes = MadridFines('Processes', obsolescence=7, cache_dir=temp_cache_dir + '/processes',
+                            frame_cache=frame_cache)
+    report = processes.add_range((2024, 1), (2024, 3), processes=2)
+
+    pd.testing.assert_frame_equal(threads.data, processes.data)
+    pd.testing.assert_frame_equal(threads.fines_calification(), processes.fines_calification())
+    assert report.totals()['rows'] == 120
+    assert all(metrics.stages['parse'] > 0 for metrics in report.months)
+    # Los archivos temporales de los procesos no quedan en disco
+    assert not [f for f in Path(temp_cache_dir).rglob('*.tmp')]
+    if frame_cache:
+        assert report.totals()['frame_misses'] == 3
+        assert len([f for f in (Path(temp_cache_dir) / 'processes' / 'frames').iterdir()
+                    if not f.name.startswith('.')]) == 3
+
+def test_pyarrow_engine_matches_c_engine(temp_cache_dir, portal):
+    """ Test 30: Verifica que el motor pyarrow da los mismos datos limpios y consultas que el motor c """
+    pytest.importorskip('pyarrow')
+    for month in (1, 2):
+        portal.add_month(2024, month, rows=60)
+    c_engine = MadridFines('C', obsolescence=7, cache_dir=temp_cache_dir + '/c', frame_cache=False)
+    c_engine.add_range((2024, 1), (2024, 2))
+    arrow = MadridFines('Arrow', obsolescence=7, cache_dir=temp_cache_dir + '/arrow', frame_cache=False,
+                        engine='pyarrow')
+    arrow.add_range((2024, 1), (2024, 2))
+
+    assert arrow.engine == 'pyarrow'
+    pd.testing.assert_frame_equal(c_engine.data, arrow.data)
+    where = [('CALIFICACION', '==', 'GRAVE')]
+    fresh = MadridFines('Arrow', obsolescence=7, cache_dir=temp_cache_dir + '/arrow', frame_cache=False,
+                        engine='pyarrow')
+    pd.testing.assert_frame_equal(c_engine.query(years=2024, where=where, columns=['IMP_BOL', 'VEL_LIMITE']),
+                                  fresh.query(years=2024, where=where, columns=['IMP_BOL', 'VEL_LIMITE']))
+
+def test_engine_validation_and_fallback(temp_cache_dir, monkeypatch):
+    """ Test 31: Verifica que un motor desconocido lanza error y que sin pyarrow se usa el motor c """
+    with pytest.raises(MadridError):
+        MadridFines('TestMadrid', obsolescence=7, cache_dir=temp_cache_dir, engine='python')
+    monkeypatch.setitem(sys.modules, 'pyarrow', None)
+    assert MadridFines('TestMadrid', obsolescence=7, cache_dir=temp_cache_dir, engine='pyarrow').engine == 'c'
+
+def test_truncated_csv_downloaded_again(temp_cache_dir, portal):
+    """ Test 32: Verifica que un csv truncado en la cache se vuelve a descargar antes de parsearlo """
+    portal.add_month(2024, 4, rows=40)
+    first = MadridFines('TestMadrid', obsolescence=7, cache_dir=temp_cache_dir, frame_cache=False)
+    first.add(year=2024, month=4)
+    path = first._MadridFines__cacheurl.path(first.catalog.url(2024, 4))
+    path.write_bytes(path.read_bytes()[:500])
+
+    second = MadridFines('TestMadrid', obsolescence=7, cache_dir=temp_cache_dir, frame_cache=False)
+    report = second.add(year=2024, month=4)
+    assert report.totals()['bytes_downloaded'] > 0
+    pd.testing.assert_frame_equal(first.data, second.data)
+
+def test_sync_loads_only_new_months(temp_cache_dir, portal):
+    """ Test 33: Verifica que sync descarga el catalogo una vez y solo los meses nuevos """
+    for month in (1, 2):
+        portal.add_month(2024, month, rows=30)
+    fines = MadridFines('TestMadrid', obsolescence=7, cache_dir=temp_cache_dir)
+    with pytest.raises(MadridError):
+        fines.sync()
+    fines.add_range((2024, 1), (2024, 2))
+    index_hits = portal.count(madridFines.MADRID_FINES_URL)
+
+    portal.add_month(2024, 3, rows=30)
+    report = fines.sync()
+    assert [(item.year, item.month) for item in report.months] == [(2024, 3)]
+    assert portal.count(madridFines.MADRID_FINES_URL) == index_hits + 1
+    assert [portal.count(f'csv/2024_0{m}_detalle.csv') for m in (1, 2, 3)] == [1, 1, 1]
+    assert len(fines.data) == 90
+    assert fines.sync().months == []
+
+    # Una instancia nueva lee de la cache los meses ya descargados
+    fresh = MadridFines('TestMadrid', obsolescence=7, cache_dir=temp_cache_dir)
+    assert fresh.sync(since=(2024, 2)).totals()['bytes_downloaded'] == 0
+    pd.testing.assert_frame_equal(fresh.data, fines.data[fines.data['MES'] >= 2])
+
+def test_sync_reloads_changed_months(temp_cache_dir, portal):
+    """ Test 34: Verifica que sync vuelve a cargar solo los meses cuyo csv ha cambiado al revalidarlo """
+    for month in (1, 2):
+        portal.add_month(2024, month, rows=30)
+    fines = MadridFines('TestMadrid', obsolescence=7, cache_dir=temp_cache_dir)
+    fines.add_range((2024, 1), (2024, 2))
+
+    # Las dos entradas caducan, el mes 2 se publica de nuevo con mas filas
+    old = time.time() - 8 * 86400
+    for month in (1, 2):
+        os.utime(fines._MadridFines__cacheurl.path(fines.catalog.url(2024, month)), (old, old))
+    portal.add_month(2024, 2, rows=45)
+
+    report = fines.sync()
+    assert [(item.year, item.month) for item in report.months] == [(2024, 2)]
+    assert portal.not_modified['csv/2024_01_detalle.csv'] == 1
+    assert len(fines.data) == 75
+    calification = fines.fines_calification()
+    assert calification.loc[(2, 2024)].sum() == 45 and calification.loc[(1, 2024)].sum() == 30
+
+def test_revalidated_csv_keeps_frame_cache(temp_cache_dir, portal):
+    """ Test 35: Verifica que una revalidacion 304 del csv no invalida el mes limpio de la cache columnar """
+    pytest.importorskip('pyarrow')
+    portal.add_month(2024, 4)
+    first = MadridFines('TestMadrid', obsolescence=7, cache_dir=temp_cache_dir)
+    first.add(year=2024, month=4)
+    cacheurl = first._MadridFines__cacheurl
+    url = first.catalog.url(2024, 4)
+    old = time.time() - 8 * 86400
+    os.utime(cacheurl.path(url), (old, old))
+    assert cacheurl.download(url) == 0
+    assert portal.not_modified['csv/2024_04_detalle.csv'] == 1
+
+    report = MadridFines('TestMadrid', obsolescence=7, cache_dir=temp_cache_dir).add(year=2024, month=4)
+    assert report.totals()['frame_hits'] == 1 and report.totals()['frame_misses'] == 0
+    assert len([f for f in (Path(temp_cache_dir) / 'frames').iterdir() if not f.name.startswith('.')]) == 1
+
+@pytest.mark.parametrize('processes', [0, 1])
+def test_csv_cache_reopened_with_another_codec(temp_cache_dir, portal, processes):
+    """ Test 36: Verifica que los csv guardados con un codec se leen al abrir la cache con otro """
+    portal.add_month(2024, 5, rows=30)
+    gzip_fines = MadridFines('TestMadrid', obsolescence=7, cache_dir=temp_cache_dir, codec='gzip', frame_cache=False)
+    gzip_fines.add(year=2024, month=5)
+
+    plain = MadridFines('TestMadrid', obsolescence=7, cache_dir=temp_cache_dir, frame_cache=False)
+    report = plain.add(year=2024, month=5, processes=processes)
+    assert report.totals()['bytes_downloaded'] == 0
+    pd.testing.assert_frame_equal(gzip_fines.data, plain.data)
+
+def test_sync_revalidates_in_parallel(temp_cache_dir, portal):
+    """ Test 37: Verifica que sync revalida los meses cargados en los hilos de la carga, una vez cada uno """
+    months = (1, 2, 3)
+    for month in months:
+        portal.add_month(2024, month, rows=20)
+    fines = MadridFines('TestMadrid', obsolescence=7, cache_dir=temp_cache_dir)
+    fines.add_range((2024, 1), (2024, 3))
+    cacheurl = fines._MadridFines__cacheurl
+    old = time.time() - 8 * 86400
+    for month in months:
+        os.utime(cacheurl.path(fines.catalog.url(2024, month)), (old, old))
+
+    # Las tres revalidaciones solo pasan la barrera si se hacen a la vez
+    barrier = threading.Barrier(len(months), timeout=10)
+    threads = set()
+    download = cacheurl.download
+    def revalidate(url):
+        threads.add(threading.current_thread())
+        barrier.wait()
+        return download(url)
+    cacheurl.download = revalidate
+
+    report = fines.sync(workers=3)
+    assert report.months == []
+    assert threading.main_thread() not in threads and len(threads) == len(months)
+    assert [portal.not_modified[f'csv/2024_0{m}_detalle.csv'] for m in months] == [1, 1, 1]
+    assert len(fines.data) == 60
+
+def test_add_year_loads_published_months(madrid_instance, portal):
+    """ Test 38: Verifica que add() sin mes carga solo los meses publicados del anio en curso """
+    year = datetime.date.today().year
+    for month in (1, 2):
+        portal.add_month(year, month, rows=10)
+    report = madrid_instance.add(year=year)
+
+    assert sorted((item.year, item.month) for item in report.months) == [(year, 1), (year, 2)]
+    assert len(madrid_instance.data) == 20
+    with pytest.raises(MadridError, match='publicados'):
+        madrid_instance.add(year=year - 1)
+
+def test_max_bytes_split_between_csv_and_frames(temp_cache_dir, portal):
+    """ Test 39: Verifica que max_bytes limita el total de los csv y la cache columnar, repartido con frame_max_bytes """
+    pytest.importorskip('pyarrow')
+    def budgets(**kwargs):
+        fines = MadridFines('TestMadrid', obsolescence=7, cache_dir=temp_cache_dir, **kwargs)
+        frames = fines._MadridFines__frames
+        return fines._MadridFines__cacheurl.max_bytes, frames.max_bytes if frames is not None else None
+    assert budgets(max_bytes=1000) == (500, 500)
+    assert budgets(max_bytes=1000, frame_max_bytes=300) == (700, 300)
+    assert budgets(max_bytes=1000, frame_cache=False) == (1000, None)
+    assert budgets(frame_max_bytes=300) == (None, 300)
+    for frame_max_bytes in (1200, -1):
+        with pytest.raises(MadridError):
+            budgets(max_bytes=1000, frame_max_bytes=frame_max_bytes)
+
+    # Sin limite se miden los archivos de un mes; con el limite el directorio completo no lo supera
+    def disk_usage(directory):
+        return sum(f.stat().st_size for f in Path(directory).rglob('*') if f.is_file() and not f.name.startswith('.'))
+    for month in (1, 2, 3):
+        portal.add_month(2024, month, rows=40)
+    unlimited = MadridFines('Unlimited', obsolescence=7, cache_dir=temp_cache_dir + '/unlimited')
+    unlimited.add(year=2024, month=1)
+    max_bytes = 2 * disk_usage(temp_cache_dir + '/unlimited')
+    limited = MadridFines('Limited', obsolescence=7, cache_dir=temp_cache_dir + '/limited', max_bytes=max_bytes)
+    limited.add_range((2024, 1), (2024, 3))
+    assert disk_usage(temp_cache_dir + '/limited') <= max_bytes
+
+def test_catalog_outside_csv_budget(temp_cache_dir, portal):
+    """ Test 40: Verifica que desalojar csv por max_bytes no elimina el indice guardado del portal """
+    for month in (1, 2):
+        portal.add_month(2024, month, rows=30)
+    fines = MadridFines('TestMadrid', obsolescence=7, cache_dir=temp_cache_dir, max_bytes=1, frame_cache=False)
+    fines.add_range((2024, 1), (2024, 2))
+    assert len(fines._MadridFines__cacheurl.entries()) == 1
+
+    MadridFines('TestMadrid', obsolescence=7, cache_dir=temp_cache_dir).catalog.load()
+    assert portal.count('index.jsp') == 1
+
+def test_catalog_refreshed_once_by_concurrent_threads(cache_instance, portal):
+    """ Test 41: Verifica que varios hilos con el indice caducado lo descargan una sola vez """
+    portal.add_month(2024, 4)
+    catalogs = [MadridCatalog(cache_instance, ttl=1) for _ in range(4)]
+    shared = MadridCatalog(cache_instance, ttl=1)
+    barrier = threading.Barrier(8, timeout=10)
+    def load(catalog):
+        barrier.wait()
+        return catalog.load()
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(load, catalogs + [shared] * 4))
+
+    assert portal.count('index.jsp') == 1
+    assert all(result == results[0] for result in results)
+
+@pytest.mark.parametrize('processes', [0, 1])
+def test_add_with_zero_obsolescence(temp_cache_dir, portal, processes):
+    """ Test 42: Verifica que con obsolescence 0 add usa el csv y el mes limpio que acaba de generar """
+    portal.add_month(2024, 4, rows=30)
+    fines = MadridFines('TestMadrid', obsolescence=0, cache_dir=temp_cache_dir)
+    fines.add(year=2024, month=4, processes=processes)
+    assert len(fines.data) == 30
+
+def test_query_rejects_unknown_columns(madrid_instance, portal):
+    """ Test 43: Verifica que query() rechaza columnas desconocidas antes de leer ningun mes """
+    portal.add_month(2024, 1, rows=20)
+    for kwargs in ({'columns': ['IMP_BOL', 'NOPE']}, {'where': [('NOPE', '==', 1)]}, {'columns': ['FECHA']}):
+        with pytest.raises(MadridError, match='Columna invalida'):
+            madrid_instance.query(years=2024, **kwargs)
+    assert portal.count('index.jsp') == 0 and portal.count('csv/2024_01_detalle.csv') == 0
+
+def test_query_reads_frame_columns_without_buffering(temp_cache_dir, portal, monkeypatch):
+    """ Test 44: Verifica que query() lee de la cache columnar sin cargar el archivo entero en memoria """
+    pytest.importorskip('pyarrow')
+    portal.add_month(2024, 1, rows=40)
+    MadridFines('TestMadrid', obsolescence=7, cache_dir=temp_cache_dir).add(year=2024, month=1)
+    fines = MadridFines('TestMadrid', obsolescence=7, cache_dir=temp_cache_dir)
+    expected = fines.query(years=2024, columns=['IMP_BOL'])
+
+    def load_bytes(*args, **kwargs):
+        raise AssertionError('load_frame no debe leer el archivo entero')
+    monkeypatch.setattr(FrameCache, 'load_bytes', load_bytes)
+    result = fines.query(years=2024, columns=['IMP_BOL'])
+    pd.testing.assert_frame_equal(result, expected)
+    assert list(result.columns) == ['IMP_BOL'] and len(result) == 40
+    assert portal.count('csv/2024_01_detalle.csv') == 1
@@ -3,8 +3,32 @@
 # constructor del modulo MadridFines
 
 from .cache import Cache, CacheError
-from .cacheURL import CacheURL
-from .madridFines import MadridFines, MadridError, get_url, RAIZ, MADRID_FINES_URL
+
+# Los modulos que dependen de requests, pandas o BeautifulSoup se importan la primera vez que se usan,
+# asi "from traficFines import Cache" no paga el tiempo de carga de esas librerias
+_LAZY = {
+    'CacheURL': 'cacheURL',
+    'MadridFines': 'madridFines',
+    'MadridError': 'madridFines',
+    'MadridCatalog': 'madridFines',
+    'get_url': 'madridFines',
+    'RAIZ': 'madridFines',
+    'MADRID_FINES_URL': 'madridFines',
+}
+
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+    value = getattr(importlib.import_module(f'.{_LAZY[name]}', __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
+
 
 # Solo los elementos que los usuarios pueden importar directamente, no incluyen privados o internos
 # Imports relativos que esten dentro del paquete
@@ -14,7 +38,8 @@ __all__ = [
     'CacheURL', 
     'MadridFines', 
     'MadridError', 
+    'MadridCatalog',
     'get_url', 
     'RAIZ', 
     'MADRID_FINES_URL'
-]
\ No newline at end of file
+]
@@ -3,13 +3,31 @@
 # Implementa la clase Cache para manejo de archivos
 # Comentarios en espaniol, errores nombres de variables y resto ingles
 
+from collections import OrderedDict
+from contextlib import contextmanager
 from pathlib import Path
+import hashlib
+import io
+import mmap
 import os
+import tempfile
+import threading
 import time
+from .manifest import Manifest, MANIFEST_NAME
+
+try:
+    import fcntl
+except ImportError:
+    # Windows no tiene fcntl, los bloqueos entre procesos se hacen con msvcrt
+    fcntl = None
+    import msvcrt
 
 # Constante
 CACHE_DIR = Path.home() / ".my_cache"
 
+# Numero de accesos que se acumulan en memoria antes de guardarlos en el manifest
+TOUCH_BATCH = 256
+
 class CacheError(Exception):
     """
     Excepcion que se lanza cuando falla una operacion de cache
@@ -28,15 +46,39 @@ class Cache:
         __app_name (str): Nombre del directorio donde se desea guardar archivos en cache
         __obsolescence (int): Numero de dias que un archivo en cache sigue siendo valido
         __cache_dir (str): Ruta completa del subdirectorio que se crea en .my_cache. Por defecto va en ~/.my_cache/<app_name>
+        __max_bytes (int): Tamanio maximo del directorio, al superarlo se eliminan los archivos usados hace mas tiempo
+        __manifest (Manifest): indice sqlite con tamanio, fechas, checksum y url de cada archivo
+        __accessed (dict): ultimos accesos pendientes de guardar en el manifest, nombre -> instante
+        __codec (Codec): codec con el que se comprimen los archivos, por defecto sin compresion
+        __memory (OrderedDict): cache en memoria (L1), nombre -> (datos, mtime del archivo, instante de carga)
+        __memory_bytes (int): tamanio maximo de la cache en memoria, 0 la desactiva
+        __memory_ttl (float): segundos que un dato sigue en memoria, None sin limite
 
     Example:
         >>> cache = Cache("mi app", obsolescence=5)
         >>> cache.set('datos', 'contenido')
     """
-    def __init__(self, app_name:str, obsolescence:int, cache_dir:str=None)->None:
+    def __init__(self, app_name:str, obsolescence:int, cache_dir:str=None, max_bytes:int=None,
+                 codec=None, memory_bytes:int=0, memory_ttl:float=None)->None:
+        # Import local: compression importa CacheError de este modulo
+        from .compression import get_codec
         self.__app_name = app_name
         self.__cache_dir = cache_dir or str(CACHE_DIR/ app_name)
         self.__obsolescence = obsolescence
+        self.__max_bytes = max_bytes
+        # El manifest se abre la primera vez que se necesita, si es nuevo se llena recorriendo el directorio
+        self.__manifest = Manifest(self.__cache_dir)
+        self.__synced = False
+        self.__accessed = {}
+        self.__lock = threading.RLock()
+        self.__codec = get_codec(codec)
+        self.__memory = OrderedDict()
+        self.__memory_bytes = memory_bytes
+        self.__memory_ttl = memory_ttl
+        self.__memory_used = 0
+        self.__hits = 0
+        self.__misses = 0
+        self.__lookups = {'hits': 0, 'misses': 0}
 
     #@property is used to get the value of a private attribute without using any getter methods. \
     #We have to put a line @property in front of the method where we return the private variable.
@@ -56,6 +98,30 @@ class Cache:
     def obsolescence(self)->int:
         return self.__obsolescence
 
+    @property
+    def max_bytes(self)->int:
+        return self.__max_bytes
+
+    @property
+    def codec(self):
+        return self.__codec
+
+    @property
+    def manifest(self):
+        return self.__manifest
+
+    @property
+    def memory_stats(self)->dict:
+        """
+        Estadisticas de la cache en memoria
+
+        Returns:
+            dict: hits, misses, numero de entradas y bytes ocupados
+        """
+        with self.__lock:
+            return {'hits': self.__hits, 'misses': self.__misses,
+                    'entries': len(self.__memory), 'bytes': self.__memory_used}
+
     def __get_file_path(self, name:str)->Path:
         """
         Metodo auxiliar privado que obtiene la ruta del archivo
@@ -67,6 +133,279 @@ class Cache:
         """
         return Path(self.__cache_dir) / name
 
+    def path(self, name:str)->Path:
+        """
+        Metodo que devuelve la ruta en disco de un archivo de la cache, exista o no
+
+        Args:
+            name (str): nombre del archivo
+        Returns:
+            Path: ruta del archivo
+        """
+        return self.__get_file_path(name)
+
+    def __created(self, name:str, stat:os.stat_result=None)->float:
+        """
+        Metodo auxiliar privado que devuelve la fecha de un archivo, de la que depende su obsolescencia.
+        Es la fecha de modificacion, salvo si varias entradas comparten el archivo (enlaces duros):
+        entonces esa fecha es de todas y la propia de cada entrada esta en el manifest
+
+        Args:
+            name (str): nombre del archivo
+            stat (os.stat_result): datos del archivo si ya se han leido
+        Returns:
+            float: instante en que se escribio o se renovo por ultima vez
+        Raises:
+            FileNotFoundError: Si el archivo no existe
+        """
+        stat = stat or self.__get_file_path(name).stat()
+        if stat.st_nlink > 1:
+            entry = self.__index().get(name)
+            if entry is not None:
+                return entry['created']
+        return stat.st_mtime
+
+    def __is_obsolete(self, name:str)->bool:
+        """
+        Metodo auxiliar privado que indica si un archivo supera los dias de obsolescencia
+
+        Args:
+            name (str): nombre del archivo
+        Returns:
+            bool: True si el archivo ha caducado
+        Raises:
+            FileNotFoundError: Si el archivo no existe
+        """
+        return time.time() - self.__created(name) > self.__obsolescence * 86400
+
+    def __memory_get(self, name:str):
+        """
+        Busca un archivo en la cache en memoria, sin acceder al disco
+
+        Args:
+            name (str): nombre del archivo
+        Returns:
+            tuple: (datos, mtime del archivo) o None si no esta, caduco en memoria o es obsoleto
+        """
+        with self.__lock:
+            entry = self.__memory.get(name)
+            if entry is None:
+                return None
+            data, mtime, loaded = entry
+            expired = self.__memory_ttl is not None and time.monotonic() - loaded > self.__memory_ttl
+            if expired or time.time() - mtime > self.__obsolescence * 86400:
+                self.__memory_drop(name)
+                return None
+            self.__memory.move_to_end(name)
+            return data, mtime
+
+    def __memory_put(self, name:str, data:bytes, mtime:float)->None:
+        """
+        Guarda un archivo en la cache en memoria y elimina los usados hace mas tiempo si se supera el limite
+
+        Args:
+            name (str): nombre del archivo
+            data (bytes): contenido ya descomprimido
+            mtime (float): fecha de modificacion del archivo en disco, para calcular la obsolescencia
+        """
+        if len(data) > self.__memory_bytes:
+            return
+        with self.__lock:
+            self.__memory_drop(name)
+            self.__memory[name] = (data, mtime, time.monotonic())
+            self.__memory_used += len(data)
+            while self.__memory_used > self.__memory_bytes:
+                self.__memory_drop(next(iter(self.__memory)))
+
+    def __memory_drop(self, name:str)->None:
+        """ Quita un archivo de la cache en memoria """
+        with self.__lock:
+            entry = self.__memory.pop(name, None)
+            if entry is not None:
+                self.__memory_used -= len(entry[0])
+
+    def __scan(self)->list:
+        """
+        Recorre el directorio una vez
+
+        Returns:
+            list: tuplas (nombre, tamanio, mtime, atime, inodo) de cada archivo
+        """
+        files = []
+        cache_path = Path(self.__cache_dir)
+        if cache_path.exists():
+            for file in cache_path.iterdir():
+                # Los archivos ocultos son de uso interno y no cuentan como entradas
+                if file.is_file() and not file.name.startswith('.'):
+                    stat = file.stat()
+                    files.append((file.name, stat.st_size, stat.st_mtime, stat.st_atime, stat.st_ino))
+        return files
+
+    def __index(self):
+        """
+        Devuelve el manifest, llenandolo con un recorrido del directorio si se acaba de crear
+        (por ejemplo en un directorio escrito por una version anterior)
+
+        Returns:
+            Manifest: indice del directorio
+        """
+        if not self.__synced:
+            with self.__lock:
+                if not self.__synced:
+                    if self.__manifest.created:
+                        self.__manifest.sync(self.__scan())
+                    self.__synced = True
+        return self.__manifest
+
+    def __flush(self)->None:
+        """ Guarda en el manifest los accesos pendientes en una sola transaccion """
+        with self.__lock:
+            accessed, self.__accessed = self.__accessed, {}
+        if accessed:
+            self.__index().touch(accessed)
+
+    def __touch(self, name:str, size:int=None, checksum:str=None, url:str=None, inode:int=None,
+                meta:dict=None)->None:
+        """
+        Marca un archivo como el usado mas recientemente.
+        Si se indica el tamanio el archivo se acaba de escribir y se registra en el manifest;
+        si no, el acceso se guarda en memoria y se escribe junto con otros TOUCH_BATCH accesos
+
+        Args:
+            name (str): nombre del archivo
+            size (int): nuevo tamanio del archivo, opcional
+            checksum (str): sha256 del contenido sin comprimir, opcional
+            url (str): url de la que se descargo el archivo, opcional
+            inode (int): inodo del archivo escrito, opcional
+            meta (dict): metadatos del contenido, opcional
+        """
+        if size is not None:
+            with self.__lock:
+                self.__accessed.pop(name, None)
+            self.__index().put(name, size, checksum=checksum, url=url, codec=self.__codec.name, inode=inode,
+                              meta=meta)
+            return
+        with self.__lock:
+            self.__accessed[name] = time.time()
+            pending = len(self.__accessed)
+        if pending >= TOUCH_BATCH:
+            self.__flush()
+
+    def __stored_codec(self, name:str):
+        """
+        Codec con el que se escribio un archivo, guardado en el manifest. El directorio se puede abrir
+        despues con otro codec: cada archivo se lee con el suyo y los nuevos se escriben con el de la instancia.
+        Las entradas sin codec (escritas por una version anterior) se leen con el de la instancia
+
+        Args:
+            name (str): nombre del archivo
+        Returns:
+            Codec: codec del archivo
+        Raises:
+            CacheError: Si el codec del archivo no esta disponible (por ejemplo falta zstandard)
+        """
+        from .compression import get_codec
+        entry = self.__index().get(name)
+        stored = entry['codec'] if entry is not None else None
+        if stored is None or stored == self.__codec.name:
+            return self.__codec
+        try:
+            return get_codec(stored)
+        except CacheError as e:
+            raise CacheError(f"Error to READ {name}: {e}")
+
+    def __forget(self, name:str)->None:
+        """ Quita un archivo del indice """
+        with self.__lock:
+            self.__accessed.pop(name, None)
+        self.__index().remove(name)
+
+    def __unlink(self, name:str)->bool:
+        """
+        Metodo auxiliar privado que elimina el archivo de una entrada
+
+        Args:
+            name (str): nombre del archivo
+        Returns:
+            bool: True si el archivo existia
+        """
+        file_path = self.__get_file_path(name)
+        try:
+            stat = file_path.stat()
+            file_path.unlink()
+        except FileNotFoundError:
+            return False
+        if stat.st_nlink > 1:
+            self.__release(name, stat.st_ino)
+        return True
+
+    def __replace(self, name:str, source)->Path:
+        """
+        Metodo auxiliar privado que mueve un archivo ya escrito a la entrada, de forma atomica
+
+        Args:
+            name (str): nombre del archivo
+            source (Path): archivo a mover, en el directorio de la cache
+        Returns:
+            Path: ruta de la entrada
+        """
+        file_path = self.__get_file_path(name)
+        try:
+            previous = file_path.stat()
+        except FileNotFoundError:
+            previous = None
+        os.replace(source, file_path)
+        if previous is not None and previous.st_nlink > 1:
+            self.__release(name, previous.st_ino)
+        return file_path
+
+    def __release(self, name:str, inode:int)->None:
+        """
+        Metodo auxiliar privado que se llama cuando una entrada deja de compartir un archivo (enlace duro).
+        Si otra entrada se queda sola con el archivo, su fecha propia del manifest pasa a la fecha de modificacion
+
+        Args:
+            name (str): entrada que deja el archivo
+            inode (int): inodo del archivo compartido
+        """
+        for key, created in self.__index().linked(inode):
+            if key == name:
+                continue
+            file_path = self.__get_file_path(key)
+            try:
+                stat = file_path.stat()
+                if stat.st_ino == inode and stat.st_nlink == 1:
+                    os.utime(file_path, (stat.st_atime, created))
+            except FileNotFoundError:
+                pass
+
+    def __evict(self, keep:str=None)->int:
+        """
+        Elimina los archivos usados hace mas tiempo hasta quedar dentro de max_bytes.
+        Solo se leen del manifest las entradas que se eliminan. Los totales se vuelven a leer tras cada una:
+        borrar una entrada enlazada con otra no libera espacio en disco
+
+        Args:
+            keep (str): archivo que no se debe eliminar (el que se acaba de escribir)
+        Returns:
+            int: numero de archivos eliminados
+        """
+        removed = 0
+        if self.__max_bytes is None:
+            return removed
+        self.__flush()
+        manifest = self.__index()
+        while manifest.totals()[1] > self.__max_bytes:
+            candidates = [name for name, _ in manifest.oldest(2) if name != keep]
+            if not candidates:
+                break
+            name = candidates[0]
+            self.__memory_drop(name)
+            self.__unlink(name)
+            self.__forget(name)
+            removed += 1
+        return removed
+
     # Metodos de la clase Cache
     def set(self, name:str, data:str)->None:
         """
@@ -78,6 +417,28 @@ class Cache:
         Raises:
             CacheError: Si no puede escribir el archivo
         """
+        self.__write(name, data.encode('utf-8'))
+
+    def set_bytes(self, name:str, data:bytes)->None:
+        """
+        Metodo para almacenar datos binarios en cache, comprimidos con el codec de la cache
+
+        Args:
+            name (str): nombre del archivo
+            data (bytes): contenido del mismo
+        Raises:
+            CacheError: Si no puede escribir el archivo
+        """
+        self.__write(name, data)
+
+    def __write(self, name:str, data:bytes)->None:
+        """
+        Metodo auxiliar privado que comprime y escribe un archivo
+
+        Args:
+            name (str): nombre del archivo
+            data (bytes): contenido del mismo
+        """
         # Creates directories if they don't exist
         cache_path = Path(self.__cache_dir) 
         cache_path.mkdir(parents=True, exist_ok=True)
@@ -85,45 +446,352 @@ class Cache:
         # Creates the file path``
         file_path = self.__get_file_path(name)
 
-        # Write data content to file
+        # Se escribe en un archivo temporal oculto y se renombra, asi ningun lector (ni otro proceso)
+        # ve nunca un archivo a medio escribir y un fallo a mitad no deja una entrada truncada
+        self.__memory_drop(name)
+        temp_path = None
+        try:
+            descriptor, temp_path = tempfile.mkstemp(dir=cache_path, prefix=f'.{name}.', suffix='.tmp')
+            with os.fdopen(descriptor, 'wb') as file:
+                file.write(self.__codec.compress(data))
+                file.flush()
+                os.fsync(file.fileno())
+            self.__replace(name, temp_path)
+        except Exception as e:
+            if temp_path is not None and os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise CacheError(f"Error: Cannot WRITE the file {name}: {e}")
+
+        # Actualiza el indice y libera espacio si se supera max_bytes
+        stat = file_path.stat()
+        self.__touch(name, stat.st_size, checksum=hashlib.sha256(data).hexdigest(), inode=stat.st_ino)
+        self.__evict(keep=name)
+
+    def set_file(self, name:str, source, checksum:str=None, url:str=None, deduplicate:bool=False,
+                 meta:dict=None)->None:
+        """
+        Metodo para almacenar en cache un archivo ya escrito en disco, por ejemplo una descarga.
+        El archivo se mueve (o se comprime con el codec) y la entrada solo aparece cuando esta completa.
+        source debe estar en el mismo sistema de archivos que la cache, lo normal es escribirlo en cache_dir
+        con un nombre que empiece por punto para que no cuente como entrada.
+
+        Args:
+            name (str): nombre del archivo en cache
+            source (Path): ruta del archivo a almacenar, deja de existir al terminar
+            checksum (str): sha256 del contenido si ya se conoce (por ejemplo calculado al descargar),
+                si no se calcula leyendo el archivo
+            url (str): url de la que se descargo el archivo, se guarda en el manifest
+            deduplicate (bool): si otra entrada tiene el mismo contenido, se comparte su archivo (ver __deduplicate)
+            meta (dict): metadatos que se guardan en el manifest junto a la entrada y se eliminan con ella,
+                por ejemplo los validadores HTTP de una descarga
+        Raises:
+            CacheError: Si no puede mover o comprimir el archivo
+        """
+        Path(self.__cache_dir).mkdir(parents=True, exist_ok=True)
+        file_path = self.__get_file_path(name)
+        temp_path = None
+        self.__memory_drop(name)
         try:
-            with open(file_path, 'w', encoding='utf-8') as file:
-                file.write(data)
+            if self.__codec.name == 'none':
+                if checksum is None:
+                    digest = hashlib.sha256()
+                    with open(source, 'rb') as src:
+                        for block in iter(lambda: src.read(1 << 20), b''):
+                            digest.update(block)
+                    checksum = digest.hexdigest()
+                self.__replace(name, source)
+            else:
+                # Nombre temporal unico para que dos procesos que escriben la misma entrada no se pisen
+                descriptor, temp_path = tempfile.mkstemp(dir=self.__cache_dir, prefix=f'.{name}.', suffix='.tmp')
+                os.close(descriptor)
+                digest = hashlib.sha256()
+                with open(source, 'rb') as src, self.__codec.open(temp_path, 'wb') as dst:
+                    for block in iter(lambda: src.read(1 << 20), b''):
+                        digest.update(block)
+                        dst.write(block)
+                checksum = checksum or digest.hexdigest()
+                self.__replace(name, temp_path)
+                os.remove(source)
         except Exception as e:
+            if temp_path is not None and os.path.exists(temp_path):
+                os.remove(temp_path)
             raise CacheError(f"Error: Cannot WRITE the file {name}: {e}")
 
+        stat = file_path.stat()
+        self.__touch(name, stat.st_size, checksum=checksum, url=url, inode=stat.st_ino, meta=meta)
+        # Antes de liberar espacio: la entrada enlazada no ocupa mas
+        if deduplicate:
+            self.__deduplicate(name)
+        self.__evict(keep=name)
+
+    def __deduplicate(self, name:str)->None:
+        """
+        Metodo auxiliar privado que guarda el contenido una sola vez aunque se escriba con varios nombres.
+        El checksum del manifest es la direccion del contenido: si otra entrada tiene el mismo checksum, codec
+        y tamanio, el archivo se sustituye por un enlace duro al suyo. Los bytes cuentan una vez en el tamanio
+        de la cache y borrar una entrada no afecta a la otra. Como la fecha del archivo es de las dos,
+        cada una guarda la suya en el manifest y renovar una no renueva la otra.
+        Si el sistema de archivos no admite enlaces duros cada entrada conserva su copia
+
+        Args:
+            name (str): nombre de la entrada recien escrita
+        """
+        manifest = self.__index()
+        entry = manifest.get(name)
+        if entry is None or entry['checksum'] is None:
+            return
+        file_path = self.__get_file_path(name)
+        link_path = file_path.with_name(f'.{name}.link')
+        for key in manifest.find(entry['checksum']):
+            # Los archivos comprimidos con otro codec no tienen los mismos bytes
+            other_entry = manifest.get(key)
+            if key == name or other_entry is None or other_entry['codec'] != entry['codec']:
+                continue
+            other = self.__get_file_path(key)
+            try:
+                stat = other.stat()
+                if stat.st_size != entry['size'] or os.path.samefile(other, file_path):
+                    continue
+                # Hasta ahora la fecha de la otra entrada era la del archivo, a partir de aqui es la del manifest
+                if stat.st_nlink == 1:
+                    manifest.renew(key, stat.st_mtime)
+                os.link(other, link_path)
+                os.replace(link_path, file_path)
+            except OSError:
+                if link_path.exists():
+                    link_path.unlink()
+                continue
+            manifest.link(name, stat.st_ino)
+            return
+
+    @contextmanager
+    def lock(self, name:str):
+        """
+        Bloqueo exclusivo de una entrada, compartido entre hilos y procesos que usan el mismo directorio.
+        Se usa para que solo un proceso genere una entrada mientras los demas esperan y luego la leen.
+        El bloqueo se hace sobre un archivo oculto .<name>.lock que se elimina al liberarlo.
+
+        Args:
+            name (str): nombre del archivo
+        Yields:
+            Path: ruta del archivo de bloqueo
+
+        Example:
+            >>> with cache.lock('datos'):
+            ...     if not cache.exists('datos'):
+            ...         cache.set('datos', 'contenido')
+        """
+        Path(self.__cache_dir).mkdir(parents=True, exist_ok=True)
+        lock_path = Path(self.__cache_dir) / f'.{name}.lock'
+        if fcntl is None:
+            with open(lock_path, 'a+b') as file:
+                file.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+                        break
+                    except OSError:
+                        time.sleep(0.05)
+                try:
+                    yield lock_path
+                finally:
+                    file.seek(0)
+                    msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+            return
+
+        while True:
+            file = open(lock_path, 'a+b')
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+            # Si quien tenia el bloqueo borro el archivo mientras se esperaba, se vuelve a intentar con el nuevo
+            try:
+                if os.fstat(file.fileno()).st_ino == os.stat(lock_path).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            file.close()
+        try:
+            yield lock_path
+        finally:
+            try:
+                os.unlink(lock_path)
+            except FileNotFoundError:
+                pass
+            file.close()
+
     def exists(self, name:str)->bool:
         """
         Metodo para comprobar si existe un archivo en cache.
+        Los archivos que superan los dias de obsolescencia se consideran inexistentes.
 
         Args:
             name (str): nombre del archivo
         Returns:
             bool: Si existe o no el nombre de un archivo en cache
         """
-        return self.__get_file_path(name).exists()
+        if self.__memory_bytes and self.__memory_get(name) is not None:
+            found = True
+        else:
+            try:
+                found = not self.__is_obsolete(name)
+            except FileNotFoundError:
+                found = False
+        with self.__lock:
+            self.__lookups['hits' if found else 'misses'] += 1
+        return found
 
-    def load(self, name:str)->str:
+    def load(self, name:str, check_age:bool=True)->str:
         """
         Metodo que recupera los datos almacenados en cache.
 
         Args:
             name: nombre del archivo
+            check_age (bool): si es False se lee aunque supere los dias de obsolescencia, por ejemplo una entrada
+                que se acaba de escribir o revalidar con obsolescence 0
         Returns:
             str: Datos del archivo
         Raises:
             CacheError: Si el archivo no existe
+            CacheError: Si el archivo ha superado los dias de obsolescencia
             CacheError: Si el archivo no se puede leer
         """
+        try:
+            return self.__read(name, check_age).decode('utf-8')
+        except UnicodeDecodeError as e:
+            raise CacheError(f"Error to READ {name}: {e}")
+
+    def load_bytes(self, name:str, check_age:bool=True)->bytes:
+        """
+        Metodo que recupera los datos binarios almacenados en cache, ya descomprimidos.
+
+        Args:
+            name: nombre del archivo
+            check_age (bool): si es False se lee aunque supere los dias de obsolescencia, por ejemplo una entrada
+                que se acaba de escribir o revalidar con obsolescence 0
+        Returns:
+            bytes: Datos del archivo
+        Raises:
+            CacheError: Si el archivo no existe
+            CacheError: Si el archivo ha superado los dias de obsolescencia
+            CacheError: Si el archivo no se puede leer o descomprimir
+        """
+        return self.__read(name, check_age)
+
+    def __read(self, name:str, check_age:bool=True)->bytes:
+        """
+        Metodo auxiliar privado que lee y descomprime un archivo.
+        load y load_bytes lo usan para que las subclases puedan sobreescribir ambos sin llamarse entre si
+
+        Args:
+            name: nombre del archivo
+            check_age (bool): comprueba que el archivo no es obsoleto
+        Returns:
+            bytes: Datos del archivo
+        """
+        # Primero busca en memoria, si esta no se accede al disco
+        if self.__memory_bytes:
+            entry = self.__memory_get(name)
+            with self.__lock:
+                if entry is not None:
+                    self.__hits += 1
+                    self.__touch(name)
+                    return entry[0]
+                self.__misses += 1
+
         # Build the file path
+        file_path = self.__check(name, check_age)
+        codec = self.__stored_codec(name)
+        try:
+            with open(file_path, 'rb') as file:
+                mtime = self.__created(name, os.fstat(file.fileno()))
+                data = codec.decompress(file.read())
+        except Exception as e:
+            raise CacheError(f"Error to READ {name}: {e}")
+        self.__touch(name)
+        if self.__memory_bytes:
+            self.__memory_put(name, data, mtime)
+        return data
+
+    def __check(self, name:str, check_age:bool=True)->Path:
+        """
+        Metodo auxiliar privado que comprueba que un archivo existe y no es obsoleto antes de leerlo
+
+        Args:
+            name (str): nombre del archivo
+            check_age (bool): si es False solo se comprueba que existe
+        Returns:
+            Path: ruta del archivo
+        Raises:
+            CacheError: Si el archivo no existe o es obsoleto
+        """
         file_path = self.__get_file_path(name)
         if not file_path.exists():
             raise CacheError(f"File {name} does not exist")
+        if check_age and self.__is_obsolete(name):
+            raise CacheError(f"File {name} is obsolete")
+        return file_path
+
+    def open(self, name:str, check_age:bool=True):
+        """
+        Metodo que abre un archivo de la cache como flujo binario, descomprimiendo al vuelo si hay codec.
+        Permite pasar el archivo a un parser (por ejemplo pd.read_csv) sin leerlo entero en memoria.
+
+        Args:
+            name (str): nombre del archivo
+            check_age (bool): si es False se lee aunque supere los dias de obsolescencia, por ejemplo una entrada
+                que se acaba de escribir o revalidar con obsolescence 0
+        Returns:
+            archivo binario de solo lectura, se debe cerrar (usar con with)
+        Raises:
+            CacheError: Si el archivo no existe, es obsoleto o no se puede abrir
+        """
+        entry = self.__memory_get(name) if self.__memory_bytes else None
+        if entry is not None:
+            self.__touch(name)
+            return io.BytesIO(entry[0])
+        file_path = self.__check(name, check_age)
+        codec = self.__stored_codec(name)
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                return file.read()
+            file = codec.open(file_path, 'rb')
         except Exception as e:
-            raise CacheError(f"Error to WRITE {name}: {e}")
+            raise CacheError(f"Error to READ {name}: {e}")
+        self.__touch(name)
+        return file
+
+    def view(self, name:str, check_age:bool=True)->memoryview:
+        """
+        Metodo que devuelve el contenido de un archivo como memoryview sobre un mapeo en memoria (mmap).
+        El sistema operativo carga las paginas al leerlas y no se hace ninguna copia.
+        Si el archivo esta comprimido no se puede mapear: se descomprime y se devuelve una vista de los bytes.
+
+        Args:
+            name (str): nombre del archivo
+            check_age (bool): si es False se lee aunque supere los dias de obsolescencia, por ejemplo una entrada
+                que se acaba de escribir o revalidar con obsolescence 0
+        Returns:
+            memoryview: contenido del archivo, de solo lectura
+        Raises:
+            CacheError: Si el archivo no existe, es obsoleto o no se puede leer
+        """
+        entry = self.__memory_get(name) if self.__memory_bytes else None
+        if entry is not None:
+            self.__touch(name)
+            return memoryview(entry[0])
+        file_path = self.__check(name, check_age)
+        codec = self.__stored_codec(name)
+        try:
+            if codec.name != 'none':
+                with codec.open(file_path, 'rb') as file:
+                    data = file.read()
+            elif file_path.stat().st_size == 0:
+                data = b''
+            else:
+                with open(file_path, 'rb') as file:
+                    # El mapeo sigue vivo mientras exista la vista, el descriptor se puede cerrar
+                    data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception as e:
+            raise CacheError(f"Error to READ {name}: {e}")
+        self.__touch(name)
+        return memoryview(data)
 
     def how_old(self, name:str)->float:
         """
@@ -136,16 +804,76 @@ class Cache:
         Raises:
             CacheError: Si el archivo no existe
         """
-        file_path = self.__get_file_path(name)
-        if not file_path.exists():
-            raise CacheError(f"File {name} does not exist")
+        entry = self.__memory_get(name) if self.__memory_bytes else None
+        if entry is not None:
+            return (time.time() - entry[1]) * 1000
         # Calcular el timestamp
-        calc_time = os.path.getmtime(file_path)
+        try:
+            calc_time = self.__created(name)
+        except FileNotFoundError:
+            raise CacheError(f"File {name} does not exist")
         current_time = time.time()
         age_seconds = current_time - calc_time
         #Returns age in miliseconds
         return age_seconds * 1000
 
+    def renew(self, name:str)->None:
+        """
+        Metodo que reinicia la antiguedad de un archivo, por ejemplo cuando el servidor confirma
+        que el contenido no ha cambiado. Si el archivo lo comparten varias entradas (enlaces duros)
+        no se modifica, solo cambia la fecha de esta entrada en el manifest
+
+        Args:
+            name (str): nombre del archivo
+        Raises:
+            CacheError: Si el archivo no existe
+        """
+        file_path = self.__get_file_path(name)
+        try:
+            if file_path.stat().st_nlink == 1:
+                os.utime(file_path)
+        except FileNotFoundError:
+            raise CacheError(f"File {name} does not exist")
+        self.__index().renew(name)
+        # La copia en memoria guarda la fecha anterior
+        self.__memory_drop(name)
+        self.__touch(name)
+
+    def verify(self, name:str, full:bool=False)->bool:
+        """
+        Metodo que comprueba que un archivo de la cache no esta truncado ni danado antes de usarlo.
+        Por defecto solo compara el tamanio en disco con el guardado en el manifest al escribirlo,
+        sin leer el archivo. Con full tambien recalcula el sha256 del contenido y lo compara con el checksum
+
+        Args:
+            name (str): nombre del archivo
+            full (bool): lee el archivo completo para comparar el checksum
+        Returns:
+            bool: True si el archivo coincide con lo que se escribio, False si no existe o ha cambiado
+        """
+        file_path = self.__get_file_path(name)
+        # Sin pasar por entry, las subclases lo sobreescriben para recibir otro tipo de clave
+        entry = self.__index().get(name)
+        try:
+            size = file_path.stat().st_size
+        except OSError:
+            return False
+        if entry is None or entry['size'] != size:
+            return False
+        # Las entradas recogidas de un directorio escrito por una version anterior no tienen checksum
+        if not full or entry['checksum'] is None:
+            return True
+        digest = hashlib.sha256()
+        try:
+            codec = self.__stored_codec(name)
+            with codec.open(file_path, 'rb') as file:
+                for block in iter(lambda: file.read(1 << 20), b''):
+                    digest.update(block)
+        except Exception:
+            # Un archivo comprimido danado puede fallar al descomprimir con errores propios de cada codec
+            return False
+        return digest.hexdigest() == entry['checksum']
+
     def delete(self, name:str)-> None:
         """
         Metodo que elimina UN archivo en cache
@@ -153,11 +881,11 @@ class Cache:
         Args:
             name (str): nombre del archivo
         """
-        file_path = self.__get_file_path(name)
         # https://stackoverflow.com/questions/42636018/python-difference-between-os-remove-and-os-unlink-and-which-one-to-use
-        if file_path.exists():
-            file_path.unlink()
-    
+        self.__unlink(name)
+        self.__forget(name)
+        self.__memory_drop(name)
+
     def clear(self)->None:
         """
         Metodo que elimina todos los archivos en el directorio especificado
@@ -168,7 +896,90 @@ class Cache:
         cache_path = Path(self.__cache_dir)
         if cache_path.exists():
             for file in cache_path.iterdir():
-                if file.is_file():
+                # Los .lock los elimina quien tiene el bloqueo y el manifest se vacia en vez de borrarse
+                if file.is_file() and file.suffix != '.lock' and not file.name.startswith(MANIFEST_NAME):
                     file.unlink()
+        with self.__lock:
+            self.__accessed = {}
+            self.__memory.clear()
+            self.__memory_used = 0
+        self.__index().clear()
+
+    def size(self)->int:
+        """
+        Metodo que devuelve el tamanio total de los archivos en cache, leido del manifest
+
+        Returns:
+            int: tamanio en bytes
+        """
+        return self.__index().totals()[1]
+
+    def entry(self, name:str)->dict:
+        """
+        Metodo que devuelve los datos de un archivo guardados en el manifest
+
+        Args:
+            name (str): nombre del archivo
+        Returns:
+            dict: key, url, size, created, accessed, checksum, codec, inode y meta, o None si no esta en cache
+        """
+        self.__flush()
+        return self.__index().get(name)
 
+    def entries(self)->list:
+        """
+        Metodo que lista los archivos de la cache a partir del manifest, sin recorrer el directorio
+
+        Returns:
+            list: un dict por archivo (key, url, size, created, accessed, checksum, codec, inode, meta), del usado hace mas tiempo al mas reciente
+        """
+        self.__flush()
+        return self.__index().entries()
+
+    def stats(self)->dict:
+        """
+        Metodo que devuelve estadisticas de la cache: entradas y bytes del manifest, aciertos y fallos de exists()
+        en esta instancia y las estadisticas de la cache en memoria
+
+        Returns:
+            dict: entries, bytes, max_bytes, hits, misses, hit_rate (None si no hay consultas) y memory
+        """
+        entries, size = self.__index().totals()
+        with self.__lock:
+            hits, misses = self.__lookups['hits'], self.__lookups['misses']
+        return {'entries': entries, 'bytes': size, 'max_bytes': self.__max_bytes,
+                'hits': hits, 'misses': misses,
+                'hit_rate': hits / (hits + misses) if hits + misses else None,
+                'memory': self.memory_stats}
+
+    def prune(self, background:bool=False):
+        """
+        Metodo que elimina los archivos obsoletos y, si se supera max_bytes, los usados hace mas tiempo.
+        Vuelve a recorrer el directorio y actualiza el manifest, por lo que tambien recoge archivos
+        copiados o borrados a mano.
+
+        Args:
+            background (bool): si es True la limpieza se ejecuta en un hilo y el metodo retorna inmediatamente
+        Returns:
+            int: numero de archivos eliminados, o el threading.Thread que hace la limpieza si background es True
+        """
+        if background:
+            thread = threading.Thread(target=self.prune, name=f'prune-{self.__app_name}', daemon=True)
+            thread.start()
+            return thread
 
+        removed = 0
+        self.__flush()
+        files = self.__scan()
+        self.__index().sync(files)
+        for name, *_ in files:
+            try:
+                obsolete = self.__is_obsolete(name)
+            except FileNotFoundError:
+                obsolete = True
+            if obsolete:
+                removed += self.__unlink(name)
+                self.__forget(name)
+                self.__memory_drop(name)
+        removed += self.__evict()
+        return removed
@@ -3,14 +3,81 @@
 # Implementacion de CacheURL que gestiona archivos extraidos de internet
 
 from .cache import CacheError, Cache
+from pathlib import Path
+import asyncio
 import hashlib
+import json
+import random
+import re
+import time
 import requests
+import urllib3
+
+# Tamanio de los bloques en que se escribe una descarga
+CHUNK_SIZE = 1 << 20
+
+# Cabeceras de la respuesta que se guardan para revalidar una entrada caducada
+VALIDATORS = ['ETag', 'Last-Modified', 'Content-Length']
+
+# Reintentos de una descarga que falla por un error transitorio y espera base entre ellos en segundos.
+# La espera se duplica en cada intento, hasta BACKOFF_MAX, y se elige al azar entre la mitad y el total
+RETRIES = 3
+BACKOFF = 0.5
+BACKOFF_MAX = 30
+
+# Codigos de respuesta que se reintentan
+RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+
+# Errores de conexion que se reintentan: conexion rechazada o cortada, tiempo agotado y cuerpo incompleto
+TRANSIENT_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                    requests.exceptions.ChunkedEncodingError)
 
 class CacheURL(Cache):
     """
     La clase CacheURL esta creada para manejar datos extraiddos de internet
     Extiende la clase Cache agregando funcionalidades para descargar y guardar datos de internet
+
+    Attributes:
+        __session (requests.Session): sesion compartida, reutiliza las conexiones abiertas (keep-alive)
+        __inflight (dict): descargas asincronas en curso, url -> asyncio.Task
+        __retries (int): reintentos de una descarga que falla por un error transitorio
+        __backoff (float): espera base en segundos entre reintentos
     """
+    def __init__(self, app_name:str, obsolescence:int, cache_dir:str=None, pool_size:int=10,
+                 max_bytes:int=None, codec=None, memory_bytes:int=0, memory_ttl:float=None,
+                 retries:int=RETRIES, backoff:float=BACKOFF)->None:
+        """
+        Constructor de la clase CacheURL
+
+        Args:
+            app_name (str): nombre del directorio de la cache
+            obsolescence (int): dias que un archivo en cache sigue siendo valido
+            cache_dir (str): ruta del directorio de la cache, opcional
+            pool_size (int): numero maximo de conexiones abiertas por host, ajustar al numero de hilos
+            max_bytes (int): tamanio maximo de la cache en bytes, opcional
+            codec (str): compresion de los archivos guardados ('none', 'gzip', 'zstd'), opcional
+            memory_bytes (int): tamanio de la cache en memoria para las urls mas usadas, 0 la desactiva
+            memory_ttl (float): segundos que una url sigue en la cache en memoria, opcional
+            retries (int): reintentos de una descarga ante errores de conexion o respuestas 408, 429 y 5xx
+            backoff (float): espera base en segundos entre reintentos, se duplica en cada intento
+        Raises:
+            CacheError: Si retries o backoff son negativos
+        """
+        if retries < 0 or backoff < 0:
+            raise CacheError(f'Invalid retries ({retries}) or backoff ({backoff})')
+        super().__init__(app_name, obsolescence, cache_dir, max_bytes, codec, memory_bytes, memory_ttl)
+        self.__session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.__session.mount('http://', adapter)
+        self.__session.mount('https://', adapter)
+        self.__inflight = {}
+        self.__retries = retries
+        self.__backoff = backoff
+
+    @property
+    def session(self)->requests.Session:
+        return self.__session
+
     @staticmethod
     def __url_to_hash(url:str) -> str:
         """
@@ -24,6 +91,274 @@ class CacheURL(Cache):
         url_hash = hashlib.md5(url.encode('utf-8')).hexdigest()
         return url_hash
 
+    def __meta_path(self, url_hash: str) -> Path:
+        """
+        Ruta del archivo auxiliar en el que versiones anteriores guardaban las cabeceras de validacion.
+        Ahora se guardan en el manifest junto a la entrada, este archivo solo se lee y se borra
+        """
+        return Path(self.cache_dir) / f'.{url_hash}.meta'
+
+    def __part_paths(self, url_hash: str) -> tuple:
+        """
+        Rutas de una descarga a medias: el contenido recibido y las cabeceras de validacion de la respuesta,
+        que permiten continuarla con If-Range solo si el archivo del servidor no ha cambiado
+        """
+        return Path(self.cache_dir) / f'.{url_hash}.part', Path(self.cache_dir) / f'.{url_hash}.part.meta'
+
+    def metadata(self, url: str) -> dict:
+        """
+        Devuelve las cabeceras de validacion guardadas al descargar una url (ETag, Last-Modified, Content-Length)
+
+        Args:
+            url (str): url de internet
+        Returns:
+            dict: cabeceras guardadas, vacio si no hay
+        """
+        url_hash = self.__url_to_hash(url)
+        entry = super().entry(url_hash)
+        if entry is not None and entry['meta'] is not None:
+            return entry['meta']
+        return self.__read_json(self.__meta_path(url_hash))
+
+    def __conditional_headers(self, url: str) -> dict:
+        """
+        Cabeceras para pedir la url solo si ha cambiado, a partir de los validadores guardados
+
+        Args:
+            url (str): url de internet
+        Returns:
+            dict: If-None-Match y/o If-Modified-Since, vacio si la entrada no esta en disco
+        """
+        if not self.path(url).exists():
+            return {}
+        meta = self.metadata(url)
+        headers = {}
+        if 'ETag' in meta:
+            headers['If-None-Match'] = meta['ETag']
+        if 'Last-Modified' in meta:
+            headers['If-Modified-Since'] = meta['Last-Modified']
+        return headers
+
+    def download(self, url: str) -> int:
+        """
+        Descarga una url a la cache si no esta ya guardada.
+        El contenido se escribe por bloques en un archivo parcial, sin tenerlo entero en memoria,
+        y la entrada solo aparece en la cache cuando la descarga ha terminado.
+        Si la entrada existe pero ha caducado, se pide al servidor solo si ha cambiado (ETag / Last-Modified):
+        con una respuesta 304 se renueva la antiguedad de la entrada sin descargar de nuevo el contenido.
+        Varios procesos que comparten directorio descargan cada url una sola vez (ver Cache.lock).
+        Los cortes de conexion se reintentan y la descarga continua desde el ultimo byte recibido
+        si el servidor admite peticiones Range.
+
+        Args:
+            url (str): url de internet
+        Returns:
+            int: bytes descargados, 0 si la url ya estaba en cache o no ha cambiado
+        Raises:
+            CacheError: Si el status code de response es diferente a 200 (o 304) o falla la conexion en todos los intentos
+        """
+        url_hash = self.__url_to_hash(url)
+        if self.exists(url):
+            return 0
+        # Solo un proceso descarga la url, los demas esperan al bloqueo y encuentran la entrada ya escrita
+        with super().lock(url_hash):
+            if self.exists(url):
+                return 0
+            return self.__download_locked(url, url_hash)
+
+    def __download_locked(self, url: str, url_hash: str) -> int:
+        """
+        Descarga una url con el bloqueo de su entrada ya adquirido.
+        Los errores transitorios (conexion cortada, tiempo agotado, 408, 429 y 5xx) se reintentan hasta retries
+        veces con espera exponencial y aleatoria. Lo ya recibido se conserva en un archivo parcial y el siguiente
+        intento, o la siguiente llamada si se agotan los reintentos, lo continua con una peticion Range
+
+        Args:
+            url (str): url de internet
+            url_hash (str): nombre de la entrada en cache
+        Returns:
+            int: bytes descargados, 0 si la url no ha cambiado
+        Raises:
+            CacheError: Si el status code de response es diferente a 200, 206 o 304, falla la conexion
+                en todos los intentos o el tamanio descargado no coincide con el anunciado
+        """
+        Path(self.cache_dir).mkdir(parents=True, exist_ok=True)
+        headers = self.__conditional_headers(url)
+        # Bytes recibidos en todos los intentos, tambien en los que se cortan
+        progress = {'bytes': 0}
+        for attempt in range(self.__retries + 1):
+            try:
+                self.__fetch(url, url_hash, headers, progress)
+                return progress['bytes']
+            except requests.exceptions.HTTPError as e:
+                status = e.response.status_code if e.response is not None else None
+                if status not in RETRY_STATUS or attempt == self.__retries:
+                    self.__discard_part(url_hash)
+                    raise CacheError(f'Error HTTP {status} to download {url}')
+            except TRANSIENT_ERRORS as e:
+                # El archivo parcial se conserva para continuar la descarga mas tarde
+                if attempt == self.__retries:
+                    raise CacheError(f'Error {e}')
+            except requests.exceptions.RequestException as e:
+                self.__discard_part(url_hash)
+                raise CacheError(f'Error {e}')
+            delay = min(BACKOFF_MAX, self.__backoff * 2 ** attempt)
+            time.sleep(random.uniform(delay / 2, delay))
+
+    def __fetch(self, url: str, url_hash: str, headers: dict, progress: dict) -> bool:
+        """
+        Un intento de descarga. Si hay un archivo parcial con validadores se pide solo lo que falta
+        (Range + If-Range): con 206 se agrega al final y con 200 (el servidor no admite rangos o el archivo
+        ha cambiado) se empieza de cero. La entrada solo aparece en la cache si el tamanio final coincide
+        con el anunciado por el servidor
+
+        Args:
+            url (str): url de internet
+            url_hash (str): nombre de la entrada en cache
+            headers (dict): cabeceras condicionales de la entrada caducada, ver __conditional_headers
+            progress (dict): contador de bytes recibidos, progress['bytes'] se incrementa con cada bloque
+        Returns:
+            bool: True si se ha descargado el contenido, False si no ha cambiado (304)
+        Raises:
+            requests.exceptions.HTTPError: Si la respuesta no es 200, 206 o 304
+            requests.exceptions.ChunkedEncodingError: Si la conexion se corta o faltan bytes
+            CacheError: Si no se puede escribir en la cache
+        """
+        part_path, part_meta_path = self.__part_paths(url_hash)
+        offset = part_path.stat().st_size if part_path.exists() else 0
+        partial = self.__read_json(part_meta_path) if offset else {}
+        request_headers = dict(headers)
+        validator = partial.get('ETag') or partial.get('Last-Modified')
+        if validator:
+            request_headers['Range'] = f'bytes={offset}-'
+            request_headers['If-Range'] = validator
+        else:
+            offset = 0
+
+        with self.__session.get(url, timeout=30, stream=True, headers=request_headers) as response:
+            if response.status_code == 304 and headers:
+                self.__discard_part(url_hash)
+                self.renew(url)
+                return False
+            if response.status_code == 416:
+                # El rango pedido no existe, el archivo parcial no corresponde con el del servidor
+                self.__discard_part(url_hash)
+                raise requests.exceptions.ChunkedEncodingError(f'Range not satisfiable for {url}')
+            if response.status_code == 206:
+                total = self.__content_range(response.headers.get('Content-Range'), offset)
+                mode = 'ab'
+            elif response.status_code == 200:
+                offset = 0
+                total = response.headers.get('Content-Length')
+                mode = 'wb'
+            else:
+                raise requests.exceptions.HTTPError(f'Error HTTP {response.status_code}', response=response)
+            # Con Content-Encoding requests descomprime al vuelo, los bytes no coinciden con los del servidor
+            # y no se puede continuar ni comprobar el tamanio
+            encoded = response.headers.get('Content-Encoding', 'identity') != 'identity'
+            meta = {name: response.headers[name] for name in VALIDATORS if name in response.headers}
+            # Al continuar una descarga el checksum lo calcula set_file leyendo el archivo completo
+            digest = hashlib.sha256() if mode == 'wb' else None
+            try:
+                if mode == 'wb':
+                    # Se guardan antes del contenido para poder continuar si la conexion se corta
+                    self.__write_json(part_meta_path, {} if encoded else meta)
+                with open(part_path, mode) as file:
+                    for chunk in self.__iter_body(response):
+                        file.write(chunk)
+                        if digest is not None:
+                            digest.update(chunk)
+                        progress['bytes'] += len(chunk)
+            except requests.exceptions.RequestException:
+                # Las excepciones de requests heredan de OSError, no son errores de escritura
+                raise
+            except OSError as e:
+                raise CacheError(f'Error: Cannot WRITE the download of {url}: {e}')
+
+        size = part_path.stat().st_size
+        if total is not None and not encoded:
+            if size != int(total):
+                raise requests.exceptions.ChunkedEncodingError(f'Incomplete download of {url}: {size} of {total} bytes')
+            meta['Content-Length'] = str(size)
+        try:
+            # Las urls con el mismo contenido (mirrors, http y https, parametros en otro orden) comparten el archivo.
+            # Las cabeceras van en el manifest, asi se borran con la entrada al desalojarla o al limpiar la cache
+            self.set_file(url_hash, part_path, checksum=digest.hexdigest() if digest else None, url=url,
+                          deduplicate=True, meta=meta)
+            self.__discard_meta(url_hash)
+        except OSError as e:
+            raise CacheError(f'Error: Cannot WRITE the download of {url}: {e}')
+        finally:
+            self.__discard_part(url_hash)
+        return True
+
+    @staticmethod
+    def __iter_body(response: requests.Response):
+        """
+        Recorre el cuerpo de la respuesta por bloques de hasta CHUNK_SIZE bytes.
+        iter_content espera a completar cada bloque y si la conexion se corta pierde lo que ya habia leido;
+        read1 (urllib3 2) devuelve lo que ha llegado, asi el archivo parcial guarda todos los bytes recibidos
+
+        Args:
+            response (requests.Response): respuesta abierta con stream=True
+        Returns:
+            generator: bloques de bytes
+        Raises:
+            requests.exceptions.ChunkedEncodingError: Si la conexion se corta antes de terminar
+            requests.exceptions.ConnectionError: Si se agota el tiempo de lectura
+        """
+        read1 = getattr(response.raw, 'read1', None)
+        if read1 is None:
+            yield from response.iter_content(chunk_size=CHUNK_SIZE)
+            return
+        while True:
+            try:
+                chunk = read1(CHUNK_SIZE, decode_content=True)
+            except urllib3.exceptions.ProtocolError as e:
+                raise requests.exceptions.ChunkedEncodingError(e)
+            except urllib3.exceptions.ReadTimeoutError as e:
+                raise requests.exceptions.ConnectionError(e)
+            if not chunk:
+                return
+            yield chunk
+
+    @staticmethod
+    def __content_range(value: str, offset: int):
+        """
+        Comprueba que una respuesta 206 empieza donde termina el archivo parcial
+
+        Args:
+            value (str): cabecera Content-Range, por ejemplo 'bytes 100-199/200'
+            offset (int): bytes que ya estan en el archivo parcial
+        Returns:
+            int: tamanio total del archivo, None si el servidor no lo indica
+        Raises:
+            requests.exceptions.ChunkedEncodingError: Si el rango no empieza en offset
+        """
+        match = re.match(r'bytes (\d+)-\d+/(\d+|\*)', value or '')
+        if not match or int(match.group(1)) != offset:
+            raise requests.exceptions.ChunkedEncodingError(f'Unexpected Content-Range {value!r} for offset {offset}')
+        return None if match.group(2) == '*' else int(match.group(2))
+
+    def __discard_part(self, url_hash: str) -> None:
+        """ Elimina el archivo parcial de una descarga y sus cabeceras """
+        for path in self.__part_paths(url_hash):
+            if path.exists():
+                path.unlink()
+
+    @staticmethod
+    def __read_json(path: Path) -> dict:
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def __write_json(path: Path, data: dict) -> None:
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(data, file)
+
     def get(self, url: str, **kwargs) -> str:
         """
         Descarga el contenido especificado de una URL de internet
@@ -35,20 +370,61 @@ class CacheURL(Cache):
         Raises:
             CacheError: Si el status code de response es diferente a 200
         """
-        url_hash = self.__url_to_hash(url)
-        if self.exists(url):
-            return self.load(url)
+        self.download(url)
+        # La entrada se acaba de descargar o revalidar, no se vuelve a comprobar su antiguedad
+        return self.load(url, check_age=False)
 
-        # Descarga de internet
-        try:
-            response = requests.get(url, timeout=30)
-            if response.status_code == 200:
-                self.set(url_hash, response.text)
-                return response.text
-            else:
-                raise CacheError(f'Error HTTP {response.status_code} to download {url}')
-        except requests.exceptions.RequestException as e:
-            raise CacheError(f'Error {e}')
+    async def aget(self, url: str) -> str:
+        """
+        Version asincrona de get. La lectura de la cache y la descarga se hacen en un hilo
+        para no bloquear el event loop, usando la sesion compartida.
+        Si la misma url ya se esta descargando, espera a esa descarga en vez de repetirla.
+
+        Args:
+            url (str): url de internet
+        Returns:
+            str: el contenido de la url especificada.
+        Raises:
+            CacheError: Si falla la descarga
+        """
+        loop = asyncio.get_running_loop()
+        task = self.__inflight.get(url)
+        if task is None or task.get_loop() is not loop:
+            task = loop.create_task(self.__download_async(url))
+            self.__inflight[url] = task
+            task.add_done_callback(lambda done: self.__forget(url, done))
+        # shield evita que cancelar a un solo llamador cancele la descarga compartida
+        return await asyncio.shield(task)
+
+    async def __download_async(self, url: str) -> str:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.get, url)
+
+    def __forget(self, url: str, task: asyncio.Task) -> None:
+        if self.__inflight.get(url) is task:
+            del self.__inflight[url]
+
+    async def get_many(self, urls: list, concurrency: int = 8) -> list:
+        """
+        Descarga varias urls de forma concurrente
+
+        Args:
+            urls (list): lista de urls
+            concurrency (int): numero maximo de urls que se procesan a la vez
+        Returns:
+            list: contenido de cada url, en el mismo orden que urls
+        Raises:
+            CacheError: Si falla alguna de las descargas
+        """
+        if concurrency < 1:
+            raise CacheError(f'Invalid concurrency: {concurrency}')
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def bounded(url: str) -> str:
+            async with semaphore:
+                return await self.aget(url)
+
+        return list(await asyncio.gather(*(bounded(url) for url in urls)))
 
     # Seccion que sobreescribe metodos de la clase padre
     def exists(self, url: str, **kwargs) -> bool:
@@ -66,20 +442,85 @@ class CacheURL(Cache):
         # Con super() redefino la clase padre, super accede a la clase padre reusando logica
         return super().exists(url_hash)
 
-    def load(self, url: str, **kwargs) -> str:
+    def load(self, url: str, check_age: bool = True, **kwargs) -> str:
         """
         Recupera los datos ya existentes en cache.
         Transforma la url a hash y carga
-        Sobreescribe el metodo de la clase padre para aceptar url
+        Sobreescribe el metodo de la clase padre para aceptar url.
+        Los archivos se guardan tal como llegan del servidor: se decodifican como utf-8 y, si no es valido,
+        como latin-1 (lo mismo que hace requests con los csv sin charset)
 
         Args:
             url (str): url de internet
+            check_age (bool): si es False se lee aunque la entrada haya caducado
             **kwargs: Argumentos adicionales
         Returns:
             str: El contenido de la url especificada pasada a hash
         """
+        data = self.load_bytes(url, check_age)
+        try:
+            return data.decode('utf-8')
+        except UnicodeDecodeError:
+            return data.decode('latin-1')
+
+    def load_bytes(self, url: str, check_age: bool = True, **kwargs) -> bytes:
+        """
+        Recupera los datos binarios ya existentes en cache, descomprimidos
+        Sobreescribe el metodo de la clase padre para aceptar url
+
+        Args:
+            url (str): url de internet
+            check_age (bool): si es False se lee aunque la entrada haya caducado
+            **kwargs: Argumentos adicionales
+        Returns:
+            bytes: El contenido de la url especificada
+        """
+        url_hash = self.__url_to_hash(url)
+        return super().load_bytes(url_hash, check_age)
+
+    def open(self, url: str, check_age: bool = True, **kwargs):
+        """
+        Abre el archivo de una url como flujo binario
+        Sobreescribe el metodo de la clase padre para aceptar url en vez de nombres de archivo
+
+        Args:
+            url (str): url de internet
+            check_age (bool): si es False se lee aunque la entrada haya caducado
+            **kwargs: Argumentos adicionales
+        Returns:
+            archivo binario de solo lectura, se debe cerrar (usar con with)
+        """
+        url_hash = self.__url_to_hash(url)
+        return super().open(url_hash, check_age)
+
+    def view(self, url: str, check_age: bool = True, **kwargs) -> memoryview:
+        """
+        Devuelve el contenido de una url como memoryview sobre un mapeo en memoria
+        Sobreescribe el metodo de la clase padre para aceptar url en vez de nombres de archivo
+
+        Args:
+            url (str): url de internet
+            check_age (bool): si es False se lee aunque la entrada haya caducado
+            **kwargs: Argumentos adicionales
+        Returns:
+            memoryview: contenido del archivo, de solo lectura
+        """
+        url_hash = self.__url_to_hash(url)
+        return super().view(url_hash, check_age)
+
+    def path(self, url: str, **kwargs) -> Path:
+        """
+        Devuelve la ruta en disco del archivo de una url
+        Sobreescribe el metodo de la clase padre para aceptar url en vez de nombres de archivo
+
+        Args:
+            url (str): url de internet
+            **kwargs: Argumentos adicionales
+        Returns:
+            Path: ruta del archivo en cache
+        """
         url_hash = self.__url_to_hash(url)
-        return super().load(url_hash)
+        return super().path(url_hash)
 
     def how_old(self, url:str, **kwargs) -> float:
         """
@@ -95,6 +536,61 @@ class CacheURL(Cache):
         url_hash = self.__url_to_hash(url)
         return super().how_old(url_hash)
 
+    def entry(self, url: str, **kwargs) -> dict:
+        """
+        Devuelve los datos de la url guardados en el manifest
+        Sobreescribe el metodo de la clase padre para aceptar url en vez de nombres de archivo
+
+        Args:
+            url (str): url de internet
+            **kwargs: Argumentos adicionales
+        Returns:
+            dict: key, url, size, created, accessed, checksum, codec, inode y meta, o None si no esta en cache
+        """
+        url_hash = self.__url_to_hash(url)
+        return super().entry(url_hash)
+
+    def verify(self, url: str, full: bool = False, **kwargs) -> bool:
+        """
+        Comprueba que el archivo de una url no esta truncado ni danado, ver Cache.verify
+        Sobreescribe el metodo de la clase padre para aceptar url en vez de nombres de archivo
+
+        Args:
+            url (str): url de internet
+            full (bool): recalcula el sha256 del contenido ademas de comparar el tamanio
+            **kwargs: Argumentos adicionales
+        Returns:
+            bool: True si el archivo coincide con lo descargado
+        """
+        url_hash = self.__url_to_hash(url)
+        return super().verify(url_hash, full)
+
+    def lock(self, url: str, **kwargs):
+        """
+        Bloqueo exclusivo entre procesos de la entrada de una url
+        Sobreescribe el metodo de la clase padre para aceptar url en vez de nombres de archivo
+
+        Args:
+            url (str): url de internet
+            **kwargs: Argumentos adicionales
+        Returns:
+            context manager que mantiene el bloqueo
+        """
+        url_hash = self.__url_to_hash(url)
+        return super().lock(url_hash)
+
+    def renew(self, url: str, **kwargs) -> None:
+        """
+        Reinicia la antiguedad del archivo de una url
+        Sobreescribe el metodo de la clase padre para aceptar url en vez de nombres de archivo
+
+        Args:
+            url (str): url de internet
+            **kwargs: Argumentos adicionales
+        """
+        url_hash = self.__url_to_hash(url)
+        super().renew(url_hash)
+
     def delete(self, url: str, **kwargs) -> None:
         """
         Elimina el contenido de un archivo en cache
@@ -105,4 +601,28 @@ class CacheURL(Cache):
             **kwargs: Argumentos adicionales
         """
         url_hash = self.__url_to_hash(url)
-        super().delete(url_hash)
\ No newline at end of file
+        super().delete(url_hash)
+        self.__discard_meta(url_hash)
+
+    def __discard_meta(self, url_hash: str) -> None:
+        """ Borra el archivo auxiliar de cabeceras de versiones anteriores, si existe """
+        self.__meta_path(url_hash).unlink(missing_ok=True)
+
+    def prune(self, background: bool = False):
+        """
+        Elimina los archivos obsoletos y los usados hace mas tiempo, ver Cache.prune
+        Sobreescribe el metodo de la clase padre para borrar tambien los archivos auxiliares de cabeceras
+        que dejaron versiones anteriores
+
+        Args:
+            background (bool): si es True la limpieza se ejecuta en un hilo y el metodo retorna inmediatamente
+        Returns:
+            int: numero de archivos eliminados, o el threading.Thread que hace la limpieza si background es True
+        """
+        if background:
+            return super().prune(background)
+        removed = super().prune()
+        for meta_path in Path(self.cache_dir).glob('.*.meta'):
+            if not meta_path.name.endswith('.part.meta'):
+                meta_path.unlink(missing_ok=True)
+        return removed
\ No newline at end of file
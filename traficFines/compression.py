@@ -0,0 +1,119 @@
+# Ivonne Mendoza
+# ivonne@imendoza.io
+# Codecs de compresion para los archivos guardados en cache
+
+import gzip
+import io
+from .cache import CacheError
+
+
+class Codec:
+    """
+    Codec sin compresion, los datos se guardan tal cual.
+    Es la clase base de los demas codecs: compress/decompress trabajan con bytes en memoria
+    y open devuelve un archivo binario que comprime o descomprime al vuelo.
+
+    Attributes:
+        name (str): nombre con el que se registra el codec
+    """
+    name = 'none'
+
+    def compress(self, data:bytes)->bytes:
+        return data
+
+    def decompress(self, data:bytes)->bytes:
+        return data
+
+    def open(self, path, mode:str='rb'):
+        """
+        Abre un archivo en modo binario
+
+        Args:
+            path (Path): ruta del archivo
+            mode (str): 'rb' o 'wb'
+        Returns:
+            archivo binario que lee datos descomprimidos o escribe datos que se comprimen
+        """
+        return open(path, mode)
+
+
+class GzipCodec(Codec):
+    """
+    Codec gzip de la libreria estandar. Comprime bien los csv de multas pero es lento al escribir.
+
+    Attributes:
+        level (int): nivel de compresion entre 1 (rapido) y 9 (mas pequenio)
+    """
+    name = 'gzip'
+
+    def __init__(self, level:int=6):
+        self.level = level
+
+    def compress(self, data:bytes)->bytes:
+        # mtime=0 para que el mismo contenido produzca siempre los mismos bytes
+        return gzip.compress(data, compresslevel=self.level, mtime=0)
+
+    def decompress(self, data:bytes)->bytes:
+        return gzip.decompress(data)
+
+    def open(self, path, mode:str='rb'):
+        if 'w' in mode:
+            return gzip.GzipFile(path, mode, compresslevel=self.level, mtime=0)
+        return gzip.GzipFile(path, mode)
+
+
+class ZstdCodec(Codec):
+    """
+    Codec zstandard, mucho mas rapido que gzip con ratios similares.
+    Necesita la dependencia opcional zstandard (pip install zstandard).
+
+    Attributes:
+        level (int): nivel de compresion, 3 por defecto
+    """
+    name = 'zstd'
+
+    def __init__(self, level:int=3):
+        try:
+            import zstandard
+        except ImportError:
+            raise CacheError("Codec 'zstd' requires the zstandard package: pip install zstandard")
+        self.level = level
+        self.__zstd = zstandard
+
+    def compress(self, data:bytes)->bytes:
+        return self.__zstd.ZstdCompressor(level=self.level).compress(data)
+
+    def decompress(self, data:bytes)->bytes:
+        # stream_reader no necesita que el frame indique el tamanio del contenido
+        with self.__zstd.ZstdDecompressor().stream_reader(io.BytesIO(data)) as reader:
+            return reader.read()
+
+    def open(self, path, mode:str='rb'):
+        return self.__zstd.open(path, mode, cctx=self.__zstd.ZstdCompressor(level=self.level))
+
+
+# Codecs disponibles por nombre
+CODECS = {
+    'none': Codec,
+    'gzip': GzipCodec,
+    'zstd': ZstdCodec,
+}
+
+
+def get_codec(codec=None)->Codec:
+    """
+    Obtiene una instancia de codec a partir de su nombre
+
+    Args:
+        codec (str | Codec): nombre del codec ('none', 'gzip', 'zstd') o una instancia ya creada. None equivale a 'none'
+    Returns:
+        Codec: instancia del codec
+    Raises:
+        CacheError: Si el codec no existe o falta su dependencia
+    """
+    if isinstance(codec, Codec):
+        return codec
+    name = codec or 'none'
+    if name not in CODECS:
+        raise CacheError(f"Unknown codec '{name}', available: {', '.join(CODECS)}")
+    return CODECS[name]()
@@ -0,0 +1,84 @@
+# Ivonne Mendoza
+# ivonne@imendoza.io
+# Cache de DataFrames ya limpios guardados en formato columnar (Feather / Arrow IPC)
+
+from io import BytesIO
+import pandas as pd
+from .cache import Cache, CacheError
+
+
+class FrameCache(Cache):
+    """
+    Extiende la clase Cache para guardar DataFrames en formato Feather.
+    Leer un Feather recupera las columnas con su tipo, sin volver a parsear el csv ni limpiarlo.
+    Necesita la dependencia opcional pyarrow, sin ella available es False y no se guarda nada.
+
+    Example:
+        >>> frames = FrameCache("MadridFines", obsolescence=7)
+        >>> frames.set_frame('clean_2024_03', df)
+        >>> df = frames.load_frame('clean_2024_03')
+    """
+    @property
+    def available(self)->bool:
+        try:
+            import pyarrow
+        except ImportError:
+            return False
+        return True
+
+    def set_frame(self, name:str, df:pd.DataFrame)->None:
+        """
+        Guarda un DataFrame en cache. Feather no admite indices, el indice se guarda como una columna mas
+
+        Args:
+            name (str): nombre del archivo
+            df (pd.DataFrame): DataFrame a guardar
+        Raises:
+            CacheError: Si el DataFrame no se puede convertir a Feather o escribir
+        """
+        buffer = BytesIO()
+        try:
+            df.reset_index().to_feather(buffer)
+        except (ImportError, ValueError, TypeError) as e:
+            raise CacheError(f"Error: Cannot convert {name} to feather: {e}")
+        self.set_bytes(name, buffer.getvalue())
+
+    def load_frame(self, name:str, index:str='FECHA', columns:list=None, check_age:bool=True)->pd.DataFrame:
+        """
+        Recupera un DataFrame guardado con set_frame.
+        Sin compresion el archivo se lee sobre un mapeo en memoria (view): pyarrow solo lee del disco
+        las columnas pedidas. Si esta comprimido se descomprime entero antes de elegir las columnas
+
+        Args:
+            name (str): nombre del archivo
+            index (str): columna que se vuelve a poner como indice
+            columns (list): columnas que se leen, opcional. Por defecto todas
+            check_age (bool): si es False se lee aunque supere los dias de obsolescencia
+        Returns:
+            pd.DataFrame: el DataFrame guardado
+        Raises:
+            CacheError: Si el archivo no existe, es obsoleto o no se puede leer
+        """
+        if columns is not None and index not in columns:
+            columns = [index] + list(columns)
+        try:
+            import pyarrow
+            from pyarrow import feather
+            table = feather.read_table(pyarrow.BufferReader(pyarrow.py_buffer(self.view(name, check_age))),
+                                       columns=columns)
+            df = table.to_pandas()
+        except (ImportError, ValueError, TypeError, OSError) as e:
+            raise CacheError(f"Error to READ {name}: {e}")
+        return df.set_index(index)
+
+    def delete_matching(self, prefix:str, keep:str=None)->None:
+        """
+        Elimina los archivos cuyo nombre empieza por prefix, util para borrar versiones antiguas de una entrada
+
+        Args:
+            prefix (str): prefijo de los nombres a eliminar
+            keep (str): nombre que no se elimina, opcional
+        """
+        for file in self.path(prefix).parent.glob(f'{prefix}*'):
+            if file.name != keep:
+                self.delete(file.name)
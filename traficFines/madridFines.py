@@ -3,13 +3,27 @@
 # Implementacion de MadridFines
 
 from typing import Optional
-from bs4 import BeautifulSoup
+from contextlib import closing, contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from .cache import Cache, CacheError
+from .compression import get_codec
 from .cacheURL import CacheURL # import relativo busca en el paquete
+from .frameCache import FrameCache
+from .metrics import MonthMetrics, IngestReport, tracing, track_memory
+from . import schema
 import requests
 import pandas as pd
-from io import StringIO
+from pathlib import Path
 import datetime
-import matplotlib.pyplot as plt
+import hashlib
+import json
+import multiprocessing
+import operator
+import os
+import re
+import tempfile
+import threading
+import time
 
 # Constantes fuera de la clase
 RAIZ = "https://datos.madrid.es/"
@@ -23,14 +37,212 @@ class MadridError(Exception):
     """
     pass
 
+# Traduce el numero del mes al string que usa el portal, el formato de fecha del sitio es 2025 Junio
+MONTHS = {1: 'Enero', 2: 'Febrero', 3: 'Marzo', 4: 'Abril', 5: 'Mayo', 6: 'Junio', 7: 'Julio',
+          8:'Agosto', 9:'Septiembre',10:'Octubre', 11:'Noviembre', 12:'Diciembre'}
+
+# Nombre con el que se guarda el indice del portal en la cache
+CATALOG_NAME = 'catalog.json'
+
+# Resolucion que pandas asigna a las fechas parseadas desde texto (ns en pandas 2, us en pandas 3).
+# El indice FECHA se construye con esta misma resolucion
+DATE_DTYPE = pd.to_datetime(['01/01/2016 00:00:00'], format='%d/%m/%Y %H:%M:%S').dtype
+
+# Filas de cada bloque al leer un csv, limita la memoria del parseo
+CHUNK_ROWS = 250_000
+
+# Bytes que se leen del csv para detectar su codificacion
+SNIFF_BYTES = 64 * 1024
+
+# Operadores admitidos en las condiciones de query, ademas de 'in' y 'not in'
+OPERATORS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+# Columnas necesarias para construir el indice FECHA, se leen siempre
+INDEX_COLUMNS = {'ANIO', 'MES', 'HORA'}
+
+# Motores de parseo de csv: 'c' es el parser de pandas por bloques, 'pyarrow' lee el mes entero con varios hilos
+ENGINES = ['c', 'pyarrow']
+
+# Metodo de arranque de los procesos de parseo: forkserver evita hacer fork de un proceso con hilos,
+# donde no existe se usa spawn
+START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+# Version de la limpieza de datos. Se debe incrementar cada vez que cambie __clean,
+# asi los DataFrames limpios guardados con la version anterior dejan de usarse
+CLEAN_VERSION = 2
+
+
+def parse_catalog(html:str) -> dict:
+    """
+    Parsea la pagina indice del portal y extrae los links de descarga de todos los meses publicados
+
+    Args:
+        html (str): contenido html de la pagina indice
+    Returns:
+        dict: diccionario (anio, mes) -> url del archivo csv
+    """
+    # Busca textos del tipo "2025 Junio" dentro del titulo de cada elemento
+    pattern = re.compile(r'(\d{4})\s+(' + '|'.join(MONTHS.values()) + ')')
+    month_numbers = {name: number for number, name in MONTHS.items()}
+    # Import local: BeautifulSoup solo se carga cuando hay que leer la pagina del portal
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, 'html.parser')
+
+    urls = {}
+    # Recorre todos los tags li y busca los links asociados de href
+    for li in soup.find_all('li'):
+        titulo = li.find('p', class_='info-title')
+        link = li.find('a', class_='asociada-link')
+        if not titulo or not link or not link.get('href'):
+            continue
+        match = pattern.search(titulo.text)
+        if match:
+            key = (int(match.group(1)), month_numbers[match.group(2)])
+            # Como en la pagina, se queda con el primer link de cada mes
+            urls.setdefault(key, f'{RAIZ}{link.get("href")}')
+    return urls
+
+
+class MadridCatalog:
+    """
+    Indice de los ficheros publicados en el portal del ayuntamiento.
+
+    Descarga y parsea la pagina indice una sola vez, guarda el resultado en cache con su propia caducidad
+    y resuelve las urls de cada mes con una busqueda en diccionario.
+
+    Attributes:
+        __cache (Cache): cache donde se guarda el indice, si es None solo se mantiene en memoria
+        __ttl (float): dias que el indice guardado sigue siendo valido
+        __urls (dict): diccionario (anio, mes) -> url del archivo csv
+        __created (float): timestamp en que se descargo el indice
+        __session (requests.Session): sesion con la que se descarga la pagina, opcional
+        __lock (threading.Lock): evita que varios hilos descarguen el indice caducado a la vez
+
+    Example:
+        >>> catalog = MadridCatalog(Cache("MadridFines", obsolescence=7), ttl=1)
+        >>> catalog.url(2024, 3)
+    """
+    def __init__(self, cache:Optional[Cache]=None, ttl:float=1, session:Optional[requests.Session]=None):
+        self.__cache = cache
+        self.__ttl = ttl
+        self.__session = session or requests
+        self.__urls = None
+        self.__created = 0.0
+        self.__lock = threading.Lock()
+
+    @property
+    def ttl(self)->float:
+        return self.__ttl
+
+    def __expired(self)->bool:
+        return time.time() - self.__created > self.__ttl * 86400
+
+    def __fetch(self)->None:
+        """
+        Descarga la pagina indice del portal, la parsea y la guarda en cache
+
+        Raises:
+            MadridError: Si hay errores al obtener la pagina (codigo diferente a 200)
+        """
+        url = f'{RAIZ}{MADRID_FINES_URL}'
+        try:
+            response = self.__session.get(url, timeout=30)
+        except requests.exceptions.RequestException as e:
+            raise MadridError(f'Error al obtener la URL: {e}')
+        if response.status_code != 200:
+            raise MadridError(f'Error al obtener la URL: {response.status_code}')
+
+        self.__urls = parse_catalog(response.text)
+        self.__created = time.time()
+        if self.__cache is not None:
+            # JSON no admite tuplas como claves, se guardan como "2024-03"
+            data = {f'{year}-{month:02d}': url for (year, month), url in self.__urls.items()}
+            self.__cache.set(CATALOG_NAME, json.dumps(data))
+
+    def __read(self)->bool:
+        """
+        Carga el indice guardado en cache si existe y no ha caducado
+
+        Returns:
+            bool: True si se ha cargado el indice desde la cache
+        """
+        if self.__cache is None or not self.__cache.exists(CATALOG_NAME):
+            return False
+        age_seconds = self.__cache.how_old(CATALOG_NAME) / 1000
+        if age_seconds > self.__ttl * 86400:
+            return False
+        try:
+            data = json.loads(self.__cache.load(CATALOG_NAME))
+        except (CacheError, ValueError):
+            return False
+        self.__urls = {(int(key[:4]), int(key[5:])): url for key, url in data.items()}
+        self.__created = time.time() - age_seconds
+        return True
+
+    @contextmanager
+    def __locked(self):
+        """ Bloqueo de la descarga del indice, entre hilos y, con cache, entre procesos """
+        with self.__lock:
+            if self.__cache is None:
+                yield
+                return
+            with self.__cache.lock(CATALOG_NAME):
+                yield
+
+    def load(self, refresh:bool=False)->dict:
+        """
+        Devuelve el indice completo, descargandolo solo si no hay una copia valida en memoria o en cache.
+        La descarga se hace con un bloqueo: si varios hilos o procesos encuentran el indice caducado,
+        solo uno lo descarga y los demas leen el que ha guardado
+
+        Args:
+            refresh (bool): fuerza la descarga de la pagina indice
+        Returns:
+            dict: diccionario (anio, mes) -> url del archivo csv
+        """
+        if refresh:
+            with self.__locked():
+                self.__fetch()
+        elif self.__urls is None or self.__expired():
+            with self.__locked():
+                if (self.__urls is None or self.__expired()) and not self.__read():
+                    self.__fetch()
+        return self.__urls
+
+    def url(self, year:int, month:int)->str:
+        """
+        Obtiene el link de descarga de un mes
+
+        Args:
+            year (int): anio buscado
+            month (int): mes buscado
+        Returns:
+            str: url del archivo csv correspondiente
+        Raises:
+            MadridError: Si el mes no esta publicado en el portal
+        """
+        urls = self.load()
+        if (year, month) not in urls:
+            raise MadridError(f"No se encontro archivo para la fecha {year} {MONTHS[month]}")
+        return urls[(year, month)]
+
+
 # Función fuera de la clase MadridFines
-def get_url(year:int, month:int) -> str:
+def get_url(year:int, month:int, catalog:Optional[MadridCatalog]=None) -> str:
     """
     Obtiene un link de descarga de la página del ayuntamiento según año y mes especificado
 
     Args:
         year (int): año buscado
         month (int): mes buscado
+        catalog (MadridCatalog): indice ya cargado, opcional. Si no se indica se descarga la pagina indice
     Returns:
         str: Una url con el link de descarga correspondiente al archivo csv de ese año y mes especificado
     Raises:
@@ -46,32 +258,9 @@ def get_url(year:int, month:int) -> str:
     if not 1 <= month <= 12:
         raise MadridError(f"Mes invalido: {month}, debe estar entre 1 y 12")
 
-    # Concatena para formar una url
-    url = f'{RAIZ}{MADRID_FINES_URL}'
-    response = requests.get(url)
-
-    if response.status_code != 200:
-        raise Exception(f'Error al obtener la URL: {response.status_code}')
-    soup = BeautifulSoup(response.text, 'html.parser')
-
-    # Obtiene todos los tags de la url que contengan 'li'
-    listas = soup.find_all('li')
-
-    # Crea diccionario que traduce el número del mes a un string adecuado, el formato de fecha del sitio es 2025 Junio
-    dict_months = {1: 'Enero', 2: 'Febrero', 3: 'Marzo', 4: 'Abril', 5: 'Mayo', 6: 'Junio', 7: 'Julio',
-                   8:'Agosto', 9:'Septiembre',10:'Octubre', 11:'Noviembre', 12:'Diciembre'}
-
-    # Crea un string acorde al formato que pide la url
-    date_string = f'{year} {dict_months[month]}'
-
-    # Recorre todos los tags li y busca los links asociados de href
-    for li in listas:
-        titulo = li.find('p', class_='info-title')
-        if titulo and date_string in titulo.text:
-            h_ref = li.find('a', class_='asociada-link').get('href')
-            url_file = f'{RAIZ}{h_ref}'
-            return url_file
-    raise MadridError(f"No se encontro archivo para la fecha {date_string}")
+    if catalog is None:
+        catalog = MadridCatalog()
+    return catalog.url(year, month)
 
 
 class MadridFines:
@@ -82,57 +271,457 @@ class MadridFines:
 
     Attributes:
         __cacheurl(CacheURL): gestor de la cache.
-        __data (pd.DataFrame): DataFrame vacio para inicializar datos
-        __loaded (list): Lista que guarda tuplas con el formato mes y anio
+        __catalog (MadridCatalog): indice de los ficheros publicados en el portal
+        __frames (FrameCache): cache de los meses ya limpios en formato columnar, None si esta desactivada
+        __partitions (dict): DataFrame limpio de cada mes, (anio, mes) -> pd.DataFrame
+        __loaded (set): Conjunto que guarda tuplas con el formato mes y anio
+        __aggregates (dict): resumenes parciales de cada mes, (anio, mes) -> dict con 'calification',
+            'payment' y 'hours'. Se calculan una vez al agregar el mes y se combinan en cada consulta
+        __frame (pd.DataFrame): union de todas las particiones, se construye al pedir __data y se descarta al
+            agregar o eliminar meses
+        __sink (callable): recibe las metricas de cada mes, sink(name, value, tags). None si no se usa
+        __track_memory (bool): mide el pico de memoria de cada mes con tracemalloc
+        __report (IngestReport): metricas de la ultima llamada a add o add_range
+        __engine (str): motor de parseo de los csv, ver ENGINES
+        __sources (dict): origen de cada mes cargado, (anio, mes) -> (url, checksum del csv). sync lo compara
+            con el catalogo y la cache para saber que meses han cambiado
     """
-    def __init__(self, app_name:str, obsolescence:int):
+    def __init__(self, app_name:str, obsolescence:int, cache_dir:str=None, catalog_ttl:float=1,
+                 pool_size:int=10, max_bytes:int=None, codec=None, frame_cache:bool=True, metrics=None,
+                 track_memory:bool=False, engine:str='c', frame_max_bytes:int=None):
         """
         Constructor de la clase MadridFines
 
         Args:
             app_name (str): nombre del directorio del cache de la aplicacion
             obsolescence (int): dias que los datos de la cache son validos
+            cache_dir (str): directorio de la cache, opcional. Por defecto ~/.my_cache/<app_name>
+            catalog_ttl (float): dias que el indice del portal guardado en cache sigue siendo valido
+            pool_size (int): conexiones abiertas por host, limita las descargas simultaneas de add(workers=N)
+            max_bytes (int): tamanio maximo en bytes de la cache, opcional. Es el total de los csv y de la cache
+                columnar: los csv pueden ocupar max_bytes - frame_max_bytes
+            codec (str): compresion de los csv guardados en cache ('none', 'gzip', 'zstd'), opcional
+            frame_cache (bool): guarda los meses ya limpios en formato Feather para no volver a parsearlos.
+                Necesita pyarrow, si no esta instalado se desactiva
+            metrics (callable): sink de metricas, se llama con sink(name, value, tags) por cada etapa y contador
+                de cada mes cargado (por ejemplo 'stage.parse.seconds' o 'rows'). Se llama desde los hilos de carga
+            track_memory (bool): mide el pico de memoria de cada mes con tracemalloc, hace la carga mas lenta
+            engine (str): motor de parseo de los csv, 'c' (por defecto) o 'pyarrow'. pyarrow parsea con varios
+                hilos pero lee el mes entero de una vez; si no esta instalado se usa 'c'. El resultado es el mismo
+            frame_max_bytes (int): parte de max_bytes para la cache columnar, opcional. Por defecto la mitad,
+                o nada si la cache columnar esta desactivada. Sin max_bytes solo limita la cache columnar
+        Raises:
+            MadridError: si el motor de parseo no existe
+            MadridError: si frame_max_bytes es negativo o mayor que max_bytes
+        """
+        if engine not in ENGINES:
+            raise MadridError(f"Motor de parseo desconocido '{engine}', disponibles: {', '.join(ENGINES)}")
+        if engine == 'pyarrow':
+            try:
+                import pyarrow
+            except ImportError:
+                engine = 'c'
+        if frame_cache:
+            try:
+                import pyarrow
+            except ImportError:
+                frame_cache = False
+
+        # max_bytes es el limite de todo el directorio, se reparte entre los csv y la cache columnar
+        if frame_max_bytes is not None and frame_max_bytes < 0:
+            raise MadridError(f'frame_max_bytes invalido: {frame_max_bytes}')
+        csv_max_bytes = max_bytes
+        if max_bytes is not None:
+            if frame_max_bytes is None:
+                frame_max_bytes = max_bytes // 2 if frame_cache else 0
+            if frame_max_bytes > max_bytes:
+                raise MadridError(f'frame_max_bytes ({frame_max_bytes}) no puede ser mayor que max_bytes ({max_bytes})')
+            csv_max_bytes = max_bytes - frame_max_bytes
+
+        self.__cacheurl = CacheURL(app_name, obsolescence, cache_dir, pool_size=pool_size, max_bytes=csv_max_bytes,
+                                   codec=codec)
+        # El indice va en su propio directorio, fuera de max_bytes: desalojar los csv no lo elimina
+        catalog_cache = Cache(app_name, obsolescence, str(Path(self.__cacheurl.cache_dir) / 'catalog'))
+        self.__catalog = MadridCatalog(catalog_cache, catalog_ttl, self.__cacheurl.session)
+        self.__frames = None
+        if frame_cache:
+            frames = FrameCache(app_name, obsolescence, str(Path(self.__cacheurl.cache_dir) / 'frames'),
+                                frame_max_bytes)
+            if frames.available:
+                self.__frames = frames
+        self.__partitions = {} # inicializa vacio
+        self.__loaded = set() # inicializa conjunto vacio
+        self.__aggregates = {}
+        self.__frame = None
+        self.__sink = metrics
+        self.__track_memory = track_memory
+        self.__report = None
+        self.__engine = engine
+        self.__sources = {}
+
+    @property
+    def __data(self)->pd.DataFrame:
         """
-        self.__cacheurl = CacheURL(app_name, obsolescence)
-        self.__data = pd.DataFrame() # inicializa vacio
-        self.__loaded = [] # inicializa lista vacia
+        Dataset completo. Las particiones se concatenan una sola vez, cuando alguien pide los datos,
+        y el resultado se reutiliza hasta que cambian los meses cargados
+        """
+        if self.__frame is None:
+            if not self.__partitions:
+                self.__frame = pd.DataFrame()
+            else:
+                self.__frame = schema.concat([self.__partitions[key] for key in sorted(self.__partitions)])
+        return self.__frame
+
+    @property
+    def data(self)->pd.DataFrame:
+        return self.__data
+
+    @property
+    def catalog(self)->MadridCatalog:
+        return self.__catalog
+
+    @property
+    def engine(self)->str:
+        """ Motor de parseo en uso, 'c' si se pidio 'pyarrow' y no esta instalado """
+        return self.__engine
 
+    @property
+    def report(self)->IngestReport:
+        """ Metricas de la ultima llamada a add o add_range, None si todavia no se ha cargado nada """
+        return self.__report
 
     @staticmethod
-    def __load(year:int, month:int, cacheurl:CacheURL)->pd.DataFrame:
+    def __load(url:str, year:int, month:int, cacheurl:CacheURL, columns:set=None, where:list=None,
+               metrics:MonthMetrics=None, engine:str='c')->pd.DataFrame:
         """
         Metodo interno y estatico que usa cacheurl para acceder a los datos del anio y mes
-        creando un dataframe de pandas.
+        creando un dataframe de pandas ya limpio.
+        El csv se descarga directo a disco y se lee desde la cache por bloques de CHUNK_ROWS filas,
+        limpiando cada bloque al llegar, para no tener a la vez el texto completo y el DataFrame en memoria.
 
         Args:
+            url (str): url del archivo csv del anio y mes, resuelta con el catalogo
             year (int): anio buscado
             month (int): mes buscado
             cacheurl (CacheURL): URL de la cache
+            columns (set): columnas que se leen del csv (nombres ya limpios), opcional. Por defecto todas
+            where (list): condiciones que se aplican a cada bloque, ver query. Opcional
+            metrics (MonthMetrics): metricas del mes, se anotan las etapas download, parse, clean y concat. Opcional
+            engine (str): motor de parseo, ver ENGINES
         Returns:
             pd.Dataframe: un dataframe de pandas con la informacion de las multas del anio y mes indicado
         Raises:
             MadridError: Si hay problemas al parsear en csv en el apartado try/except
         """
-        # Invoca a get_url para obtener la url del archivo correspondiente al anio y mes
-        url = get_url(year, month)
-        # Obtiene el texto asociado a esa url
-        csv_text = cacheurl.get(url)
-        # Convierte el texto o string a data frame
-        # forma mas simple directo a data frame
-        # df = pd.read_csv(StringIO(csv_text), sep=';', encoding='utf8')
+        metrics = metrics or MonthMetrics(year, month)
+        MadridFines.__download(url, cacheurl, metrics)
+        # El csv se acaba de descargar o revalidar, no se vuelve a comprobar su antiguedad
+        return MadridFines.__read_csv(lambda: cacheurl.open(url, check_age=False), year, month, columns, where,
+                                      metrics, engine)
+
+    @staticmethod
+    def __download(url:str, cacheurl:CacheURL, metrics:MonthMetrics)->Path:
+        """
+        Descarga el csv a la cache si no esta. Un csv que ya estaba en cache se comprueba con verify antes
+        de parsearlo: si esta truncado o ha cambiado en disco se descarta y se vuelve a descargar,
+        en vez de fallar dentro de read_csv
+
+        Args:
+            url (str): url del csv
+            cacheurl (CacheURL): cache del csv
+            metrics (MonthMetrics): metricas del mes, se anotan la etapa download y los contadores de bytes
+        Returns:
+            Path: ruta del csv en la cache
+        """
+        with metrics.stage('download'):
+            downloaded = cacheurl.download(url)
+            if not downloaded and not cacheurl.verify(url):
+                cacheurl.delete(url)
+                downloaded = cacheurl.download(url)
+        metrics.count('bytes_downloaded', downloaded)
+        metrics.count('csv_misses' if downloaded else 'csv_hits')
+        path = cacheurl.path(url)
+        metrics.count('bytes_read', path.stat().st_size)
+        return path
+
+    @staticmethod
+    def __read_csv(open_file, year:int, month:int, columns:set=None, where:list=None,
+                   metrics:MonthMetrics=None, engine:str='c')->pd.DataFrame:
+        """
+        Parsea y limpia el csv de un mes ya guardado en disco, por bloques de CHUNK_ROWS filas con el motor 'c'
+        o en un solo bloque con 'pyarrow'
 
+        Args:
+            open_file (callable): funcion sin argumentos que abre el csv como archivo binario
+            year (int): anio
+            month (int): mes
+            columns (set): columnas que se leen del csv (nombres ya limpios), opcional. Por defecto todas
+            where (list): condiciones que se aplican a cada bloque, ver query. Opcional
+            metrics (MonthMetrics): metricas del mes, se anotan las etapas parse, clean y concat. Opcional
+            engine (str): motor de parseo, ver ENGINES
+        Returns:
+            pd.DataFrame: datos limpios del mes
+        Raises:
+            MadridError: Si hay problemas al parsear el csv
+        """
+        metrics = metrics or MonthMetrics(year, month)
         try:
-            df = pd.read_csv(
-                StringIO(csv_text), sep=';', encoding='latin-1', low_memory=False)
-            return df
+            with open_file() as file:
+                sample = file.read(SNIFF_BYTES)
+            chunks = []
+            with open_file() as file, closing(MadridFines.__chunks(file, sample, columns, engine)) as reader:
+                while True:
+                    with metrics.stage('parse'):
+                        chunk = next(reader, None)
+                    if chunk is None:
+                        break
+                    metrics.count('rows', len(chunk))
+                    with metrics.stage('clean'):
+                        MadridFines.__clean(chunk)
+                        # Las filas que no cumplen las condiciones se descartan antes de leer el siguiente bloque
+                        chunks.append(MadridFines.__filter(chunk, where) if where else chunk)
+        except MadridError:
+            raise
         except Exception as e:
             raise MadridError(f"Problema al parsear CSV de {month} y {year}: {e}")
+        if not chunks:
+            raise MadridError(f"CSV vacio para {month} y {year}")
+        with metrics.stage('concat'):
+            return schema.concat(chunks)
+
+    @staticmethod
+    def __chunks(file, sample:bytes, columns:set=None, engine:str='c'):
+        """
+        Parsea el csv y devuelve sus bloques. El parser lee los bytes del archivo directamente con la codificacion
+        detectada, sin pasar por un str intermedio, y las columnas no pedidas no llegan a parsearse
+
+        Args:
+            file: csv abierto en modo binario
+            sample (bytes): primeros bytes del archivo, para detectar la codificacion y leer la cabecera
+            columns (set): columnas que se leen (nombres ya limpios), opcional. Por defecto todas
+            engine (str): 'c' devuelve bloques de CHUNK_ROWS filas, 'pyarrow' un solo bloque parseado con varios hilos
+        Returns:
+            generator: DataFrames sin limpiar
+        """
+        encoding = MadridFines.__sniff_encoding(sample)
+        if engine == 'pyarrow':
+            # pyarrow no admite una funcion en usecols, los nombres originales se sacan de la cabecera
+            usecols = None
+            if columns is not None:
+                header = sample.split(b'\n', 1)[0].decode(encoding).rstrip('\r').split(';')
+                usecols = [name for name in header if name.strip().replace('-', '_') in columns]
+            yield pd.read_csv(file, sep=';', encoding=encoding, engine='pyarrow', usecols=usecols)
+            return
+        usecols = None
+        if columns is not None:
+            usecols = lambda name: name.strip().replace('-', '_') in columns
+        with pd.read_csv(file, sep=';', encoding=encoding, chunksize=CHUNK_ROWS, usecols=usecols) as reader:
+            yield from reader
+
+    @staticmethod
+    def parse_file(path:str, year:int, month:int, codec:str, output:str, engine:str='c')->tuple:
+        """
+        Parsea y limpia el csv de un mes desde su ruta en la cache y escribe el resultado en output en formato
+        Feather (Arrow IPC). Es la tarea que ejecutan los procesos de add(processes=N): el DataFrame limpio
+        vuelve al proceso principal como archivo, sin serializarlo con pickle.
+        Es publico porque el pool de procesos importa la funcion por su nombre
+
+        Args:
+            path (str): ruta del csv en la cache
+            year (int): anio
+            month (int): mes
+            codec (str): nombre del codec con el que esta guardado el csv
+            output (str): ruta del archivo Feather que se escribe
+            engine (str): motor de parseo, ver ENGINES
+        Returns:
+            tuple: (segundos de cada etapa, contadores) para agregarlos a las metricas del mes
+        Raises:
+            MadridError: Si hay problemas al parsear el csv o escribir el resultado
+        """
+        metrics = MonthMetrics(year, month)
+        codec = get_codec(codec)
+        df = MadridFines.__read_csv(lambda: codec.open(path), year, month, metrics=metrics, engine=engine)
+        try:
+            with metrics.stage('frame_write'):
+                df.reset_index().to_feather(output)
+        except (ImportError, ValueError, TypeError, OSError) as e:
+            raise MadridError(f"Problema al escribir el mes {month}/{year} en formato Feather: {e}")
+        return metrics.stages, metrics.counters
+
+    @staticmethod
+    def __filter(df:pd.DataFrame, where:list)->pd.DataFrame:
+        """
+        Devuelve las filas que cumplen todas las condiciones
+
+        Args:
+            df (pd.DataFrame): datos limpios
+            where (list): lista de tuplas (columna, operador, valor). FECHA se refiere al indice
+        Returns:
+            pd.DataFrame: filas que cumplen las condiciones
+        """
+        mask = pd.Series(True, index=df.index)
+        for column, op, value in where:
+            values = pd.Series(df.index, index=df.index) if column == 'FECHA' else df[column]
+            if op in ('in', 'not in'):
+                condition = values.isin(list(value))
+                mask &= ~condition if op == 'not in' else condition
+            else:
+                mask &= OPERATORS[op](values, value)
+        return df[mask.to_numpy()]
+
+    @staticmethod
+    def __sniff_encoding(sample:bytes)->str:
+        """
+        Detecta la codificacion del csv a partir de sus primeros bytes. El portal publica en latin-1,
+        pero las versiones anteriores del paquete guardaban en cache el texto recodificado en utf-8
+
+        Args:
+            sample (bytes): primeros bytes del archivo
+        Returns:
+            str: 'utf-8' si hay caracteres no ascii y son utf-8 valido, 'latin-1' en otro caso
+        """
+        if sample.isascii():
+            return 'latin-1'
+        try:
+            # El ultimo caracter puede estar cortado por el tamanio de la muestra
+            sample.decode('utf-8')
+        except UnicodeDecodeError as e:
+            return 'utf-8' if e.reason == 'unexpected end of data' else 'latin-1'
+        return 'utf-8'
+
+    @staticmethod
+    def __frame_name(year:int, month:int, url:str, cacheurl:CacheURL)->str:
+        """
+        Nombre del DataFrame limpio de un mes en la cache columnar.
+        Incluye las versiones de limpieza y de esquema y una huella del contenido del csv en cache (su checksum
+        en el manifest), de modo que si el csv cambia o cambia la limpieza el nombre ya no coincide.
+        La fecha del archivo no forma parte de la huella: una revalidacion 304 la renueva sin cambiar el contenido.
+        Las entradas sin checksum (escritas por versiones anteriores) usan el tamanio y la fecha de escritura
+
+        Args:
+            year (int): anio
+            month (int): mes
+            url (str): url del csv
+            cacheurl (CacheURL): cache del csv
+        Returns:
+            str: nombre del archivo, por ejemplo clean_2024_03_v2.1_<huella>.feather
+        """
+        entry = cacheurl.entry(url)
+        if entry is not None and entry['checksum'] is not None:
+            raw = f'{url}|{entry["checksum"]}'
+        else:
+            stat = cacheurl.path(url).stat()
+            raw = f'{url}|{stat.st_size}|{stat.st_mtime_ns}'
+        fingerprint = hashlib.md5(raw.encode('utf-8')).hexdigest()[:16]
+        return f'clean_{year}_{month:02d}_v{CLEAN_VERSION}.{schema.SCHEMA_VERSION}_{fingerprint}.feather'
+
+    def __load_month(self, year:int, month:int, metrics:MonthMetrics, pool=None)->pd.DataFrame:
+        """
+        Obtiene el DataFrame limpio de un mes. Si ya se limpio antes y el csv no ha cambiado, lo lee
+        de la cache columnar; si no, parsea el csv, lo limpia y lo guarda para la proxima vez
+
+        Args:
+            year (int): anio
+            month (int): mes
+            metrics (MonthMetrics): metricas del mes
+            pool (ProcessPoolExecutor): procesos donde se parsea el csv, opcional. Por defecto en el hilo actual
+        Returns:
+            pd.DataFrame: datos limpios del mes
+        """
+        url = self.__catalog.url(year, month)
+        if self.__frames is not None and self.__cacheurl.exists(url):
+            name = self.__frame_name(year, month, url, self.__cacheurl)
+            if self.__frames.exists(name):
+                try:
+                    with metrics.stage('frame_read'):
+                        df = self.__frames.load_frame(name)
+                    metrics.count('frame_hits')
+                    metrics.count('bytes_read', self.__frames.path(name).stat().st_size)
+                    metrics.count('rows', len(df))
+                    return df
+                except CacheError:
+                    # Archivo danado, se vuelve a generar desde el csv
+                    self.__frames.delete(name)
+
+        if pool is not None:
+            return self.__load_in_process(url, year, month, metrics, pool)
+
+        df = self.__load(url, year, month, self.__cacheurl, metrics=metrics, engine=self.__engine)
+
+        if self.__frames is not None:
+            metrics.count('frame_misses')
+            name = self.__frame_name(year, month, url, self.__cacheurl)
+            try:
+                with metrics.stage('frame_write'):
+                    self.__frames.set_frame(name, df)
+                # Elimina las versiones anteriores del mismo mes
+                self.__frames.delete_matching(f'clean_{year}_{month:02d}_', keep=name)
+            except CacheError:
+                # La cache columnar es una optimizacion, si falla se sigue con el DataFrame en memoria
+                pass
+        return df
+
+    def __load_in_process(self, url:str, year:int, month:int, metrics:MonthMetrics, pool)->pd.DataFrame:
+        """
+        Descarga el csv en el hilo actual y lo parsea y limpia en un proceso del pool con parse_file.
+        El proceso escribe el resultado en Feather junto a la cache columnar, de modo que el archivo pasa
+        a ser la entrada del mes sin volver a escribirlo. Sin cache columnar se usa un archivo temporal
+
+        Args:
+            url (str): url del csv
+            year (int): anio
+            month (int): mes
+            metrics (MonthMetrics): metricas del mes
+            pool (ProcessPoolExecutor): procesos de parseo
+        Returns:
+            pd.DataFrame: datos limpios del mes
+        """
+        path = self.__download(url, self.__cacheurl, metrics)
+        # El csv se lee con el codec con el que se guardo, puede no ser el de esta instancia
+        entry = self.__cacheurl.entry(url)
+        codec = entry['codec'] if entry is not None and entry['codec'] is not None else self.__cacheurl.codec.name
+
+        name = self.__frame_name(year, month, url, self.__cacheurl)
+        directory = None
+        if self.__frames is not None:
+            directory = Path(self.__frames.cache_dir)
+            directory.mkdir(parents=True, exist_ok=True)
+        # Nombre oculto: mientras el proceso escribe no cuenta como entrada de la cache
+        descriptor, output = tempfile.mkstemp(dir=directory, prefix=f'.{name}.', suffix='.tmp')
+        os.close(descriptor)
+        try:
+            stages, counters = pool.submit(MadridFines.parse_file, str(path), year, month,
+                                           codec, output, self.__engine).result()
+            for stage, seconds in stages.items():
+                metrics.stages[stage] = metrics.stages.get(stage, 0.0) + seconds
+            for counter, value in counters.items():
+                metrics.count(counter, value)
+
+            if self.__frames is not None:
+                metrics.count('frame_misses')
+                try:
+                    self.__frames.set_file(name, output)
+                    with metrics.stage('frame_read'):
+                        df = self.__frames.load_frame(name, check_age=False)
+                    self.__frames.delete_matching(f'clean_{year}_{month:02d}_', keep=name)
+                    return df
+                except CacheError:
+                    # Si no se puede guardar en la cache columnar se lee el archivo temporal
+                    if not os.path.exists(output):
+                        raise
+            with metrics.stage('frame_read'):
+                return pd.read_feather(output).set_index('FECHA')
+        except CacheError as e:
+            raise MadridError(f"Problema al leer el mes {month}/{year} parseado en otro proceso: {e}")
+        finally:
+            if os.path.exists(output):
+                os.remove(output)
 
     @staticmethod
     def __clean(df:pd.DataFrame)-> None:
         """
         Metodo que limpia el dataframe de pandas creado en load (elimina espacios, convierte a numero,
-        cambia formato de nombres de columnas.
+        cambia formato de nombres de columnas) y aplica los tipos compactos de schema.SCHEMA.
 
         Args:
             df (pd.DataFrame): dataframe de pandas
@@ -141,51 +730,224 @@ class MadridFines:
         text_columns = ['CALIFICACION','DESCUENTO', 'HECHO_BOL', 'DENUNCIANTE', 'LUGAR']
         numeric_s_columns = ['VEL_LIMITE', 'VEL_CIRCULA']
         numeric_direct = ['COORDENADA_X', 'COORDENADA_Y']
-        # Elimina espacios en blanco de los nombres de las columnas
-        df.rename(columns=lambda x: x.strip(), inplace=True)
+        # Elimina espacios en blanco y normaliza guiones de los nombres de las columnas
+        df.columns = [column.strip().replace('-', '_') for column in df.columns]
 
-        # Normalizar guiones de los nombres de las columnas
-        df.columns = df.columns.str.replace('-', '_')
+        # Las consultas pueden leer solo algunas columnas
+        text_columns = [column for column in text_columns if column in df.columns]
+        numeric_s_columns = [column for column in numeric_s_columns if column in df.columns]
+        numeric_direct = [column for column in numeric_direct if column in df.columns]
 
-        #Limpia espacios en blanco de la columna calificacion
-        df[text_columns] = df[text_columns].apply(lambda x: pd.Series(x.str.strip()))
+        # Convierte los textos a category, los espacios se eliminan sobre los valores distintos
+        for column in text_columns:
+            df[column] = schema.to_category(df[column])
 
         # Transforma de string a numerico las columnas indicadas
-        df[numeric_s_columns] = df[numeric_s_columns].apply(lambda x: pd.to_numeric(x.str.strip(), errors='coerce'))
+        for column in numeric_s_columns:
+            values = df[column]
+            if not pd.api.types.is_numeric_dtype(values):
+                values = values.str.strip()
+            df[column] = pd.to_numeric(values, errors='coerce')
 
         # Mismo caso con las coordenadas
-        df[numeric_direct] = df[numeric_direct].apply(pd.to_numeric, errors='coerce')
+        for column in numeric_direct:
+            df[column] = pd.to_numeric(df[column], errors='coerce')
+
+        # Crea el indice de fechas con aritmetica entera, sin pasar por strings.
+        # HORA viene como horas.minutos (8.30 son las 8:30), los minutos se calculan igual que antes
+        # para obtener exactamente el mismo resultado
+        hours = df['HORA'].astype(int)
+        minutes = ((df['HORA'] - hours) * 100).astype(int)
+        months = (df['ANIO'].to_numpy(dtype='int64') - 1970) * 12 + df['MES'].to_numpy(dtype='int64') - 1
+        offsets = (hours.to_numpy(dtype='int64') * 60 + minutes.to_numpy(dtype='int64')).astype('timedelta64[m]')
+        dates = months.astype('datetime64[M]').astype(DATE_DTYPE) + offsets
+        df.index = pd.DatetimeIndex(dates, name='FECHA')
+
+        # Reduce el tamanio de las columnas numericas
+        schema.apply_schema(df)
 
-        # Crea la columna fecha
-        df['FECHA'] = pd.to_datetime({
-            'year': df['ANIO']
-            , 'month': df['MES']
-            , 'day': 1
-            , 'hour': df['HORA'].astype(int)
-            , 'minute': ((df['HORA'] - df['HORA'].astype(int)) * 100).astype(int)
-        })
 
-        # Cambio el formato de fecha a dia mes anio mas la hora
-        df['FECHA'] = df['FECHA'].dt.strftime('%d/%m/%Y %H:%M:%S')
+    @staticmethod
+    def __aggregate(df:pd.DataFrame)->dict:
+        """
+        Calcula los resumenes parciales de un mes que usan fines_calification, total_payment y fines_hour
+
+        Args:
+            df (pd.DataFrame): datos limpios de un mes
+        Returns:
+            dict: 'calification' (conteos por MES, ANIO y CALIFICACION), 'payment' (recaudacion por MES y ANIO)
+                y 'hours' (conteos por hora y anio-mes)
+        """
+        calification = df.groupby(['MES', 'ANIO', 'CALIFICACION'], observed=True).size().reset_index(name='count')
 
-        # Setea fecha como indice y con esto la columna fecha desaparece automaticamente
-        df.set_index('FECHA', inplace=True)
+        # IMP_BOL se guarda como float32, se suma en float64 para no perder precision en totales grandes
+        payments = df[['MES', 'ANIO']].assign(IMP_BOL=df['IMP_BOL'].astype('float64'))
+        # La recaudacion minima tb se puede calcular por fuera y agregarlo despues al dataset pero queria probar mas con lambda
+        payment = payments.groupby(['MES', 'ANIO']).agg(
+            rec_maxima=('IMP_BOL', 'sum'),
+            rec_minima=('IMP_BOL', lambda x: x.sum() * 0.5)
+        )
 
-        # Convierto indice a DateTimeIndex
-        if not isinstance(df.index, pd.DatetimeIndex):
-            df.index = pd.to_datetime(df.index, format='%d/%m/%Y %H:%M:%S')
+        # Extrae hora, mes y año del indice
+        anio_mes = df.index.year.astype(str) + '-' + df.index.month.astype(str).str.zfill(2)
+        hours = pd.DataFrame({'horas': df.index.hour, 'anio_mes': anio_mes})
+        hours = hours.groupby(['horas', 'anio_mes']).size()
 
+        return {'calification': calification, 'payment': payment, 'hours': hours}
 
-    def add(self, year: int, month: Optional[int] = None) -> None:
+    def __ingest_month(self, year:int, month:int, report:IngestReport, pool=None, revalidate:bool=False)->tuple:
+        """
+        Carga un mes y calcula sus resumenes parciales, se ejecuta en los hilos de __ingest.
+        Las metricas del mes se agregan al informe y se envian al sink, tambien si la carga falla
+
+        Args:
+            year (int): anio
+            month (int): mes
+            report (IngestReport): informe de la carga en curso
+            pool (ProcessPoolExecutor): procesos donde se parsea el csv, opcional
+            revalidate (bool): el mes ya esta cargado, solo se vuelve a cargar si su csv ha cambiado
+        Returns:
+            tuple: (DataFrame limpio del mes, dict de resumenes, (url, checksum) del csv),
+                o None si el mes no ha cambiado
+        """
+        if revalidate and not self.__changed(year, month, self.__catalog.url(year, month)):
+            return None
+        metrics = MonthMetrics(year, month)
+        try:
+            with track_memory(metrics):
+                df = self.__load_month(year, month, metrics, pool)
+                with metrics.stage('aggregate'):
+                    aggregates = self.__aggregate(df)
+            metrics.count('frame_bytes', int(df.memory_usage(deep=True).sum()))
+        finally:
+            report.add(metrics)
+            if self.__sink is not None:
+                metrics.emit(self.__sink)
+        url = self.__catalog.url(year, month)
+        entry = self.__cacheurl.entry(url)
+        return df, aggregates, (url, entry['checksum'] if entry else None)
+
+    def __merge(self, name:str)->list:
+        """
+        Devuelve los resumenes parciales de todos los meses cargados, en orden cronologico
+
+        Args:
+            name (str): 'calification', 'payment' o 'hours'
+        Returns:
+            list: resumenes parciales
+        Raises:
+            MadridError en caso de no existir datos cargados
+        """
+        if not self.__partitions:
+            raise MadridError(f'Datos no encontrados')
+        return [self.__aggregates[key][name] for key in sorted(self.__aggregates)]
+
+    def __ingest(self, months:list, workers:int, processes:int=0, revalidate:set=frozenset(),
+                 report:IngestReport=None)->IngestReport:
+        """
+        Descarga, parsea y limpia los meses indicados en un pool de hilos y los agrega al dataset.
+        Con processes el parseo y la limpieza (que no liberan el GIL) se hacen en un pool de procesos,
+        los hilos solo descargan y esperan el resultado.
+        El dataset solo se actualiza una vez, cuando todos los meses se han cargado sin errores.
+
+        Args:
+            months (list): lista de tuplas (anio, mes)
+            workers (int): numero maximo de hilos que descargan en paralelo
+            processes (int): numero de procesos que parsean en paralelo, 0 para parsear en los hilos.
+                Los resultados vuelven en formato Feather, sin pyarrow se parsea en los hilos
+            revalidate (set): meses ya cargados que se vuelven a cargar si su csv ha cambiado, opcional.
+                La comprobacion (que puede hacer una peticion condicional) se hace en los mismos hilos
+            report (IngestReport): informe donde se anotan las metricas, por defecto uno nuevo
+        Returns:
+            IngestReport: metricas de la carga, tambien disponibles en la propiedad report
+        Raises:
+            MadridError: con el detalle de todos los meses que han fallado
+        """
+        report = report or IngestReport()
+        self.__report = report
+        pending = [(year, month) for year, month in months
+                   if (month, year) not in self.__loaded or (year, month) in revalidate]
+        if not pending:
+            return report
+        if workers < 1:
+            raise MadridError(f'Numero de workers invalido: {workers}')
+        if processes < 0:
+            raise MadridError(f'Numero de procesos invalido: {processes}')
+        if processes:
+            try:
+                import pyarrow
+            except ImportError:
+                processes = 0
+
+        frames = {}
+        errors = {}
+        with report.stage('total'), tracing(self.__track_memory):
+            # El catalogo se descarga una sola vez y se reutiliza para todos los meses
+            with report.stage('catalog'):
+                self.__catalog.load()
+
+            # Los procesos solo se arrancan si hay algun mes que cargar
+            processes = min(processes, len(pending))
+            parsers = None
+            if processes:
+                parsers = ProcessPoolExecutor(processes, multiprocessing.get_context(START_METHOD))
+            try:
+                # Los hilos comparten la sesion (y el pool de conexiones) de cacheurl.
+                # Con procesos hace falta al menos un hilo por proceso para mantenerlos ocupados
+                with ThreadPoolExecutor(max_workers=max(workers, processes)) as pool:
+                    futures = {pool.submit(self.__ingest_month, year, month, report, parsers,
+                                           (year, month) in revalidate): (year, month)
+                               for year, month in pending}
+                    for future in as_completed(futures):
+                        key = futures[future]
+                        try:
+                            result = future.result()
+                        except Exception as e:
+                            errors[key] = e
+                            continue
+                        if result is not None:
+                            frames[key] = result
+            finally:
+                if parsers is not None:
+                    parsers.shutdown()
+        report.errors.update((key, str(error)) for key, error in errors.items())
+        if self.__sink is not None:
+            for stage, seconds in report.stages.items():
+                self.__sink(f'stage.{stage}.seconds', seconds, {})
+
+        if errors:
+            detail = '; '.join(f'{month}/{year}: {errors[(year, month)]}' for year, month in sorted(errors))
+            raise MadridError(f'Error al cargar {len(errors)} de {len(pending)} meses: {detail}')
+        if not frames:
+            return report
+
+        # Cada mes se guarda como una particion, el dataset completo se construye al pedirlo
+        # Un mes que se vuelve a cargar sustituye a su particion y a sus resumenes, el resto no se toca
+        self.__partitions.update((key, df) for key, (df, _, _) in frames.items())
+        self.__aggregates.update((key, aggregates) for key, (_, aggregates, _) in frames.items())
+        self.__sources.update((key, source) for key, (_, _, source) in frames.items())
+        self.__loaded.update((month, year) for year, month in frames)
+        self.__frame = None
+        return report
+
+    def add(self, year: int, month: Optional[int] = None, workers: int = 1, processes: int = 0) -> IngestReport:
         """
         Agrega multas de un mes o anio especificado al dataset
 
         Args:
             year (int): anio buscado
-            month (int): mes buscado, opcional. Si no se especifica mes, carga el anio completo
+            month (int): mes buscado, opcional. Si no se especifica mes, carga los meses del anio publicados
+                en el portal (el anio completo salvo el anio en curso)
+            workers (int): numero de meses que se descargan en paralelo, por defecto 1
+            processes (int): numero de procesos que parsean y limpian meses en paralelo, por defecto 0
+                (se parsea en los hilos). Util al cargar muchos meses en una maquina con varios nucleos
+        Returns:
+            IngestReport: tiempo de cada etapa, bytes, filas y aciertos de cache de cada mes cargado
         Raises:
             MadridError: en caso de ingresar un mes que no existe en el rango 1 a 12
             MadridError: en caso de ingresar un anio fuera de rango (2016, anio actual)
+            MadridError: si no se especifica mes y el anio no tiene ningun mes publicado
+            MadridError: si falla la carga de algun mes, en ese caso no se agrega ninguno
         """
         # Valida el mes
         if month is not None and not (1 <= month <= 12):
@@ -195,53 +957,252 @@ class MadridFines:
             raise MadridError(f'Anio fuera de rango: {year}')
 
         if month is None:
-            months = list(range(1, 13))
+            # Solo los meses publicados, el anio en curso no esta completo
+            months = sorted(m for y, m in self.__catalog.load() if y == year)
+            if not months:
+                raise MadridError(f'No hay meses publicados en el portal para el anio {year}')
         else:
             months = [month]
 
-        for m in months:
-            if(m, year) not in self.__loaded:
-                df_new = self.__load(year, m, self.__cacheurl)
-                self.__clean(df_new)
-                self.__data = pd.concat([self.__data, df_new], ignore_index=False)
-                self.__loaded.append((m, year))
+        return self.__ingest([(year, m) for m in months], workers, processes)
 
-    def fines_hour(self, fig_name: str) -> None:
+    def add_range(self, start: tuple, end: tuple, workers: int = 1, processes: int = 0) -> IngestReport:
         """
-        Metodo que genera un grafico a partir de los datos previamente guardados con las multas por hora y fecha
+        Agrega al dataset todos los meses entre dos fechas, ambas incluidas
 
         Args:
-            fig_name (str): Nombre del grafico
+            start (tuple): primer mes a cargar como (anio, mes)
+            end (tuple): ultimo mes a cargar como (anio, mes)
+            workers (int): numero de meses que se descargan en paralelo, por defecto 1
+            processes (int): numero de procesos que parsean y limpian meses en paralelo, por defecto 0
+        Returns:
+            IngestReport: tiempo de cada etapa, bytes, filas y aciertos de cache de cada mes cargado
         Raises:
-             MadridError en caso de no existir datos cargados
+            MadridError: si las fechas estan fuera de rango o start es posterior a end
+            MadridError: si falla la carga de algun mes, en ese caso no se agrega ninguno
+        """
+        for year, month in (start, end):
+            if not 1 <= month <= 12:
+                raise MadridError(f'Mes invalido: {month}')
+            if not (2016 <= year <= datetime.date.today().year):
+                raise MadridError(f'Anio fuera de rango: {year}')
+        if tuple(start) > tuple(end):
+            raise MadridError(f'Rango invalido: {start} es posterior a {end}')
+
+        months = []
+        year, month = start
+        while (year, month) <= tuple(end):
+            months.append((year, month))
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+        return self.__ingest(months, workers, processes)
+
+    def sync(self, since: tuple = None, workers: int = 1, processes: int = 0) -> IngestReport:
+        """
+        Actualiza el dataset con lo publicado en el portal desde el mes since: descarga el catalogo una vez,
+        carga los meses nuevos y vuelve a cargar los ya cargados cuyo csv ha cambiado (otra url en el catalogo
+        o un contenido distinto al revalidar la entrada caducada con una peticion condicional).
+        Los meses sin cambios no se vuelven a leer, y los que no estan cargados pero si en cache se leen
+        de disco, de modo que una ejecucion diaria solo descarga el catalogo y los datos nuevos.
+        Las particiones y los resumenes se actualizan solo para los meses nuevos o cambiados
+
+        Args:
+            since (tuple): primer mes a sincronizar como (anio, mes), opcional. Por defecto el primer mes cargado
+            workers (int): numero de meses que se revalidan o descargan en paralelo, por defecto 1
+            processes (int): numero de procesos que parsean y limpian meses en paralelo, por defecto 0
+        Returns:
+            IngestReport: metricas de los meses cargados, vacio si no habia nada que actualizar
+        Raises:
+            MadridError: si since esta fuera de rango o no se indica y no hay meses cargados
+            MadridError: si falla la carga de algun mes, en ese caso no se actualiza ninguno
+        """
+        if since is None:
+            if not self.__loaded:
+                raise MadridError('No hay meses cargados, indica since con el primer mes a sincronizar')
+            since = min((year, month) for month, year in self.__loaded)
+        year, month = since
+        if not 1 <= month <= 12:
+            raise MadridError(f'Mes invalido: {month}')
+        if not (2016 <= year <= datetime.date.today().year):
+            raise MadridError(f'Anio fuera de rango: {year}')
+
+        report = IngestReport()
+        with report.stage('catalog'):
+            urls = self.__catalog.load(refresh=True)
+        months = sorted(key for key in urls if key >= tuple(since))
+        # Los meses cargados se revalidan en los hilos de la carga, en paralelo con la descarga de los nuevos
+        revalidate = {(year, month) for year, month in months if (month, year) in self.__loaded}
+        return self.__ingest(months, workers, processes, revalidate, report)
+
+    def __changed(self, year:int, month:int, url:str)->bool:
+        """
+        Indica si el csv de un mes cargado ha cambiado desde que se cargo. Si su entrada en cache ha caducado
+        o no esta se pide al servidor solo si ha cambiado (ETag / Last-Modified), el resto no hace peticiones
+
+        Args:
+            year (int): anio
+            month (int): mes
+            url (str): url del mes en el catalogo actual
+        Returns:
+            bool: True si la url o el checksum del csv no coinciden con los del mes cargado
+        """
+        source = self.__sources.get((year, month))
+        if source is None or source[0] != url:
+            return True
+        try:
+            if not self.__cacheurl.exists(url):
+                self.__cacheurl.download(url)
+        except CacheError:
+            # La carga lo vuelve a intentar e informa del error junto al resto de meses
+            return True
+        entry = self.__cacheurl.entry(url)
+        return entry is None or entry['checksum'] != source[1]
+
+    def query(self, years=None, months=None, where: list = None, columns: list = None) -> pd.DataFrame:
+        """
+        Consulta un subconjunto de multas sin agregarlo al dataset.
+        Primero descarta los meses que no coinciden con years y months (sin leerlos), luego cada mes se lee
+        de la particion en memoria, de la cache columnar (solo las columnas pedidas) o del csv (con usecols),
+        y las condiciones se aplican al leer cada bloque, de modo que las filas descartadas no se acumulan.
+
+        Args:
+            years (int | list): anio o lista de anios, opcional. Por defecto todos los publicados
+            months (int | list): mes o lista de meses, opcional. Por defecto todos
+            where (list): condiciones que deben cumplir las filas, tuplas (columna, operador, valor) con
+                operador '==', '!=', '<', '<=', '>', '>=', 'in' o 'not in'. La columna FECHA es el indice.
+                Ejemplo: [('CALIFICACION', '==', 'GRAVE'), ('FECHA', '>=', '2024-03-15')]
+            columns (list): columnas del resultado, opcional. Por defecto todas
+        Returns:
+            pd.DataFrame: filas que cumplen las condiciones, con indice FECHA
+        Raises:
+            MadridError: si un operador o una columna no son validos o falla la carga de algun mes
+        """
+        where = [tuple(condition) for condition in (where or [])]
+        for column, op, value in where:
+            if op not in OPERATORS and op not in ('in', 'not in'):
+                raise MadridError(f'Operador invalido: {op}')
+        # Las columnas se comprueban antes de leer ningun mes, FECHA es el indice y solo vale en where
+        for column in [column for column, _, _ in where if column != 'FECHA'] + list(columns or []):
+            if column not in schema.SCHEMA:
+                raise MadridError(f'Columna invalida: {column}')
+        years = [years] if isinstance(years, int) else years
+        months = [months] if isinstance(months, int) else months
+
+        # Poda de particiones: solo los meses publicados que coinciden con years y months
+        selected = [(year, month) for year, month in sorted(self.__catalog.load())
+                    if (years is None or year in years) and (months is None or month in months)]
+
+        # Columnas que hay que leer: las pedidas, las de las condiciones y las del indice
+        needed = None
+        if columns is not None:
+            needed = set(columns) | {column for column, _, _ in where if column != 'FECHA'} | INDEX_COLUMNS
+
+        frames = []
+        for year, month in selected:
+            if (year, month) in self.__partitions:
+                df = self.__partitions[(year, month)]
+                if needed is not None:
+                    df = df[[column for column in df.columns if column in needed]]
+                frames.append(self.__filter(df, where) if where else df)
+            else:
+                frames.append(self.__scan_month(year, month, needed, where))
+
+        if not frames:
+            return pd.DataFrame()
+        result = schema.concat(frames)
+        if columns is not None:
+            result = result[list(columns)]
+        return result
+
+    def __scan_month(self, year:int, month:int, columns:set, where:list)->pd.DataFrame:
+        """
+        Lee un mes para query sin guardarlo en el dataset, desde la cache columnar si esta disponible
+        y si no desde el csv
+
+        Args:
+            year (int): anio
+            month (int): mes
+            columns (set): columnas que se leen, None para todas
+            where (list): condiciones que se aplican al leer el csv
+        Returns:
+            pd.DataFrame: datos del mes con las condiciones aplicadas
+        """
+        url = self.__catalog.url(year, month)
+        if self.__frames is not None and self.__cacheurl.exists(url):
+            name = self.__frame_name(year, month, url, self.__cacheurl)
+            if self.__frames.exists(name):
+                try:
+                    df = self.__frames.load_frame(name, columns=sorted(columns) if columns else None)
+                    return self.__filter(df, where) if where else df
+                except CacheError:
+                    pass
+        return self.__load(url, year, month, self.__cacheurl, columns, where, engine=self.__engine)
+
+    def memory_report(self) -> pd.DataFrame:
+        """
+        Muestra la memoria que ocupa cada columna del dataset con el esquema compacto y la que
+        ocuparia con los tipos anteriores (textos como object y numeros de 64 bits)
+
+        Returns:
+            pd.DataFrame: dtype, bytes_before, bytes_after y ratio por columna, mas una fila TOTAL
+        Raises:
+            MadridError en caso de no existir datos cargados
         """
         if self.__data.empty:
             raise MadridError(f'Datos no encontrados')
+        return schema.memory_report(self.__data)
+
+    def remove(self, year: int, month: int) -> None:
+        """
+        Elimina del dataset los datos de un mes, sin tocar el resto de meses cargados
+
+        Args:
+            year (int): anio
+            month (int): mes
+        Raises:
+            MadridError: si el mes no esta cargado
+        """
+        if (month, year) not in self.__loaded:
+            raise MadridError(f'Mes no cargado: {month}/{year}')
+        del self.__partitions[(year, month)]
+        del self.__aggregates[(year, month)]
+        self.__sources.pop((year, month), None)
+        self.__loaded.discard((month, year))
+        self.__frame = None
 
-        # Crea un dataset temporal extrayendo hora, mes y año del indice
-        temp_multas = self.__data.copy()
-        temp_multas['horas'] = temp_multas.index.hour
-        temp_multas['mes'] = temp_multas.index.month
-        temp_multas['anio'] = temp_multas.index.year
-        temp_multas['anio_mes'] = temp_multas['anio'].astype(str) + '-' + temp_multas['mes'].astype(str).str.zfill(2)
+    def fines_hour(self, fig_name: str) -> 'matplotlib.figure.Figure':
+        """
+        Metodo que genera un grafico a partir de los datos previamente guardados con las multas por hora y fecha.
+        El grafico se dibuja sin pyplot, por lo que no abre ventanas ni necesita un entorno grafico:
+        se guarda en fig_name y se devuelve la figura (un notebook la muestra al ser el resultado de la celda)
 
-        # Agrupa los resultados por hora, año y mes
-        multas_horas = temp_multas.groupby(['horas', 'anio_mes']).size().reset_index(name='Multas')
+        Args:
+            fig_name (str): Nombre del grafico
+        Returns:
+            matplotlib.figure.Figure: figura con una linea por anio-mes
+        Raises:
+             MadridError en caso de no existir datos cargados
+        """
+        # Combina los conteos por hora, año y mes de cada mes cargado
+        hours = pd.concat(self.__merge('hours'))
+        multas_horas = hours.groupby(level=['horas', 'anio_mes']).sum().reset_index(name='Multas')
 
         # Crear tabla pivote, los años-meses pasan a ser columnas y se reagrupa para hacer mas facil el grafico
         data_pivot = multas_horas.pivot(index='horas', columns='anio_mes', values='Multas')
 
-        # Crea el grafico
-        plt.figure(figsize=(10, 6))
-        data_pivot.plot(marker = 'o', linewidth = 2)
-        plt.title('Evolucion de multas por hora')
-        plt.xlabel('Horas')
-        plt.ylabel('Numero de multas')
-        plt.legend(title='Año-Mes', bbox_to_anchor=(1.05, 1), loc='upper left')
-        plt.tight_layout()
-        plt.savefig(fig_name)
-        plt.show()
-        plt.close()
+        # Crea el grafico, matplotlib solo se importa al dibujar
+        from matplotlib.figure import Figure
+        fig = Figure(figsize=(10, 6))
+        ax = fig.add_subplot()
+        for anio_mes in data_pivot.columns:
+            ax.plot(data_pivot.index, data_pivot[anio_mes], marker='o', linewidth=2, label=anio_mes)
+        ax.set_title('Evolucion de multas por hora')
+        ax.set_xlabel('Horas')
+        ax.set_ylabel('Numero de multas')
+        ax.legend(title='Año-Mes', bbox_to_anchor=(1.05, 1), loc='upper left')
+        fig.tight_layout()
+        fig.savefig(fig_name)
+        return fig
 
     def fines_calification(self) -> pd.DataFrame:
         """
@@ -252,18 +1213,17 @@ class MadridFines:
         Raises:
             MadridError en caso de no existir datos cargados
         """
-        if self.__data.empty:
-            raise MadridError(f'Datos no encontrados')
-
-        temp_calif = self.__data.copy()
-        res = temp_calif.groupby(['MES', 'ANIO', 'CALIFICACION']).size().reset_index(name='count')
+        # Combina los conteos de cada mes cargado, sin copiar ni recorrer el dataset
+        partial = schema.concat(self.__merge('calification'))
+        res = partial.groupby(['MES', 'ANIO', 'CALIFICACION'], observed=True)['count'].sum().reset_index()
 
         # Crea la tabla pivot
         res_pivot = res.pivot_table(
             index=['MES', 'ANIO'],
             columns='CALIFICACION',
             values='count',
-            fill_value=0
+            fill_value=0,
+            observed=True
         )
 
         return res_pivot
@@ -277,16 +1237,8 @@ class MadridFines:
         Raises:
             MadridError en caso de no existir datos cargados
         """
-        if self.__data.empty:
-            raise MadridError(f'Datos no encontrados')
-
-        total_payment = self.__data.copy()
-        # La recaudacion minima tb se puede calcular por fuera y agregarlo despues al dataset pero queria probar mas con lambda
-        total = total_payment.groupby(['MES', 'ANIO']).agg(
-            rec_maxima=('IMP_BOL', 'sum'),
-            rec_minima=('IMP_BOL', lambda x: x.sum() * 0.5)
-
-        ).reset_index()
+        # Combina la recaudacion de cada mes cargado
+        total = pd.concat(self.__merge('payment')).groupby(level=['MES', 'ANIO']).sum().reset_index()
 
         return total
 
@@ -0,0 +1,344 @@
+# Ivonne Mendoza
+# ivonne@imendoza.io
+# Indice persistente (manifest) de las entradas de un directorio de cache
+
+from contextlib import contextmanager
+from pathlib import Path
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Nombre del archivo del indice, empieza por punto para que no cuente como entrada
+MANIFEST_NAME = '.manifest.sqlite'
+
+# Version del esquema de tablas, se guarda en PRAGMA user_version
+MANIFEST_VERSION = 5
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS entries (
+        key TEXT PRIMARY KEY,
+        url TEXT,
+        size INTEGER NOT NULL,
+        created REAL NOT NULL,
+        accessed REAL NOT NULL,
+        checksum TEXT,
+        codec TEXT,
+        inode INTEGER,
+        meta TEXT
+    )''',
+    'CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY CHECK (id = 0), entries INTEGER NOT NULL, '
+    'bytes INTEGER NOT NULL)',
+    'INSERT OR IGNORE INTO totals VALUES (0, 0, 0)',
+]
+
+# Columnas anadidas despues de la primera version, se anaden a los indices ya creados al abrirlos
+ADDED_COLUMNS = {'codec': 'TEXT', 'inode': 'INTEGER', 'meta': 'TEXT'}
+
+INDEXES = [
+    'CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)',
+    'CREATE INDEX IF NOT EXISTS entries_checksum ON entries (checksum)',
+    'CREATE INDEX IF NOT EXISTS entries_inode ON entries (inode)',
+]
+
+# Bytes que aporta una fila a los totales: las entradas enlazadas (mismo inodo) ocupan el disco una sola vez
+CONTRIBUTION = ('CASE WHEN {row}.inode IS NOT NULL AND EXISTS (SELECT 1 FROM entries '
+                'WHERE inode = {row}.inode AND key != {row}.key) THEN 0 ELSE {row}.size END')
+
+# Triggers que mantienen la tabla totals, se vuelven a crear al cambiar de version
+TRIGGERS = {
+    'entries_insert': f'''AFTER INSERT ON entries BEGIN
+        UPDATE totals SET entries = entries + 1, bytes = bytes + {CONTRIBUTION.format(row='NEW')} WHERE id = 0;
+    END''',
+    'entries_delete': f'''AFTER DELETE ON entries BEGIN
+        UPDATE totals SET entries = entries - 1, bytes = bytes - {CONTRIBUTION.format(row='OLD')} WHERE id = 0;
+    END''',
+    'entries_size': f'''AFTER UPDATE OF size, inode ON entries BEGIN
+        UPDATE totals SET bytes = bytes - {CONTRIBUTION.format(row='OLD')} + {CONTRIBUTION.format(row='NEW')}
+        WHERE id = 0;
+    END''',
+}
+
+# Recalcula los totales desde las entradas, contando una vez cada inodo
+TOTALS = ('''UPDATE totals SET entries = (SELECT COUNT(*) FROM entries),
+    bytes = (SELECT COALESCE(SUM(size), 0) FROM (SELECT MAX(size) AS size FROM entries GROUP BY COALESCE(inode, key)))
+    WHERE id = 0''')
+
+COLUMNS = ['key', 'url', 'size', 'created', 'accessed', 'checksum', 'codec', 'inode', 'meta']
+
+class Manifest:
+    """
+    Indice SQLite de un directorio de cache: por cada entrada guarda la url original, el tamanio,
+    la fecha de creacion, el ultimo acceso, el checksum del contenido y el codec con el que se escribio.
+    Cada cambio es una transaccion, por lo que varios procesos pueden compartir el mismo indice.
+    El numero de entradas y los bytes totales se mantienen con triggers en la tabla totals,
+    asi consultarlos no recorre todas las entradas. Los bytes de un archivo con varias entradas (enlaces duros
+    al mismo inodo) se cuentan una vez.
+
+    Attributes:
+        path (Path): ruta del archivo sqlite
+
+    Example:
+        >>> manifest = Manifest(Path.home() / '.my_cache' / 'MadridFines')
+        >>> manifest.put('datos', size=10)
+        >>> manifest.totals()
+        (1, 10)
+    """
+    def __init__(self, cache_dir)->None:
+        self.__path = Path(cache_dir) / MANIFEST_NAME
+        self.__connection = None
+        self.__pid = None
+        self.__lock = threading.Lock()
+        self.__created = False
+
+    @property
+    def path(self)->Path:
+        return self.__path
+
+    @property
+    def created(self)->bool:
+        """ True si el indice se acaba de crear y hay que llenarlo recorriendo el directorio """
+        self.__connect()
+        return self.__created
+
+    def __connect(self)->sqlite3.Connection:
+        """
+        Abre la conexion la primera vez que se necesita.
+        Una conexion heredada con fork no se puede usar en el proceso hijo, por eso se abre una por proceso
+
+        Returns:
+            sqlite3.Connection: conexion al indice
+        """
+        if self.__connection is not None and self.__pid == os.getpid():
+            return self.__connection
+        self.__path.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(self.__path, timeout=30, isolation_level=None, check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        version = connection.execute('PRAGMA user_version').fetchone()[0]
+        if version < MANIFEST_VERSION:
+            self.__upgrade(connection)
+        self.__created = version == 0
+        self.__connection = connection
+        self.__pid = os.getpid()
+        return connection
+
+    @staticmethod
+    def __upgrade(connection:sqlite3.Connection)->None:
+        """
+        Crea las tablas o actualiza un indice creado por una version anterior: anade las columnas que faltan
+        (las entradas existentes quedan con NULL en ellas), vuelve a crear los triggers y recalcula los totales.
+        Se hace en una transaccion, si dos procesos lo abren a la vez el segundo encuentra el indice actualizado
+
+        Args:
+            connection (sqlite3.Connection): conexion al indice
+        """
+        connection.execute('BEGIN IMMEDIATE')
+        with connection:
+            if connection.execute('PRAGMA user_version').fetchone()[0] >= MANIFEST_VERSION:
+                return
+            for statement in SCHEMA:
+                connection.execute(statement)
+            existing = {row[1] for row in connection.execute('PRAGMA table_info(entries)')}
+            for column, kind in ADDED_COLUMNS.items():
+                if column not in existing:
+                    connection.execute(f'ALTER TABLE entries ADD COLUMN {column} {kind}')
+            for statement in INDEXES:
+                connection.execute(statement)
+            for name, body in TRIGGERS.items():
+                connection.execute(f'DROP TRIGGER IF EXISTS {name}')
+                connection.execute(f'CREATE TRIGGER {name} {body}')
+            connection.execute(TOTALS)
+            connection.execute(f'PRAGMA user_version = {MANIFEST_VERSION}')
+
+    @contextmanager
+    def __transaction(self):
+        """ Abre una transaccion de escritura, se confirma al salir o se deshace si hay un error """
+        with self.__lock:
+            connection = self.__connect()
+            connection.execute('BEGIN IMMEDIATE')
+            with connection:
+                yield connection
+
+    def __execute(self, sql:str, parameters=())->list:
+        """ Ejecuta una sentencia en su propia transaccion y devuelve las filas """
+        with self.__transaction() as connection:
+            return connection.execute(sql, parameters).fetchall()
+
+    def __query(self, sql:str, parameters=())->list:
+        """ Ejecuta una consulta de solo lectura """
+        with self.__lock:
+            return self.__connect().execute(sql, parameters).fetchall()
+
+    def put(self, key:str, size:int, checksum:str=None, url:str=None, created:float=None,
+            accessed:float=None, codec:str=None, inode:int=None, meta:dict=None)->None:
+        """
+        Registra una entrada nueva o reescrita. La url se conserva si no se indica una nueva
+
+        Args:
+            key (str): nombre del archivo en cache
+            size (int): tamanio en disco en bytes
+            checksum (str): checksum del contenido, opcional
+            url (str): url original de la entrada, opcional
+            created (float): fecha de creacion (time.time()), por defecto ahora
+            accessed (float): ultimo acceso, por defecto igual a created
+            codec (str): nombre del codec con el que esta comprimido el archivo, opcional
+            inode (int): inodo del archivo, las entradas enlazadas con el mismo inodo se cuentan una vez
+            meta (dict): metadatos del contenido (por ejemplo los validadores HTTP), se borran con la entrada
+        """
+        created = time.time() if created is None else created
+        accessed = created if accessed is None else accessed
+        self.__execute(
+            'INSERT INTO entries (key, url, size, created, accessed, checksum, codec, inode, meta) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET url = COALESCE(excluded.url, url), size = excluded.size, '
+            'created = excluded.created, accessed = excluded.accessed, checksum = excluded.checksum, '
+            'codec = excluded.codec, inode = excluded.inode, meta = excluded.meta',
+            (key, url, size, created, accessed, checksum, codec, inode,
+             json.dumps(meta) if meta is not None else None))
+
+    def renew(self, key:str, created:float=None)->None:
+        """
+        Cambia la fecha de creacion de una entrada, sin tocar el archivo
+
+        Args:
+            key (str): nombre del archivo en cache
+            created (float): nueva fecha (time.time()), por defecto ahora
+        """
+        created = time.time() if created is None else created
+        self.__execute('UPDATE entries SET created = ? WHERE key = ?', (created, key))
+
+    def link(self, key:str, inode:int)->None:
+        """
+        Registra que una entrada pasa a ser un enlace duro a otro archivo
+
+        Args:
+            key (str): nombre del archivo en cache
+            inode (int): inodo compartido
+        """
+        self.__execute('UPDATE entries SET inode = ? WHERE key = ?', (inode, key))
+
+    def touch(self, accessed:dict)->None:
+        """
+        Actualiza el ultimo acceso de varias entradas en una sola transaccion
+
+        Args:
+            accessed (dict): nombre -> instante del ultimo acceso
+        """
+        if not accessed:
+            return
+        with self.__transaction() as connection:
+            connection.executemany('UPDATE entries SET accessed = MAX(accessed, ?) WHERE key = ?',
+                                   [(when, key) for key, when in accessed.items()])
+
+    def remove(self, key:str)->None:
+        """ Elimina una entrada del indice """
+        self.__execute('DELETE FROM entries WHERE key = ?', (key,))
+
+    def clear(self)->None:
+        """ Elimina todas las entradas del indice """
+        self.__execute('DELETE FROM entries')
+
+    def get(self, key:str)->dict:
+        """
+        Devuelve los datos de una entrada
+
+        Args:
+            key (str): nombre del archivo en cache
+        Returns:
+            dict: key, url, size, created, accessed, checksum, codec, inode y meta, o None si no esta en el indice
+        """
+        rows = self.__query(f'SELECT {", ".join(COLUMNS)} FROM entries WHERE key = ?', (key,))
+        return self.__entry(rows[0]) if rows else None
+
+    @staticmethod
+    def __entry(row:tuple)->dict:
+        """ Convierte una fila de entries en dict, meta se guarda como JSON """
+        entry = dict(zip(COLUMNS, row))
+        entry['meta'] = json.loads(entry['meta']) if entry['meta'] is not None else None
+        return entry
+
+    def find(self, checksum:str)->list:
+        """
+        Busca las entradas con un mismo contenido
+
+        Args:
+            checksum (str): checksum del contenido
+        Returns:
+            list: nombres de las entradas con ese checksum
+        """
+        return [key for key, in self.__query('SELECT key FROM entries WHERE checksum = ? ORDER BY key', (checksum,))]
+
+    def linked(self, inode:int)->list:
+        """
+        Busca las entradas que comparten un archivo en disco
+
+        Args:
+            inode (int): inodo del archivo
+        Returns:
+            list: tuplas (key, created) de las entradas con ese inodo
+        """
+        return self.__query('SELECT key, created FROM entries WHERE inode = ? ORDER BY key', (inode,))
+
+    def entries(self)->list:
+        """
+        Devuelve todas las entradas, de la usada hace mas tiempo a la mas reciente
+
+        Returns:
+            list: un dict por entrada con key, url, size, created, accessed, checksum, codec, inode y meta
+        """
+        rows = self.__query(f'SELECT {", ".join(COLUMNS)} FROM entries ORDER BY accessed, key')
+        return [self.__entry(row) for row in rows]
+
+    def oldest(self, limit:int)->list:
+        """
+        Devuelve las entradas usadas hace mas tiempo, con el indice sobre accessed solo se leen esas filas
+
+        Args:
+            limit (int): numero maximo de entradas
+        Returns:
+            list: tuplas (key, size)
+        """
+        return self.__query('SELECT key, size FROM entries ORDER BY accessed, key LIMIT ?', (limit,))
+
+    def totals(self)->tuple:
+        """
+        Numero de entradas y bytes totales
+
+        Returns:
+            tuple: (entradas, bytes)
+        """
+        return tuple(self.__query('SELECT entries, bytes FROM totals WHERE id = 0')[0])
+
+    def sync(self, files:list)->None:
+        """
+        Sustituye el contenido del indice por los archivos que hay en el directorio, conservando la url,
+        el checksum, el codec y las fechas de las entradas que ya estaban si su tamanio no ha cambiado.
+        El inodo de todas se actualiza, asi los archivos enlazados a mano tambien se cuentan una vez
+        Se usa al crear el indice en un directorio con datos y en prune, para recoger cambios hechos a mano
+
+        Args:
+            files (list): tuplas (nombre, tamanio, mtime, atime, inodo) de los archivos del directorio
+        """
+        with self.__transaction() as connection:
+            known = {key: (size, inode) for key, size, inode in connection.execute('SELECT key, size, inode FROM entries')}
+            names = {name for name, *_ in files}
+            connection.executemany('DELETE FROM entries WHERE key = ?',
+                                   [(key,) for key in known if key not in names])
+            for name, size, mtime, atime, inode in files:
+                if name not in known:
+                    connection.execute('INSERT INTO entries (key, size, created, accessed, inode) VALUES (?, ?, ?, ?, ?)',
+                                       (name, size, mtime, max(mtime, atime), inode))
+                elif known[name][0] != size:
+                    connection.execute('UPDATE entries SET size = ?, created = ?, checksum = NULL, codec = NULL, '
+                                       'inode = ?, meta = NULL WHERE key = ?', (size, mtime, inode, name))
+                elif known[name][1] != inode:
+                    connection.execute('UPDATE entries SET inode = ? WHERE key = ?', (inode, name))
+
+    def close(self)->None:
+        """ Cierra la conexion, se vuelve a abrir si se usa de nuevo """
+        with self.__lock:
+            if self.__connection is not None and self.__pid == os.getpid():
+                self.__connection.close()
+            self.__connection = None
@@ -0,0 +1,198 @@
+# Ivonne Mendoza
+# ivonne@imendoza.io
+# Metricas de tiempo, bytes y filas de cada etapa de la carga de meses
+
+from contextlib import contextmanager
+import threading
+import time
+import tracemalloc
+
+# Etapas que se miden al cargar un mes, en el orden en que ocurren
+STAGES = ['download', 'frame_read', 'parse', 'clean', 'concat', 'frame_write', 'aggregate']
+
+# Contadores de cada mes
+COUNTERS = ['bytes_downloaded', 'bytes_read', 'rows', 'frame_bytes',
+            'csv_hits', 'csv_misses', 'frame_hits', 'frame_misses']
+
+
+class MonthMetrics:
+    """
+    Metricas de la carga de un mes: segundos de cada etapa, contadores y pico de memoria.
+    Cada mes se carga en un solo hilo, por eso no necesita bloqueos.
+
+    Attributes:
+        year (int): anio
+        month (int): mes
+        stages (dict): etapa -> segundos, ver STAGES
+        counters (dict): contador -> valor, ver COUNTERS
+        peak_bytes (int): pico de memoria reservada durante la carga (tracemalloc), None si no se mide
+    """
+    def __init__(self, year:int, month:int)->None:
+        self.year = year
+        self.month = month
+        self.stages = {}
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.peak_bytes = None
+
+    @contextmanager
+    def stage(self, name:str):
+        """
+        Mide el tiempo de un bloque de codigo y lo suma a la etapa
+
+        Args:
+            name (str): nombre de la etapa
+
+        Example:
+            >>> with metrics.stage('download'):
+            ...     cacheurl.download(url)
+        """
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def count(self, name:str, value:int=1)->None:
+        """ Suma value al contador name """
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    @property
+    def seconds(self)->float:
+        """ Suma de los segundos de todas las etapas """
+        return sum(self.stages.values())
+
+    def as_dict(self)->dict:
+        """
+        Returns:
+            dict: year, month, <etapa>_seconds de cada etapa de STAGES, contadores y peak_bytes
+        """
+        row = {'year': self.year, 'month': self.month}
+        row.update((f'{stage}_seconds', self.stages.get(stage, 0.0)) for stage in STAGES)
+        row.update(self.counters)
+        row['peak_bytes'] = self.peak_bytes
+        return row
+
+    def emit(self, sink)->None:
+        """
+        Envia las metricas del mes a un sink
+
+        Args:
+            sink (callable): funcion sink(name, value, tags), por ejemplo
+                sink('stage.download.seconds', 0.8, {'year': 2024, 'month': 4})
+        """
+        tags = {'year': self.year, 'month': self.month}
+        for stage, seconds in self.stages.items():
+            sink(f'stage.{stage}.seconds', seconds, tags)
+        for name, value in self.counters.items():
+            sink(name, value, tags)
+        if self.peak_bytes is not None:
+            sink('peak_bytes', self.peak_bytes, tags)
+
+
+class IngestReport:
+    """
+    Resumen de una llamada a add o add_range: metricas de cada mes cargado, tiempo del catalogo
+    y tiempo total.
+
+    Attributes:
+        months (list): MonthMetrics de cada mes, en orden cronologico
+        stages (dict): etapas que no son de un mes ('catalog', 'total') -> segundos
+        errors (dict): (anio, mes) -> mensaje de error de los meses que han fallado
+    """
+    def __init__(self)->None:
+        self.months = []
+        self.stages = {}
+        self.errors = {}
+        self.__lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name:str):
+        """ Mide el tiempo de un bloque de codigo que no pertenece a un mes """
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def add(self, metrics:MonthMetrics)->None:
+        """ Agrega las metricas de un mes, se llama desde los hilos de carga """
+        with self.__lock:
+            self.months.append(metrics)
+            self.months.sort(key=lambda item: (item.year, item.month))
+
+    @property
+    def seconds(self)->float:
+        return self.stages.get('total', 0.0)
+
+    def totals(self)->dict:
+        """
+        Suma de las etapas y contadores de todos los meses
+
+        Returns:
+            dict: <etapa>_seconds y contadores sumados, peak_bytes es el maximo de los meses
+        """
+        totals = {}
+        for metrics in self.months:
+            for key, value in metrics.as_dict().items():
+                if key in ('year', 'month') or value is None:
+                    continue
+                if key == 'peak_bytes':
+                    totals[key] = max(totals.get(key, 0), value)
+                else:
+                    totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def to_frame(self):
+        """
+        Returns:
+            pd.DataFrame: una fila por mes con las columnas de MonthMetrics.as_dict
+        """
+        import pandas as pd
+        columns = ['year', 'month'] + [f'{stage}_seconds' for stage in STAGES] + COUNTERS + ['peak_bytes']
+        return pd.DataFrame([metrics.as_dict() for metrics in self.months], columns=columns)
+
+    def __repr__(self)->str:
+        totals = self.totals()
+        return (f'IngestReport(months={len(self.months)}, seconds={self.seconds:.3f}, '
+                f'rows={totals.get("rows", 0)}, bytes_downloaded={totals.get("bytes_downloaded", 0)}, '
+                f'errors={len(self.errors)})')
+
+
+@contextmanager
+def tracing(enabled:bool):
+    """
+    Activa tracemalloc durante el bloque si se pide y no estaba activo, para que track_memory pueda medir
+
+    Args:
+        enabled (bool): si es False no se activa
+    """
+    started = enabled and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    try:
+        yield
+    finally:
+        if started:
+            tracemalloc.stop()
+
+
+@contextmanager
+def track_memory(metrics:MonthMetrics):
+    """
+    Mide el pico de memoria reservada dentro del bloque y lo guarda en metrics.peak_bytes.
+    Solo mide si tracemalloc esta activo (ver tracing). tracemalloc es global al proceso:
+    con varios hilos el pico incluye los meses que se cargan a la vez
+
+    Args:
+        metrics (MonthMetrics): metricas del mes
+    """
+    if not tracemalloc.is_tracing():
+        yield metrics
+        return
+    current = tracemalloc.get_traced_memory()[0]
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+    try:
+        yield metrics
+    finally:
+        metrics.peak_bytes = max(tracemalloc.get_traced_memory()[1] - current, 0)
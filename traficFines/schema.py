@@ -0,0 +1,123 @@
+# Ivonne Mendoza
+# ivonne@imendoza.io
+# Esquema de tipos compacto para el dataset de multas
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# Version del esquema, se debe incrementar cada vez que cambie SCHEMA
+SCHEMA_VERSION = 1
+
+# Tipo de cada columna despues de la limpieza:
+# - category para los textos con pocos valores distintos (se guardan una vez y cada fila es un codigo)
+# - el entero mas pequenio que admite el rango de cada columna
+# - enteros que admiten nulos (Int16) para las velocidades, que vienen vacias en la mayoria de filas
+SCHEMA = {
+    'CALIFICACION': 'category',
+    'LUGAR': 'category',
+    'DESCUENTO': 'category',
+    'DENUNCIANTE': 'category',
+    'HECHO_BOL': 'category',
+    'MES': 'uint8',
+    'ANIO': 'uint16',
+    'HORA': 'float32',
+    'IMP_BOL': 'float32',
+    'PUNTOS': 'uint8',
+    'VEL_LIMITE': 'Int16',
+    'VEL_CIRCULA': 'Int16',
+    'COORDENADA_X': 'float64',
+    'COORDENADA_Y': 'float64',
+}
+
+# Tipos que tenian las columnas antes de aplicar el esquema, se usan en memory_report
+LEGACY_DTYPES = {
+    'category': 'object',
+    'uint8': 'int64',
+    'uint16': 'int64',
+    'float32': 'float64',
+    'Int16': 'float64',
+}
+
+
+def to_category(values:pd.Series)->pd.Series:
+    """
+    Convierte una columna de texto a category eliminando los espacios de relleno.
+    Los espacios se eliminan sobre las categorias (valores distintos) y no sobre cada fila
+
+    Args:
+        values (pd.Series): columna de texto
+    Returns:
+        pd.Series: columna category con las categorias ordenadas alfabeticamente
+    """
+    values = values.astype('category')
+    if not pd.api.types.is_string_dtype(values.cat.categories):
+        return values
+    stripped = values.cat.categories.str.strip()
+    if stripped.is_unique:
+        values = values.cat.rename_categories(stripped)
+    else:
+        # Dos valores que solo se diferencian en espacios, se limpia fila a fila
+        values = values.astype(object).str.strip().astype('category')
+    return values.cat.reorder_categories(values.cat.categories.sort_values())
+
+
+def apply_schema(df:pd.DataFrame)->None:
+    """
+    Aplica SCHEMA a las columnas numericas del DataFrame (las de texto se convierten en to_category).
+    Si una columna entera tiene nulos se usa la version que admite nulos (uint8 -> UInt8)
+
+    Args:
+        df (pd.DataFrame): DataFrame ya limpio, se modifica en el sitio
+    """
+    for column, dtype in SCHEMA.items():
+        if column not in df.columns or dtype == 'category' or df[column].dtype == dtype:
+            continue
+        if dtype[0] in 'ui' and df[column].isna().any():
+            dtype = dtype.capitalize() if dtype[0] == 'i' else 'U' + dtype[1:].capitalize()
+        df[column] = df[column].astype(dtype)
+
+
+def concat(frames:list)->pd.DataFrame:
+    """
+    Concatena DataFrames con el esquema aplicado. pd.concat convierte a object las columnas category
+    cuyas categorias no coinciden, por eso antes se unifican las categorias de todos los DataFrames
+
+    Args:
+        frames (list): lista de DataFrames
+    Returns:
+        pd.DataFrame: DataFrame con todas las filas
+    """
+    if len(frames) == 1:
+        return frames[0]
+    columns = [column for column, dtype in frames[0].dtypes.items() if isinstance(dtype, pd.CategoricalDtype)]
+    frames = [frame.copy(deep=False) for frame in frames]
+    for column in columns:
+        if not all(column in frame.columns and isinstance(frame[column].dtype, pd.CategoricalDtype)
+                   for frame in frames):
+            continue
+        categories = union_categoricals([frame[column] for frame in frames], sort_categories=True).categories
+        for frame in frames:
+            frame[column] = frame[column].cat.set_categories(categories)
+    return pd.concat(frames, ignore_index=False)
+
+
+def memory_report(df:pd.DataFrame)->pd.DataFrame:
+    """
+    Compara la memoria de cada columna con el esquema y con los tipos que se usaban antes
+
+    Args:
+        df (pd.DataFrame): DataFrame con el esquema aplicado
+    Returns:
+        pd.DataFrame: por columna el dtype actual, bytes_before, bytes_after y ratio, mas una fila TOTAL
+    """
+    rows = []
+    for column in df.columns:
+        dtype = str(df[column].dtype)
+        after = int(df[column].memory_usage(index=False, deep=True))
+        legacy = LEGACY_DTYPES.get(dtype)
+        before = int(df[column].astype(legacy).memory_usage(index=False, deep=True)) if legacy else after
+        rows.append({'column': column, 'dtype': dtype, 'bytes_before': before, 'bytes_after': after})
+    report = pd.DataFrame(rows, columns=['column', 'dtype', 'bytes_before', 'bytes_after']).set_index('column')
+    report.loc['TOTAL'] = ['', report['bytes_before'].sum(), report['bytes_after'].sum()]
+    report['ratio'] = report['bytes_before'] / report['bytes_after'].where(report['bytes_after'] > 0)
+    return report